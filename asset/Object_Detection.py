@@ -23,7 +23,6 @@ import argparse
 import cv2
 import numpy as np
 import sys
-import time
 from threading import Thread
 import importlib.util
 import threading
@@ -31,7 +30,11 @@ import threading
 
 
 #added by Seungmin
-import base64
+# payload_codec lives with the ORP code in edge/modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'edge'))
+from modules import payload_codec
+from modules.capture_spool import CaptureSpool
+from modules.capture_ipc import CaptureSender
 #Adding the upper directory so that orp_test.py can communicate with this this file.
 #sys.path.append('..')
 #import test2
@@ -87,9 +90,12 @@ def createfile():
     file_name = 'encoded_string.txt'
     completeName = os.path.join(save_path, file_name)
 
-    with open(completeName,'wb') as f:
+    # write then rename, so orp_transmission never reads half a capture:
+    # the rename replaces the old file in one step and wakes its watcher
+    tmpName = completeName + '.tmp'
+    with open(tmpName,'wb') as f:
         f.write(jpg_as_text)
-        time.sleep(0)
+    os.replace(tmpName, completeName)
     
 # Define and parse input arguments
 parser = argparse.ArgumentParser()
@@ -112,6 +118,24 @@ parser.add_argument('--resolution', help='Desired webcam resolution in WxH. If t
 parser.add_argument('--edgetpu', help='Use Coral Edge TPU Accelerator to speed up detection',
                     action='store_true')
 
+# b64 is sent untagged as before; the others are tagged (see edge/modules/payload_codec.py), and the
+# cloud function decodes all of them (cloud/makeUppercase/payload_codec.js)
+parser.add_argument('--codec', help='Text encoding of the captured JPEG: ' + ', '.join(payload_codec.CODECS),
+                    choices=payload_codec.CODECS, default=payload_codec.DEFAULT_CODEC)
+
+# queue captures for orp_transmission's spool_dir instead of overwriting encoded_string.txt
+parser.add_argument('--spool', help='Spool directory shared with orp_transmission (spool_dir); every capture is '
+                    'queued there, and --ipc is not used',
+                    default=None)
+
+# hand captures to orp_transmission over its ipc_path socket; when it is not
+# listening they go to encoded_string.txt as before. Not with --spool, whose
+# queue survives restarts and keeps the best captures
+IPC_PATH = '/tmp/vps_capture.sock'
+parser.add_argument('--ipc', help='Unix socket orp_transmission receives captures on (ipc_path), "" to disable; '
+                    'default ' + IPC_PATH + ' without --spool, off with it',
+                    default=None)
+
 args = parser.parse_args()
 
 #MODEL_NAME = args.modeldir
@@ -122,6 +146,14 @@ min_conf_threshold = float(args.threshold)
 resW, resH = args.resolution.split('x')
 imW, imH = int(resW), int(resH)
 use_TPU = args.edgetpu
+codec = args.codec
+spool = CaptureSpool(args.spool) if args.spool else None
+ipc = None
+if spool is None:
+    ipc_path = IPC_PATH if args.ipc is None else args.ipc
+    ipc = CaptureSender(ipc_path) if ipc_path else None
+elif args.ipc:
+    print('--ipc ignored: captures go to the spool ' + args.spool)
 
 # Import TensorFlow libraries
 # If tflite_runtime is installed, import interpreter from tflite_runtime, else import from regular tensorflow
@@ -259,15 +291,20 @@ while True:
                 #Convert Captured image to JPG(binary file) and save to buffer. Return value(retval) is set true if image is captured.
                 retval, buffer =cv2.imencode('.jpg',image)
 
-                #Convert to base64 encoding and show first 80 string info
+                #Convert to text (base64 by default, see --codec) and show first 80 string info
                 print("Human is Detected")
-                jpg_as_text = base64.b64encode(buffer)
+                jpg_as_text = payload_codec.encode(buffer.tobytes(), codec)
                 print(jpg_as_text[:80])
                
-                #writing a txt.file
+                #queueing the capture by its confidence, or else handing it to
+                #orp_transmission over its socket or writing a txt.file
                 #thread1=threading.Thread(target=createfile())
                 #thread1.start()
-                createfile()
+                if spool is not None:
+                    spool.put(jpg_as_text, priority=int(scores[i]*100))
+                elif ipc is None or not ipc.send(jpg_as_text, score=float(scores[i]), label=object_name,
+                                                 box=[ymin, xmin, ymax, xmax], codec=codec):
+                    createfile()
                 #once human is detected, it call the orp_test.py
                # import orp_test
 
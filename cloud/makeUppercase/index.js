@@ -14,6 +14,9 @@ admin.initializeApp();
 
 const {Storage} = require('@google-cloud/storage');
 
+// Captures may come tagged with the codec the detector used (--codec)
+const payloadCodec = require("./payload_codec");
+
 // The ID of your GCS bucket
  const bucketName = 'muop2021';
 
@@ -81,7 +84,7 @@ async function uploadLocalFileToStorage(base64data) {
   
    var stream = require('stream');
    var bufferStream = new stream.PassThrough();
-   bufferStream.end(Buffer.from(base64data, 'base64'));
+   bufferStream.end(payloadCodec.decode(base64data));
 
 
     var gcs = new Storage({
@@ -0,0 +1,108 @@
+// Decodes the capture text the detector sends, as edge/modules/payload_codec.py
+// encodes it: untagged base64 as before, or a tag naming the codec followed
+// by the data ('b85:', 'a85:', and 'zb64:', 'zb85:', 'za85:' after zlib).
+const zlib = require("zlib");
+
+// RFC 1924, as Python's base64.b85encode
+const B85_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ" +
+    "abcdefghijklmnopqrstuvwxyz!#$%&()*+-;<=>?@^_`{|}~";
+
+// untagged base64 has no ':', a tag is one of these
+const TAG = /^(zb64|zb85|za85|b85|a85):/;
+
+/**
+ * A base85 digit of the RFC 1924 alphabet.
+ * @param {string} ch
+ * @return {number} its value, -1 if ch is not one
+ */
+function b85Digit(ch) {
+  return B85_ALPHABET.indexOf(ch);
+}
+
+/**
+ * An Ascii85 digit, '!' to 'u'.
+ * @param {string} ch
+ * @return {number} its value, -1 if ch is not one
+ */
+function a85Digit(ch) {
+  const d = ch.charCodeAt(0) - 33;
+  return d <= 84 ? d : -1;
+}
+
+/**
+ * Groups of 5 digits are 4 bytes, most significant first; a last group of
+ * n digits is padded with the highest digit and gives n - 1 bytes.
+ * Ascii85 also has 'z' for 4 zero bytes and may be broken by whitespace.
+ * @param {string} text
+ * @param {function(string): number} digit
+ * @param {boolean} ascii85
+ * @return {Buffer}
+ */
+function decodeBase85(text, digit, ascii85) {
+  const out = [];
+  let group = [];
+  const flush = (count) => {
+    let value = 0;
+    for (const d of group) {
+      value = value * 85 + d;
+    }
+    for (let i = 0; i < count; i++) {
+      out.push(Math.floor(value / Math.pow(256, 3 - i)) % 256);
+    }
+    group = [];
+  };
+  for (const ch of text) {
+    if (ascii85 && /\s/.test(ch)) {
+      continue;
+    }
+    if (ascii85 && ch === "z" && group.length === 0) {
+      out.push(0, 0, 0, 0);
+      continue;
+    }
+    const d = digit(ch);
+    if (d < 0) {
+      throw new Error("bad base85 character " + JSON.stringify(ch));
+    }
+    group.push(d);
+    if (group.length === 5) {
+      flush(4);
+    }
+  }
+  if (group.length === 1) {
+    throw new Error("truncated base85 data");
+  }
+  if (group.length) {
+    const count = group.length - 1;
+    while (group.length < 5) {
+      group.push(84);
+    }
+    flush(count);
+  }
+  return Buffer.from(out);
+}
+
+/**
+ * The bytes of a capture, by the codec its tag names.
+ * @param {string} text
+ * @return {Buffer}
+ */
+function decode(text) {
+  const match = TAG.exec(text.slice(0, 6));
+  if (!match) {
+    return Buffer.from(text, "base64");
+  }
+  const compressed = match[1][0] === "z";
+  const name = compressed ? match[1].slice(1) : match[1];
+  const body = text.slice(match[0].length);
+  let data;
+  if (name === "b85") {
+    data = decodeBase85(body, b85Digit, false);
+  } else if (name === "a85") {
+    data = decodeBase85(body, a85Digit, true);
+  } else {
+    data = Buffer.from(body, "base64");
+  }
+  return compressed ? zlib.inflateSync(data) : data;
+}
+
+module.exports = {decode};
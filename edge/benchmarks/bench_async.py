@@ -0,0 +1,98 @@
+#============================================================================
+#
+# Filename:  bench_async.py
+#
+# Purpose:   Many concurrent senders over one link: a thread per sender on
+#            the threaded HDLC against a task per sender on AsyncHDLC. Both
+#            ends run over a pty loopback; reports wall time, CPU time and
+#            how many threads the process needed.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_async [senders] [frames_each]
+#
+#----------------------------------------------------------------------------
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.simple_hdlc import HDLC
+from modules.hdlc_asyncio import AsyncHDLC
+from benchmarks.ptylink import PtyLoopback
+
+FRAME_SIZE = 512
+
+
+def threaded(senders, frames):
+    loop = PtyLoopback(baudrate=115200)
+    tx, rx = HDLC(loop.port_a), HDLC(loop.port_b)
+    done = threading.Event()
+    got = [0]
+
+    def onFrame(data):
+        got[0] += 1
+        if got[0] == senders * frames:
+            done.set()
+
+    rx.startReader(onFrame=onFrame)
+    payload = os.urandom(FRAME_SIZE)
+    workers = [threading.Thread(target=lambda: [tx.sendFrame(payload) for _ in range(frames)])
+               for _ in range(senders)]
+    for w in workers:
+        w.start()
+    peak = threading.active_count()
+    for w in workers:
+        w.join()
+    done.wait(30)
+    rx.stopReader()
+    loop.close()
+    return got[0], peak
+
+
+def coroutines(senders, frames):
+    loop = PtyLoopback(baudrate=115200)
+
+    async def run():
+        tx, rx = AsyncHDLC(loop.port_a), AsyncHDLC(loop.port_b)
+        tx.start()
+        rx.start()
+        payload = os.urandom(FRAME_SIZE)
+
+        async def sender():
+            for _ in range(frames):
+                await tx.send_frame(payload)
+
+        tasks = [asyncio.ensure_future(sender()) for _ in range(senders)]
+        got = 0
+        async for _ in rx:
+            got += 1
+            if got == senders * frames:
+                break
+        await asyncio.gather(*tasks)
+        peak = threading.active_count()
+        tx.stop()
+        rx.stop()
+        return got, peak
+
+    res = asyncio.run(run())
+    loop.close()
+    return res
+
+
+def main(senders, frames):
+    print('%d senders x %d frames of %d bytes' % (senders, frames, FRAME_SIZE))
+    print('%-12s %10s %10s %10s %9s' % ('mode', 'received', 'wall', 'cpu', 'threads'))
+    for name, run in (('threads', threaded), ('asyncio', coroutines)):
+        wall, cpu = time.time(), time.process_time()
+        got, threads = run(senders, frames)
+        wall, cpu = time.time() - wall, time.process_time() - cpu
+        # one of the threads is PtyLoopback's relay
+        print('%-12s %10d %8.2f s %8.2f s %9d' % (name, got, wall, cpu, threads - 1))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 32, int(args[1]) if len(args) > 1 else 50)
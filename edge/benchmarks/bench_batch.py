@@ -0,0 +1,90 @@
+#============================================================================
+#
+# Filename:  bench_batch.py
+#
+# Purpose:   Write syscalls and wire bytes per frame for a burst of small
+#            sensor pushes, sent one sendFrame() at a time and in batches
+#            through sendFrames(). os.write is counted underneath pyserial,
+#            so partial writes show up too. Frames go over a pty loopback
+#            and are checked on the other end.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_batch [frames] [payload_bytes]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.simple_hdlc import HDLC
+from benchmarks.ptylink import PtyLoopback
+
+BATCH_SIZES = [1, 4, 16, 64]
+
+
+class CountingWrites(object):
+    # Count os.write calls made from the sending thread
+    def __init__(self):
+        self.calls = 0
+        self.thread = threading.current_thread()
+        self.real = os.write
+
+    def __call__(self, fd, data):
+        if threading.current_thread() is self.thread:
+            self.calls += 1
+        return self.real(fd, data)
+
+    def __enter__(self):
+        os.write = self
+        return self
+
+    def __exit__(self, *exc):
+        os.write = self.real
+
+
+def run(batch, payloads):
+    loop = PtyLoopback()
+    tx, rx = HDLC(loop.port_a), HDLC(loop.port_b)
+    received = []
+    done = threading.Event()
+
+    def onFrame(data):
+        received.append(bytes(data))
+        if len(received) == len(payloads):
+            done.set()
+
+    rx.startReader(onFrame=onFrame)
+    with CountingWrites() as writes:
+        start = time.time()
+        if batch == 0:
+            for p in payloads:
+                tx.sendFrame(p)
+        else:
+            for i in range(0, len(payloads), batch):
+                tx.sendFrames(payloads[i:i + batch])
+        elapsed = time.time() - start
+    done.wait(10)
+    rx.stopReader()
+    loop.close()
+    return writes.calls, tx.stats.wire_bytes_sent, elapsed, received == payloads
+
+
+def main(frames, size):
+    logging.disable(logging.WARNING)
+    payloads = [os.urandom(size) for _ in range(frames)]
+    print('%d frames of %d bytes' % (frames, size))
+    print('%-16s %12s %12s %12s %9s' % ('mode', 'writes/frame', 'wire/frame', 'us/frame', 'intact'))
+    for batch in [0] + BATCH_SIZES:
+        writes, wire, elapsed, ok = run(batch, payloads)
+        name = 'sendFrame' if batch == 0 else 'sendFrames(%d)' % batch
+        print('%-16s %12.3f %10.1f B %12.1f %9s' % (
+            name, writes / float(frames), wire / float(frames), elapsed / frames * 1e6, ok))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 1024, int(args[1]) if len(args) > 1 else 24)
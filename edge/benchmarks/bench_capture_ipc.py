@@ -0,0 +1,119 @@
+#============================================================================
+#
+# Filename:  bench_capture_ipc.py
+#
+# Purpose:   Cost of handing a capture from the detector to the sender:
+#            encoded_string.txt (write, rename, FileWatcher wakes, read)
+#            against capture_ipc's Unix socket. Latency is from the detector
+#            starting the handoff to the sender holding the bytes; CPU is
+#            both sides together per capture; disk is what the handoff
+#            writes to the file system. Captures are handed over one at a
+#            time, with a pause between so each starts idle.
+#
+#            Run from the edge/ directory, with the capture directory on
+#            the SD card to include its write cost:
+#                python3 -m benchmarks.bench_capture_ipc [captures] [directory]
+#
+#----------------------------------------------------------------------------
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.file_watcher import FileWatcher
+from modules.capture_ipc import CaptureReceiver, CaptureSender
+
+SIZES = [9400, 72 * 1024, 512 * 1024]
+PAUSE = 0.05
+
+
+def cpu_time():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def write_file(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def run_file(directory, data, captures):
+    path = os.path.join(directory, 'encoded_string.txt')
+    watcher = FileWatcher(path)
+    got = []
+    ready = threading.Semaphore(0)
+
+    def sender():
+        for i in range(captures):
+            watcher.wait()
+            with open(path, 'rb') as f:
+                f.read()
+            got.append(time.time())
+            ready.release()
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    latencies = []
+    cpu = 0.0
+    for i in range(captures):
+        time.sleep(PAUSE)
+        start, cpu_start = time.time(), cpu_time()
+        write_file(path, data)
+        ready.acquire()
+        cpu += cpu_time() - cpu_start
+        latencies.append(got[i] - start)
+    thread.join()
+    watcher.close()
+    return latencies, cpu / captures, len(data)
+
+
+def run_socket(directory, data, captures):
+    path = os.path.join(directory, 'capture.sock')
+    receiver = CaptureReceiver(path, max_queue=captures)
+    receiver.start()
+    sender = CaptureSender(path)
+    latencies = []
+    cpu = 0.0
+    for i in range(captures):
+        time.sleep(PAUSE)
+        start, cpu_start = time.time(), cpu_time()
+        assert sender.send(data, score=0.9, box=[1, 2, 3, 4], label='person')
+        capture = receiver.get(5)
+        cpu += cpu_time() - cpu_start
+        latencies.append(time.time() - start)
+        assert capture is not None and len(capture.data) == len(data)
+    sender.close()
+    receiver.stop()
+    return latencies, cpu / captures, 0
+
+
+def main(captures, directory):
+    base = tempfile.mkdtemp(dir=directory)
+    print('%d captures each, in %s' % (captures, base))
+    print('%9s %-8s %9s %9s %11s %10s' % ('bytes', 'handoff', 'p50', 'p99', 'CPU', 'disk'))
+    try:
+        for size in SIZES:
+            data = os.urandom(size)
+            for name, run in (('file', run_file), ('socket', run_socket)):
+                latencies, cpu, disk = run(tempfile.mkdtemp(dir=base), data, captures)
+                print('%9d %-8s %6.3f ms %6.3f ms %7.3f ms %8d B' % (
+                    size, name, percentile(latencies, 0.5) * 1e3, percentile(latencies, 0.99) * 1e3,
+                    cpu * 1e3, disk))
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200, args[1] if len(args) > 1 else None)
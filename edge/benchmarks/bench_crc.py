@@ -0,0 +1,77 @@
+#============================================================================
+#
+# Filename:  bench_crc.py
+#
+# Purpose:   Microbenchmark of the built-in table-driven CRC-CCITT engine in
+#            simple_hdlc against the PyCRC CRCCCITT("FFFF") path it replaced.
+#            Checks both engines agree before timing them.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_crc [payload_bytes ...]
+#
+#            PyCRC is only needed for the comparison (pip3 install pythoncrc).
+#
+#----------------------------------------------------------------------------
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.simple_hdlc import CRC_INIT, MAX_FRAME_LENGTH, Frame, HDLC, calcCRC, crcUpdateByte
+
+try:
+    from PyCRC.CRCCCITT import CRCCCITT
+except ImportError:
+    CRCCCITT = None
+
+
+def pycrc(data):
+    return CRCCCITT("FFFF").calculate(bytes(data))
+
+
+def table_bytewise(data):
+    crc = CRC_INIT
+    for b in bytearray(data):
+        crc = crcUpdateByte(crc, b)
+    return crc
+
+
+def table_bulk(data):
+    c = calcCRC(data)
+    return (c[0] << 8) | c[1]
+
+
+def receive(frame_bytes):
+    # Full receive-side cost: unstuffing plus the per-byte CRC in addByte
+    f = Frame()
+    for b in bytearray(frame_bytes[1:]):
+        f.addByte(b)
+    assert f.finished and not f.error
+    return f
+
+
+def best_of(fn, arg, number):
+    return min(timeit.repeat(lambda: fn(arg), number=number, repeat=5)) / number
+
+
+def main(sizes):
+    print('%10s %14s %14s %14s %14s' % ('bytes', 'pycrc', 'table/byte', 'table/bulk', 'rx frame'))
+    for size in sizes:
+        data = os.urandom(size)
+        if CRCCCITT is not None:
+            assert pycrc(data) == table_bytewise(data) == table_bulk(data)
+        else:
+            assert table_bytewise(data) == table_bulk(data)
+        number = max(1, 200000 // size)
+        row = [best_of(pycrc, data, number) if CRCCCITT is not None else None,
+               best_of(table_bytewise, data, number),
+               best_of(table_bulk, data, number),
+               best_of(receive, HDLC._encode(bytearray(data)), number)
+               if size + 2 <= MAX_FRAME_LENGTH else None]
+        print('%10d %14s %14s %14s %14s' % tuple(
+            [size] + ['-' if t is None else '%.1f us' % (t * 1e6) for t in row]))
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [16, 256, 1024, 72 * 1024])
@@ -0,0 +1,148 @@
+#============================================================================
+#
+# Filename:  bench_dispatch.py
+#
+# Purpose:   How long the mangOH waits for its ACKs, and how long push
+#            responses take, while captures are pushed over a pty loopback
+#            paced like the UART at 9600 baud (LinkPacer) and the mangOH
+#            sends a handler call every quarter second. The handler takes
+#            HANDLER_TIME, as one that drives a GPIO or writes a file might.
+#
+#              inline       handler and ACK in the reader thread, as
+#                           sync_acknowledge was
+#              dispatcher   ORPDispatcher: ACK from its own thread,
+#                           handler on a worker
+#
+#            ack is from the handler call leaving the mangOH to its ACK
+#            arriving there; push is from the push being sent to its
+#            answer being seen, less its time on the line.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_dispatch [captures] [capture_bytes]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules import orp_protocol
+from modules.simple_hdlc import HDLC
+from modules.orp_client import ORPClient
+from modules.orp_dispatch import ORPDispatcher
+from modules.orp_flow import CreditWindow
+from modules.orp_protocol import build_ack, build_packet, build_push, PATH_FIELD, DATA_FIELD
+from modules.link_pacer import LinkPacer, wire_size
+from benchmarks.ptylink import PtyLoopback
+from benchmarks.fake_mangoh import FakeMangOH
+
+BAUD = 9600
+CALL_INTERVAL = 0.25
+HANDLER_TIME = 0.2
+
+
+class NotifyingMangOH(FakeMangOH):
+    # also sends handler calls, and notes when each ACK comes back
+    def __init__(self, hdlc):
+        FakeMangOH.__init__(self, hdlc)
+        self.calls = []
+        self.acks = []
+        self.notifier = threading.Event()
+        self._spawn(self._callLoop)
+
+    def _onFrame(self, data):
+        if data[:1] == orp_protocol.ORP_PKT_RESP_HANDLER_CALL.encode('ascii'):
+            self.acks.append(time.time())
+            return
+        FakeMangOH._onFrame(self, data)
+
+    def _callLoop(self):
+        i = 0
+        while not self.notifier.wait(CALL_INTERVAL):
+            self.calls.append(time.time())
+            self._send(build_packet(orp_protocol.ORP_PKT_NTFY_HANDLER_CALL, 'n',
+                                    [None, PATH_FIELD, b'light', DATA_FIELD, str(i % 2).encode()]))
+            i += 1
+
+    def stop(self):
+        self.notifier.set()
+        FakeMangOH.stop(self)
+
+
+def handler(packet):
+    time.sleep(HANDLER_TIME)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def run(mode, captures, size):
+    loop = PtyLoopback(line_rate=BAUD)
+    mangoh = NotifyingMangOH(HDLC(loop.port_b))
+    pacer = LinkPacer(HDLC(loop.port_a), BAUD)
+    client = ORPClient(pacer, max_in_flight=4, timeout=120, flow=CreditWindow(initial=1 << 20, maximum=1 << 20))
+    dispatcher = None
+    if mode == 'inline':
+        def on_packet(packet):
+            if packet.ptype == orp_protocol.ORP_PKT_NTFY_HANDLER_CALL:
+                handler(packet)
+                client.send(build_ack('C', '0'))
+    else:
+        dispatcher = ORPDispatcher(client.send)
+        dispatcher.onHandlerCall('light', handler)
+        dispatcher.start()
+        on_packet = dispatcher.dispatch
+    client.start(onPacket=on_packet)
+
+    data = b'A' * size
+    line = wire_size(build_push('str', 'vps_shot', data, seq=1)) / (BAUD / 10.0)
+    pushes = []
+    for i in range(captures):
+        start = time.time()
+        client.push('str', 'vps_shot', data).result(300)
+        pushes.append(time.time() - start - line)
+    # the calls still unanswered get a moment
+    time.sleep(2.0)
+    mangoh.stop()
+    client.stop()
+    if dispatcher is not None:
+        dispatcher.stop()
+    loop.close()
+
+    calls = mangoh.calls[:len(mangoh.acks)]
+    acks = [a - c for c, a in zip(calls, mangoh.acks)]
+    return {
+        'calls': len(mangoh.calls),
+        'acked': len(mangoh.acks),
+        'ack_p50': percentile(acks, 0.5),
+        'ack_max': max(acks) if acks else 0.0,
+        'push_max': max(pushes),
+        'dispatch': dispatcher.asDict() if dispatcher is not None else None,
+    }
+
+
+def main(captures, size):
+    logging.disable(logging.WARNING)
+    simple_hdlc.MAX_FRAME_LENGTH = max(simple_hdlc.MAX_FRAME_LENGTH, size + 64)
+    print('%d baud; %d captures of %d bytes; a handler call every %.2f s, handler takes %.1f s' % (
+        BAUD, captures, size, CALL_INTERVAL, HANDLER_TIME))
+    print('%-11s %9s %9s %9s %11s' % ('mode', 'acked', 'ack p50', 'ack max', 'push extra'))
+    for mode in ('inline', 'dispatcher'):
+        r = run(mode, captures, size)
+        print('%-11s %5d/%-3d %7.2f s %7.2f s %9.2f s' % (
+            mode, r['acked'], r['calls'], r['ack_p50'], r['ack_max'], r['push_max']))
+        if r['dispatch']:
+            d = r['dispatch']
+            print('%11s queued max %d, waited max %.2f s, dropped %d, handler %s' % (
+                '', d['queued_max'], d['wait_max_s'], d['dropped'], d['paths'].get('light')))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 3, int(args[1]) if len(args) > 1 else 4000)
@@ -0,0 +1,105 @@
+#============================================================================
+#
+# Filename:  bench_file_push.py
+#
+# Purpose:   Peak memory and time of pushing a file:// payload, reading the
+#            file whole (open().read, build_push, sendFrame) against
+#            streaming it from a memory map (MappedFile, build_push_parts,
+#            sendFrameParts). Each case runs in its own child process so
+#            the peak RSS it reports is that push's alone: the child first
+#            pushes a small file to warm up, and its RSS before the measured
+#            push is subtracted. Frames go to a null port.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_file_push [payload_bytes ...]
+#
+#----------------------------------------------------------------------------
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.orp_protocol as orp_protocol
+from modules.simple_hdlc import HDLC
+
+SIZES = [100 * 1000, 1000 * 1000, 5000 * 1000]
+REPEAT = 3
+
+
+class NullSerial(object):
+    in_waiting = 0
+
+    def write(self, bs):
+        return len(bs)
+
+
+def push_read(h, filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return h.sendFrame(orp_protocol.build_push('str', 'vps_shot', data))
+
+
+def push_mapped(h, filename):
+    parts = orp_protocol.build_push_parts('str', 'vps_shot', orp_protocol.MappedFile(filename))
+    return h.sendFrameParts(parts)
+
+
+MODES = {'read': push_read, 'mapped': push_mapped}
+
+
+def child(mode, filename, warmup):
+    # peak RSS is in kB on Linux
+    h = HDLC(NullSerial(), reset=False)
+    MODES[mode](h, warmup)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    MODES[mode](h, filename)
+    seconds = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': seconds, 'rss_kb': after - before}))
+
+
+def run(mode, filename, warmup):
+    best = None
+    for _ in range(REPEAT):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', mode, filename, warmup])
+        r = json.loads(out.decode())
+        if best is None or r['seconds'] < best['seconds']:
+            best = dict(r, rss_kb=max(r['rss_kb'], best['rss_kb'] if best else 0))
+    return best
+
+
+def make_file(size):
+    f = tempfile.NamedTemporaryFile(delete=False)
+    with f:
+        for pos in range(0, size, 65536):
+            f.write(os.urandom(min(65536, size - pos)))
+    return f.name
+
+
+def main(sizes):
+    print('%10s %8s %12s %12s' % ('bytes', 'mode', 'time', 'peak RSS'))
+    warmup = make_file(4096)
+    try:
+        for size in sizes:
+            filename = make_file(size)
+            try:
+                for mode in ('read', 'mapped'):
+                    r = run(mode, filename, warmup)
+                    print('%10d %8s %9.1f ms %9d kB' % (size, mode, r['seconds'] * 1e3, r['rss_kb']))
+            finally:
+                os.unlink(filename)
+    finally:
+        os.unlink(warmup)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        main([int(a) for a in sys.argv[1:]] or SIZES)
@@ -0,0 +1,168 @@
+#============================================================================
+#
+# Filename:  bench_file_watcher.py
+#
+# Purpose:   How quickly the sender notices a new capture, what it costs
+#            while idle, and whether it ever reads half a capture. A writer
+#            thread drops captures of the example shot's size at random
+#            intervals, slowly (in 4 kB pieces, like a Pi under load), either
+#            in place as the detector used to or by write then rename. The
+#            reader is the old os.stat loop (poll_interval 0.5 s) or
+#            FileWatcher in poll or inotify mode.
+#
+#            latency is from the capture being complete to the reader having
+#            it; torn counts reads that got a partial file; wakeups/s and CPU
+#            are measured over idle_s seconds with nothing written.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_file_watcher [captures] [idle_s]
+#
+#----------------------------------------------------------------------------
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.file_watcher import FileWatcher
+
+POLL_INTERVAL = 0.5
+CAPTURE_BYTES = 9400
+PIECE = 4096
+PIECE_DELAY = 0.002
+
+
+def cpu_time():
+    r = resource.getrusage(resource.RUSAGE_THREAD if hasattr(resource, 'RUSAGE_THREAD') else resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+class StatReader(object):
+    # the loop orp_transmission used before FileWatcher
+    mode = 'stat loop'
+
+    def __init__(self, path):
+        self.path = path
+        self.previous = 0
+        self.wakeups = 0
+
+    def wait(self, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = 0
+            if mtime != self.previous:
+                self.previous = mtime
+                return True
+            self.wakeups += 1
+            time.sleep(POLL_INTERVAL)
+        return False
+
+    def close(self):
+        pass
+
+
+def write_capture(path, data, atomic, done, index):
+    # done[index]: when the capture is complete, set just before the reader
+    # can be woken for it
+    target = path + '.tmp' if atomic else path
+    with open(target, 'wb') as f:
+        for pos in range(0, len(data), PIECE):
+            f.write(data[pos:pos + PIECE])
+            f.flush()
+            time.sleep(PIECE_DELAY)
+        if not atomic:
+            done[index] = time.time()
+    if atomic:
+        done[index] = time.time()
+        os.replace(target, path)
+
+
+def run(make_reader, atomic, captures, idle):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'encoded_string.txt')
+    reader = make_reader(path)
+    done = {}
+    stop = threading.Event()
+    rnd = random.Random(1)
+
+    def writer():
+        for i in range(captures):
+            time.sleep(rnd.uniform(0.2, 1.5))
+            data = (b'%08d' % i) * (CAPTURE_BYTES // 8)
+            write_capture(path, data, atomic, done, i)
+        stop.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    latencies = []
+    torn = 0
+    seen = set()
+    while not (stop.is_set() and len(seen) >= len(done)):
+        if not reader.wait(0.2):
+            if stop.is_set():
+                break
+            continue
+        got = time.time()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        if len(data) != CAPTURE_BYTES // 8 * 8:
+            torn += 1
+            continue
+        index = int(data[:8])
+        if index not in seen:
+            seen.add(index)
+            latencies.append(got - done[index])
+    thread.join()
+
+    # idle: nothing is written, measure the reader's own cost
+    while reader.wait(0.1):
+        pass
+    wakeups = reader.wakeups
+    start = cpu_time()
+    reader.wait(idle)
+    cpu = cpu_time() - start
+    idle_wakeups = reader.wakeups - wakeups
+    reader.close()
+    shutil.rmtree(directory)
+    latencies.sort()
+    return {
+        'received': len(seen),
+        'torn': torn,
+        'p50': latencies[len(latencies) // 2] if latencies else None,
+        'max': latencies[-1] if latencies else None,
+        'wakeups_per_s': idle_wakeups / idle,
+        'cpu_ms_per_min': cpu / idle * 60 * 1e3,
+    }
+
+
+def main(captures, idle):
+    readers = [
+        ('stat loop', StatReader),
+        ('FileWatcher poll', lambda path: FileWatcher(path, poll_interval=POLL_INTERVAL, use_inotify=False)),
+        ('FileWatcher inotify', FileWatcher),
+    ]
+    print('%d captures of %d bytes, written in %d byte pieces' % (captures, CAPTURE_BYTES, PIECE))
+    print('%-20s %-8s %9s %6s %9s %9s %10s %12s' % (
+        'reader', 'writer', 'received', 'torn', 'p50', 'max', 'wakeups/s', 'idle CPU'))
+    for name, make_reader in readers:
+        for atomic in (False, True):
+            r = run(make_reader, atomic, captures, idle)
+            print('%-20s %-8s %5d/%-3d %6d %6.0f ms %6.0f ms %10.1f %7.2f ms/min' % (
+                name, 'rename' if atomic else 'in place', r['received'], captures, r['torn'],
+                r['p50'] * 1e3, r['max'] * 1e3, r['wakeups_per_s'], r['cpu_ms_per_min']))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 30, float(args[1]) if len(args) > 1 else 10.0)
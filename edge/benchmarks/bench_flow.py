@@ -0,0 +1,99 @@
+#============================================================================
+#
+# Filename:  bench_flow.py
+#
+# Purpose:   Push throughput and losses with and without the credit window,
+#            against a simulated mangOH that forwards requests at a fixed
+#            byte rate with a bounded buffer, so pushing too fast overruns
+#            it (see fake_mangoh). It sends SYNCs with its counters every
+#            second. Two cases: a mangOH slower than the UART, and one
+#            faster, where the UART itself should end up nearly busy.
+#
+#            Modes: stop-and-wait (one request in flight), a fixed 16 in
+#            flight with no byte window, and the credit window (default
+#            CreditWindow, up to 16 in flight). UART is the share of the line
+#            spent on pushes that were answered.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_flow [pushes] [payload_bytes] [baud]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from modules.orp_client import ORPClient
+from modules.orp_flow import CreditWindow
+from modules.orp_protocol import build_push
+from benchmarks.ptylink import PtyLoopback
+from benchmarks.fake_mangoh import FakeMangOH
+
+# (name, forwarding rate in bytes/s, buffer bytes)
+DEVICES = [
+    ('slow mangOH', 1500, 4096),
+    ('fast mangOH', 20000, 16384),
+]
+
+MODES = [
+    ('stop-and-wait', 1, lambda: CreditWindow(initial=1 << 30, maximum=1 << 30)),
+    ('16 in flight', 16, lambda: CreditWindow(initial=1 << 30, maximum=1 << 30)),
+    ('credit window', 16, CreditWindow),
+]
+
+TIMEOUT = 5.0
+SYNC_INTERVAL = 1.0
+
+
+def run(device, mode, payloads, baud):
+    _, rate, buffer = device
+    _, in_flight, flow = mode
+    loop = PtyLoopback(line_rate=baud)
+    mangoh = FakeMangOH(HDLC(loop.port_b), rate=rate, buffer=buffer, sync_interval=SYNC_INTERVAL)
+    link = HDLC(loop.port_a)
+    client = ORPClient(link, max_in_flight=in_flight, timeout=TIMEOUT, flow=flow())
+    client.start()
+    start = time.time()
+    futures = [client.push('str', 'vps_shot', data) for data in payloads]
+    answered = 0
+    for f in futures:
+        if f.exception(60) is None:
+            answered += 1
+    elapsed = time.time() - start
+    client.stop()
+    mangoh.stop()
+    loop.close()
+    return {
+        'answered': answered,
+        'dropped': mangoh.dropped,
+        'goodput': answered * len(payloads[0]) / elapsed,
+        # share of the line carrying pushes that were answered
+        'uart': answered * len(HDLC._encode(bytearray(build_push('str', 'vps_shot', payloads[0], seq=1))))
+                / elapsed / (baud / 10.0),
+        'window': client.flow.window,
+    }
+
+
+def main(pushes, size, baud):
+    logging.disable(logging.WARNING)
+    simple_hdlc.MAX_FRAME_LENGTH = max(simple_hdlc.MAX_FRAME_LENGTH, size + 64)
+    payloads = [os.urandom(size // 2).hex().encode() for _ in range(pushes)]
+    print('%d pushes of %d bytes at %d baud (%d B/s)' % (pushes, size, baud, baud // 10))
+    for device in DEVICES:
+        print('\n%s: forwards %d B/s, %d byte buffer' % device)
+        print('%-14s %9s %8s %11s %6s %8s' % ('mode', 'answered', 'dropped', 'goodput', 'UART', 'window'))
+        for mode in MODES:
+            r = run(device, mode, payloads, baud)
+            print('%-14s %5d/%-3d %8d %7.0f B/s %5.0f%% %8s' % (
+                mode[0], r['answered'], pushes, r['dropped'], r['goodput'], r['uart'] * 100,
+                r['window'] if mode[2] is CreditWindow else '-'))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 40, int(args[1]) if len(args) > 1 else 1000,
+         int(args[2]) if len(args) > 2 else 38400)
@@ -0,0 +1,99 @@
+#============================================================================
+#
+# Filename:  bench_goodput.py
+#
+# Purpose:   Goodput against bit error rate for plain HDLC (one frame per
+#            push, as orp_transmission sends today) and for the reliable
+#            mode (FragmentedHDLC over ReliableHDLC). Both ends run over a
+#            pty loopback that flips bits at the requested rate.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_goodput [payload_bytes] [pushes]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from modules.hdlc_fragment import FragmentedHDLC
+from modules.hdlc_reliable import ReliableHDLC
+from benchmarks.ptylink import PtyLoopback
+
+BIT_ERROR_RATES = [0.0, 1e-6, 1e-5, 1e-4, 3e-4]
+
+# a run is over once the link has carried nothing for this long; longer
+# than ReliableHDLC's largest retransmit backoff below
+IDLE_TIMEOUT = 5.0
+
+
+class Receiver(object):
+    def __init__(self, expected):
+        self.expected = set(expected)
+        self.good = 0
+        self.last = time.time()
+        self.done = threading.Event()
+
+    def __call__(self, data):
+        self.last = time.time()
+        if bytes(data) in self.expected:
+            self.good += 1
+            if self.good == len(self.expected):
+                self.done.set()
+
+    def wait(self, loop):
+        while not self.done.wait(0.1):
+            if time.time() - loop.last_activity > IDLE_TIMEOUT:
+                break
+        return self.last
+
+
+def plain_link(port):
+    return HDLC(port)
+
+
+def reliable_link(port):
+    return FragmentedHDLC(ReliableHDLC(HDLC(port), window=16, retransmit_timeout=0.2), frame_size=256)
+
+
+def run(make_link, bit_error_rate, payloads):
+    loop = PtyLoopback(bit_error_rate, seed=1)
+    tx, rx = make_link(loop.port_a), make_link(loop.port_b)
+    receiver = Receiver(payloads)
+    tx.startReader(onFrame=lambda data: None)
+    rx.startReader(onFrame=receiver)
+    start = time.time()
+    # reliable sends block on a full window; keep that off the timing thread
+    sender = threading.Thread(target=lambda: [tx.sendFrame(p) for p in payloads])
+    sender.daemon = True
+    sender.start()
+    end = receiver.wait(loop)
+    tx.stopReader()
+    rx.stopReader()
+    loop.close()
+    delivered = receiver.good * len(payloads[0])
+    return receiver.good, delivered / max(end - start, 1e-6), loop.bytes_relayed, loop.bit_errors
+
+
+def main(size, pushes):
+    logging.disable(logging.WARNING)
+    # plain mode sends each push as one frame, like orp_transmission does
+    simple_hdlc.MAX_FRAME_LENGTH = size + 2
+    payloads = [os.urandom(size) for _ in range(pushes)]
+    print('%d pushes of %d bytes' % (pushes, size))
+    print('%10s %-9s %10s %14s %12s %11s' % ('BER', 'mode', 'delivered', 'goodput', 'wire bytes', 'bit errors'))
+    for ber in BIT_ERROR_RATES:
+        for name, make_link in (('plain', plain_link), ('reliable', reliable_link)):
+            good, goodput, wire, errors = run(make_link, ber, payloads)
+            print('%10g %-9s %6d/%-3d %9.1f kB/s %12d %11d' % (
+                ber, name, good, pushes, goodput / 1e3, wire, errors))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 72 * 1024, int(args[1]) if len(args) > 1 else 10)
@@ -0,0 +1,147 @@
+#============================================================================
+#
+# Filename:  bench_hdlc_codec.py
+#
+# Purpose:   Compare the bulk byte-stuffing encoder and chunked decoder in
+#            simple_hdlc with the original one-byte-at-a-time loops, which
+#            are kept below as the reference. Both directions are checked
+#            for identical output before anything is timed.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_hdlc_codec [payload_bytes ...]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC, calcCRC
+
+
+class BufferSerial(object):
+    # Just enough of the pyserial interface to feed HDLC from memory
+
+    def __init__(self, data=b'', chunk=None):
+        self.data = data
+        self.pos = 0
+        self.chunk = chunk
+
+    @property
+    def in_waiting(self):
+        left = len(self.data) - self.pos
+        return left if self.chunk is None else min(left, self.chunk)
+
+    def read(self, size=1):
+        b = self.data[self.pos:self.pos + size]
+        self.pos += len(b)
+        return b
+
+    def reset_input_buffer(self):
+        pass
+
+
+def legacy_encode(bs):
+    data = bytearray()
+    data.append(0x7E)
+    bs = bs + calcCRC(bs)
+    for byte in bs:
+        if byte == 0x7E or byte == 0x7D:
+            data.append(0x7D)
+            data.append(byte ^ 0x20)
+        else:
+            data.append(byte)
+    data.append(0x7E)
+    return bytes(data)
+
+
+def legacy_decode(h):
+    # The original _readBytes: one serial.read(1) and addByte per byte
+    while h.serial.in_waiting:
+        h._readByte(bytearray(h.serial.read(1))[0])
+
+
+def bulk_decode(h):
+    while h.serial.in_waiting:
+        h._readBytes(h.serial.in_waiting)
+
+
+def collect(decode, stream, chunk=None):
+    frames, errors = [], []
+    h = HDLC(BufferSerial(stream, chunk))
+    # frames arrive as views into HDLC's receive ring; keep copies
+    h.frame_callback = lambda frame: frames.append(bytes(frame))
+    h.error_callback = errors.append
+    decode(h)
+    return frames, len(errors)
+
+
+def rewind(decode, stream):
+    # one HDLC per measurement, so its buffers are not counted per frame
+    h = HDLC(BufferSerial(stream))
+    h.frame_callback = lambda frame: None
+
+    def run():
+        h.serial.pos = 0
+        decode(h)
+    return run
+
+
+def payload(size, escape_density):
+    data = bytearray(os.urandom(size))
+    for i in random.sample(range(size), int(size * escape_density)):
+        data[i] = random.choice((0x7D, 0x7E))
+    return data
+
+
+def check(rounds=200):
+    for _ in range(rounds):
+        frames = [payload(random.randint(1, 300), random.random() * 0.2) for _ in range(5)]
+        stream = b''.join(legacy_encode(f) for f in frames)
+        # corrupt a byte now and then so the error paths are compared too
+        if random.random() < 0.3:
+            s = bytearray(stream)
+            s[random.randrange(len(s))] ^= 1 << random.randrange(8)
+            stream = bytes(s)
+        for f in frames:
+            assert HDLC._encode(bytearray(f)) == legacy_encode(f)
+        expected = collect(legacy_decode, stream)
+        assert collect(bulk_decode, stream, random.randint(1, 64)) == expected
+        assert collect(bulk_decode, stream) == expected
+
+
+def best_of(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def main(sizes):
+    # corrupted frames in check() log warnings by design
+    logging.disable(logging.WARNING)
+    check()
+    logging.disable(logging.NOTSET)
+    # The receive benchmark lifts the receiver's frame limit so a whole
+    # image push fits into one frame, as orp_transmission sends it.
+    simple_hdlc.MAX_FRAME_LENGTH = max(sizes) + 2
+    print('%10s %8s %13s %13s %7s %13s %13s %7s' % (
+        'bytes', 'escapes', 'enc legacy', 'enc bulk', 'x', 'dec legacy', 'dec bulk', 'x'))
+    for size in sizes:
+        for density in (0.0, 0.01, 0.1):
+            data = payload(size, density)
+            stream = legacy_encode(data)
+            number = max(1, 20000 // size)
+            enc = (best_of(lambda: legacy_encode(data), number),
+                   best_of(lambda: HDLC._encode(data), number))
+            dec = (best_of(rewind(legacy_decode, stream), number),
+                   best_of(rewind(bulk_decode, stream), number))
+            print('%10d %7.0f%% %10.1f us %10.1f us %6.0fx %10.1f us %10.1f us %6.0fx' % (
+                size, density * 100,
+                enc[0] * 1e6, enc[1] * 1e6, enc[0] / enc[1],
+                dec[0] * 1e6, dec[1] * 1e6, dec[0] / dec[1]))
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [64, 1000, 72 * 1024])
@@ -0,0 +1,225 @@
+#============================================================================
+#
+# Filename:  bench_hdlc_suite.py
+#
+# Purpose:   HDLC throughput suite over a pty loopback, one case per payload
+#            size and escape density (share of payload bytes that are 0x7E
+#            or 0x7D and get stuffed). For each case it measures
+#
+#              - frames/s and goodput, sending back to back
+#              - CPU per MB of payload, both ends, relay thread excluded
+#              - sendFrame -> frame_callback latency, one frame at a time
+#
+#            and writes the results as JSON so runs can be compared across
+#            commits:
+#
+#                python3 -m benchmarks.bench_hdlc_suite -o before.json
+#                (change something)
+#                python3 -m benchmarks.bench_hdlc_suite -o after.json -c before.json
+#
+#            With --compare the exit status is 1 if any metric got worse by
+#            more than --threshold. --line-rate paces the loopback like a
+#            UART at that baud rate (9600 on the mangOH).
+#
+#            Run from the edge/ directory.
+#
+#----------------------------------------------------------------------------
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from benchmarks.ptylink import PtyLoopback
+
+PAYLOAD_SIZES = [16, 256, 1022, 4096]
+ESCAPE_DENSITIES = [0.0, 0.1, 0.5]
+
+# bytes sent per throughput case, within these frame counts
+CASE_BYTES = 512 * 1024
+MIN_FRAMES = 200
+MAX_FRAMES = 5000
+LATENCY_SAMPLES = 50
+
+# metric -> True if larger is better
+METRICS = {
+    'frames_per_s': True,
+    'goodput_Bps': True,
+    'cpu_s_per_mb': False,
+    'latency_p50_ms': False,
+    'latency_p99_ms': False,
+}
+
+
+def make_payload(size, density, rng):
+    special = (simple_hdlc.END_CHAR, simple_hdlc.ESCAPE_CHAR)
+    plain = [b for b in range(256) if b not in special]
+    return bytes(bytearray(rng.choice(special) if rng.random() < density else rng.choice(plain)
+                           for _ in range(size)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Sink(object):
+    def __init__(self):
+        self.count = 0
+        self.cond = threading.Condition()
+
+    def __call__(self, data):
+        with self.cond:
+            self.count += 1
+            self.cond.notify_all()
+
+    def wait(self, count, timeout):
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.count < count:
+                left = deadline - time.time()
+                if left <= 0:
+                    return False
+                self.cond.wait(left)
+        return True
+
+
+def run_case(size, density, line_rate):
+    rng = random.Random(size * 1000 + int(density * 100))
+    payload = make_payload(size, density, rng)
+    frames = max(MIN_FRAMES, min(MAX_FRAMES, CASE_BYTES // size))
+    if line_rate:
+        # keep paced runs to a few seconds of line time
+        frames = max(10, min(frames, int(line_rate / 10.0 * 5 / (size * (1 + density) + 4))))
+
+    loop = PtyLoopback(line_rate=line_rate)
+    tx, rx = HDLC(loop.port_a), HDLC(loop.port_b)
+    sink = Sink()
+    rx.startReader(onFrame=sink)
+
+    # throughput: back to back
+    wall, cpu, relay = time.time(), time.process_time(), loop.relay_cpu
+    for _ in range(frames):
+        tx.sendFrame(payload)
+    complete = sink.wait(frames, 60)
+    wall = time.time() - wall
+    cpu = time.process_time() - cpu - (loop.relay_cpu - relay)
+
+    # latency: one frame in flight at a time
+    latencies = []
+    for _ in range(LATENCY_SAMPLES if complete else 0):
+        expected = sink.count + 1
+        start = time.time()
+        tx.sendFrame(payload)
+        if not sink.wait(expected, 10):
+            break
+        latencies.append(time.time() - start)
+
+    rx.stopReader()
+    loop.close()
+    received = min(sink.count, frames)
+    mb = received * size / 1e6
+    return {
+        'payload': size,
+        'escape_density': density,
+        'frames': frames,
+        'received': received,
+        'wire_bytes_per_frame': len(HDLC._encode(bytearray(payload))),
+        'frames_per_s': received / wall,
+        'goodput_Bps': received * size / wall,
+        'cpu_s_per_mb': cpu / mb if mb else None,
+        'latency_p50_ms': percentile(latencies, 0.5) * 1e3 if latencies else None,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1e3 if latencies else None,
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    base = dict(((r['payload'], r['escape_density']), r) for r in baseline['results'])
+    worse = 0
+    print('\ncompared with %s (%s)' % (baseline['meta'].get('commit'), baseline['meta'].get('date')))
+    for r in results:
+        b = base.get((r['payload'], r['escape_density']))
+        if b is None:
+            continue
+        changes = []
+        for metric, higher_better in sorted(METRICS.items()):
+            new, old = r.get(metric), b.get(metric)
+            if not new or not old:
+                continue
+            change = new / old - 1.0
+            regressed = (change < -threshold) if higher_better else (change > threshold)
+            worse += regressed
+            changes.append('%s %+.0f%%%s' % (metric, change * 100, ' REGRESSED' if regressed else ''))
+        print('%6d B %4.0f%%  %s' % (r['payload'], r['escape_density'] * 100, ', '.join(changes)))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HDLC throughput suite over a pty loopback')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    parser.add_argument('-c', '--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='relative change that counts as a regression (default 0.2)')
+    parser.add_argument('-r', '--line-rate', type=int, default=None,
+                        help='pace the loopback to this baud rate (default unpaced)')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=PAYLOAD_SIZES)
+    parser.add_argument('-e', '--escapes', type=float, nargs='+', default=ESCAPE_DENSITIES)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    simple_hdlc.MAX_FRAME_LENGTH = max(args.sizes) + 2
+
+    print('%6s %5s %8s %10s %12s %10s %9s %9s' % (
+        'bytes', 'esc', 'frames', 'frames/s', 'goodput', 'cpu/MB', 'p50', 'p99'))
+    results = []
+    for size in args.sizes:
+        for density in args.escapes:
+            r = run_case(size, density, args.line_rate)
+            results.append(r)
+            print('%6d %4.0f%% %8s %10.0f %8.1f kB/s %8s s %6s ms %6s ms' % (
+                size, density * 100, '%d/%d' % (r['received'], r['frames']), r['frames_per_s'],
+                r['goodput_Bps'] / 1e3, '%.2f' % r['cpu_s_per_mb'] if r['cpu_s_per_mb'] else '-',
+                '%.2f' % r['latency_p50_ms'] if r['latency_p50_ms'] else '-',
+                '%.2f' % r['latency_p99_ms'] if r['latency_p99_ms'] else '-'))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'line_rate': args.line_rate,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
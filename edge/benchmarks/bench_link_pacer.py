@@ -0,0 +1,139 @@
+#============================================================================
+#
+# Filename:  bench_link_pacer.py
+#
+# Purpose:   Time from detection to delivery, and what the wake-up preamble
+#            costs, over a pty loopback paced like the UART at 9600 baud
+#            with a mangOH that answers at once (see fake_mangoh):
+#
+#              old loop     '~~', 0.1 s, '~~' before every packet and a
+#                           30 s sleep after every capture, as
+#                           orp_transmission was
+#              preamble     the preamble before every packet, no sleep
+#              LinkPacer    paced to the baud rate, preamble only after
+#                           the line was quiet for 1 s
+#
+#            Workloads: captures of the example shot's size arriving one
+#            second apart (latency is capture to answer, line is the time
+#            the push itself needs on the wire), and 30 small JSON pushes
+#            sent back to back.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_link_pacer [captures] [capture_bytes]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from modules.orp_client import ORPClient
+from modules.orp_flow import CreditWindow
+from modules.orp_protocol import build_push
+from modules.link_pacer import LinkPacer, wire_size
+from benchmarks.ptylink import PtyLoopback
+from benchmarks.fake_mangoh import FakeMangOH
+
+BAUD = 9600
+OLD_SLEEP = 30.0
+CAPTURE_GAP = 1.0
+SMALL_PUSHES = 30
+
+# name -> (pacer arguments, seconds to sleep after each capture)
+MODES = [
+    ('old loop', dict(baud=1e9, idle_wake=-1), OLD_SLEEP),
+    ('preamble', dict(baud=1e9, idle_wake=-1), 0.0),
+    ('LinkPacer', dict(baud=BAUD, idle_wake=1.0), 0.0),
+]
+
+
+def setup(pacer_args):
+    loop = PtyLoopback(line_rate=BAUD)
+    mangoh = FakeMangOH(HDLC(loop.port_b))
+    hdlc = HDLC(loop.port_a)
+    pacer = LinkPacer(hdlc, **pacer_args)
+    client = ORPClient(pacer, max_in_flight=8, timeout=60, flow=CreditWindow(initial=1 << 20, maximum=1 << 20))
+    client.start()
+    return loop, mangoh, pacer, client
+
+
+def teardown(loop, mangoh, client):
+    client.stop()
+    mangoh.stop()
+    loop.close()
+
+
+def run_captures(pacer_args, sleep_after, captures, size):
+    loop, mangoh, pacer, client = setup(pacer_args)
+    data = b'A' * size
+    arrived = []
+    latencies = []
+    done = threading.Event()
+
+    def detector():
+        for i in range(captures):
+            arrived.append(time.time())
+            time.sleep(CAPTURE_GAP)
+        done.set()
+
+    time.sleep(1.5)
+    thread = threading.Thread(target=detector)
+    thread.start()
+    sent = 0
+    while sent < captures:
+        if sent >= len(arrived):
+            time.sleep(0.01)
+            continue
+        # the newest capture, as the single file held only that one
+        index = len(arrived) - 1 if sleep_after else sent
+        client.push('str', 'vps_shot', data).result(120)
+        latencies.append(time.time() - arrived[index])
+        sent = index + 1
+        if sleep_after:
+            time.sleep(sleep_after)
+    thread.join()
+    teardown(loop, mangoh, client)
+    return latencies, pacer.wakes
+
+
+def run_small(pacer_args):
+    loop, mangoh, pacer, client = setup(pacer_args)
+    time.sleep(1.5)
+    start = time.time()
+    futures = [client.push('json', 'vps_data', '[[0,{"object":"HU","confidence":%d}]]' % (50 + i))
+               for i in range(SMALL_PUSHES)]
+    for f in futures:
+        f.result(60)
+    elapsed = time.time() - start
+    teardown(loop, mangoh, client)
+    return elapsed, pacer.wakes
+
+
+def main(captures, size):
+    logging.disable(logging.WARNING)
+    simple_hdlc.MAX_FRAME_LENGTH = max(simple_hdlc.MAX_FRAME_LENGTH, size + 64)
+    rate = BAUD / 10.0
+    line = wire_size(build_push('str', 'vps_shot', b'A' * size, seq=1)) / rate
+    small = sum(wire_size(build_push('json', 'vps_data', '[[0,{"object":"HU","confidence":%d}]]' % (50 + i), seq=1))
+                for i in range(SMALL_PUSHES)) / rate
+    print('%d baud; %d captures of %d bytes, %.0f s apart, %.1f s each on the line' % (
+        BAUD, captures, size, CAPTURE_GAP, line))
+    print('%-10s %-40s %7s' % ('mode', 'capture latency', 'wakes'))
+    for name, pacer_args, sleep_after in MODES:
+        latencies, wakes = run_captures(pacer_args, sleep_after, captures, size)
+        print('%-10s %-40s %7d' % (name, ' '.join('%.1fs' % l for l in latencies), wakes))
+    print('\n%d JSON pushes back to back, %.2f s on the line' % (SMALL_PUSHES, small))
+    print('%-10s %8s %7s' % ('mode', 'time', 'wakes'))
+    for name, pacer_args, sleep_after in MODES[1:]:
+        elapsed, wakes = run_small(pacer_args)
+        print('%-10s %6.2f s %7d' % (name, elapsed, wakes))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 3, int(args[1]) if len(args) > 1 else 9400)
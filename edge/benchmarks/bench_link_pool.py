@@ -0,0 +1,109 @@
+#============================================================================
+#
+# Filename:  bench_link_pool.py
+#
+# Purpose:   Captures pushed over one mangOH gateway against two, over pty
+#            loopbacks paced like the UART at 9600 baud (LinkPacer) to
+#            simulated mangOHs that forward at a fixed byte rate, standing
+#            in for their cellular uplinks (see fake_mangoh). The second
+#            gateway's uplink is a third as fast as the first's.
+#
+#              one link      everything over the fast gateway
+#              round robin   alternating between the two
+#              LinkPool      by backlog and measured throughput
+#
+#            The captures are queued as fast as the links take them, as
+#            the spool does after a burst. time is until the last answer,
+#            throughput the bytes answered over it, share the captures each
+#            gateway took.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_link_pool [captures] [capture_bytes]
+#
+#----------------------------------------------------------------------------
+import itertools
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from modules.orp_client import ORPClient
+from modules.orp_protocol import build_push
+from modules.link_pacer import LinkPacer
+from modules.link_pool import LinkPool
+from benchmarks.ptylink import PtyLoopback
+from benchmarks.fake_mangoh import FakeMangOH
+
+BAUD = 9600
+# bytes per second each gateway forwards
+UPLINKS = [600, 200]
+
+
+class RoundRobin(object):
+    def __init__(self, clients):
+        self.clients = itertools.cycle(clients)
+
+    def send(self, packet):
+        return next(self.clients).send(packet)
+
+
+def open_link(rate, size):
+    loop = PtyLoopback(line_rate=BAUD)
+    mangoh = FakeMangOH(HDLC(loop.port_b), rate=rate, buffer=8 * size)
+    client = ORPClient(LinkPacer(HDLC(loop.port_a), BAUD), max_in_flight=4, timeout=300)
+    client.start()
+    return loop, mangoh, client
+
+
+def run(mode, captures, size):
+    links = [open_link(rate, size) for rate in (UPLINKS[:1] if mode == 'one link' else UPLINKS)]
+    clients = [client for loop, mangoh, client in links]
+    pool = None
+    if mode == 'LinkPool':
+        pool = sender = LinkPool()
+        for i, client in enumerate(clients):
+            pool.add('mangoh%d' % i, client, rate=BAUD / 10.0)
+    elif mode == 'round robin':
+        sender = RoundRobin(clients)
+    else:
+        sender = clients[0]
+    share = dict((id(client), 0) for client in clients)
+    start = time.time()
+    futures = []
+    for i in range(captures):
+        before = [client.frames_sent for client in clients]
+        futures.append(sender.send(build_push('str', 'vps_shot', b'A' * size)))
+        for client, count in zip(clients, before):
+            if client.frames_sent != count:
+                share[id(client)] += 1
+    for future in futures:
+        future.result(600)
+    elapsed = time.time() - start
+    rates = [l['rate_Bps'] for l in pool.asDict()['links'].values()] if pool else []
+    for loop, mangoh, client in links:
+        client.stop()
+        mangoh.stop()
+        loop.close()
+    return elapsed, [share[id(client)] for client in clients], rates
+
+
+def main(captures, size):
+    logging.disable(logging.WARNING)
+    simple_hdlc.MAX_FRAME_LENGTH = max(simple_hdlc.MAX_FRAME_LENGTH, size + 64)
+    print('%d captures of %d bytes, %d baud; gateway uplinks %s B/s' % (
+        captures, size, BAUD, ', '.join(str(r) for r in UPLINKS)))
+    print('%-12s %8s %12s %8s' % ('sender', 'time', 'throughput', 'share'))
+    for mode in ('one link', 'round robin', 'LinkPool'):
+        elapsed, share, rates = run(mode, captures, size)
+        print('%-12s %6.1f s %8.0f B/s %8s %s' % (
+            mode, elapsed, captures * size / elapsed, '/'.join(str(n) for n in share),
+            ('rates ' + '/'.join('%.0f' % r for r in rates)) if rates else ''))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 24, int(args[1]) if len(args) > 1 else 600)
@@ -0,0 +1,72 @@
+#============================================================================
+#
+# Filename:  bench_orp_build.py
+#
+# Purpose:   Cost of building a push packet: the old text path (format a
+#            command, encode_request splits it, encode_push concatenates
+#            str, the caller .encode()s) against orp_protocol.build_push.
+#            Reports time per packet and the peak memory held while
+#            building, in multiples of the payload size.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_orp_build [payload_bytes ...]
+#
+#----------------------------------------------------------------------------
+import base64
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.orp_protocol as orp_protocol
+
+
+#
+# The text path as it was, kept as the reference
+#
+def legacy_push(data):
+    request = 'push str vps_shot 0 {0}'.format(data)
+    request_type, args = request.split(' ', 1)
+    data_type, path, timestamp, data = args.split(' ', 3)
+    packet = ''
+    packet = packet + orp_protocol.ORP_PKT_RQST_PUSH
+    packet = str(packet) + str(orp_protocol.ORP_DATA_TYPE_STRING)
+    packet = packet + orp_protocol.encode_sequence(1)
+    packet = packet + orp_protocol.encode_path(path)
+    packet = packet + orp_protocol.ORP_VARLENGTH_SEPARATOR
+    packet = packet + orp_protocol.encode_data(data)
+    return packet.encode()
+
+
+def peak(fn):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    packet = fn()
+    _, top = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the returned packet itself is one copy
+    del packet
+    return top - base
+
+
+def main(sizes):
+    print('%10s %14s %14s %8s %12s %12s' % ('bytes', 'text path', 'build_push', 'speedup', 'text peak', 'build peak'))
+    for size in sizes:
+        text = base64.b64encode(os.urandom(size * 3 // 4)).decode('ascii')
+        data = text.encode('ascii')
+        legacy = lambda: legacy_push(text)
+        build = lambda: orp_protocol.build_push('str', 'vps_shot', data, seq=1)
+        assert legacy() == build()
+        number = max(10, 2000000 // size)
+        t_old = min(timeit.repeat(legacy, number=number, repeat=3)) / number
+        t_new = min(timeit.repeat(build, number=number, repeat=3)) / number
+        print('%10d %11.1f us %11.1f us %7.1fx %11.2fx %11.2fx' % (
+            len(data), t_old * 1e6, t_new * 1e6, t_old / t_new,
+            peak(legacy) / float(len(data)), peak(build) / float(len(data))))
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [64, 1024, 72 * 1024])
@@ -0,0 +1,111 @@
+#============================================================================
+#
+# Filename:  bench_orp_decode.py
+#
+# Purpose:   Packets/s of orp_protocol.decode_packet against the old
+#            decode_response (linear ptype scan, str split on ',', seven
+#            prints per packet). The old decoder's prints go to /dev/null;
+#            it is also timed with printing replaced by a no-op, to show
+#            the parsing cost alone.
+#
+#            The old decoder parsed the sequence number with int(), so the
+#            packets here use ASCII digits for it to keep it working.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_orp_decode
+#
+#----------------------------------------------------------------------------
+import builtins
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.orp_protocol import decode_packet, ptypes, status_list, ORP_PKT_SYNC_SYN, ORP_PKT_SYNC_SYNACK
+
+
+#
+# decode_response as it was, kept as the reference
+#
+def legacy_decode(response):
+    resp = {}
+    response = bytes(response)
+    ptype      = chr(response[0])
+    status_ver = response[1]
+    seq_num    = int(response[2:4])
+    var_length = (response[4:len(response)]).decode("utf-8")
+    print('Received     : ' + chr(response[0]) + chr(response[1]) + chr(response[2]) + chr(response[3]) + var_length)
+    for i in range(len(ptypes)):
+        test = ptypes[i]
+        if test[0] == ptype:
+            print('Message type : ' + test[1])
+            resp['responseType'] = test[0]
+    if ORP_PKT_SYNC_SYN == ptype or ORP_PKT_SYNC_SYNACK == ptype:
+        version = chr(status_ver + 1)
+        resp['version'] = version
+        print('Version      : ' + version)
+    else:
+        status = status_list[status_ver - 64]
+        resp['status'] = status
+        print('Status       : ' + status)
+    resp['sequence'] = seq_num
+    print('Sequence     : ' + str(seq_num))
+    if len(var_length):
+        var_fields = var_length.split(',')
+        for i in range(len(var_fields)):
+            field = var_fields[i]
+            if field[0] == 'P':
+                resp['path'] = field[1:]
+                print('Path         : ' + field[1:])
+            if field[0] == 'T':
+                resp['timestamp'] = field[1:]
+                print('Timestamp    : ' + field[1:])
+            if field[0] == 'D':
+                resp['data'] = field[1:]
+                print('Data         : ' + field[1:])
+                break
+            if field[0] == 'S':
+                resp['sent'] = field[1:]
+                print('Sent         : ' + field[1:])
+            if field[0] == 'R':
+                resp['sent'] = field[1:]
+                print('Received     : ' + field[1:])
+    return resp
+
+
+PACKETS = [
+    ('push ack', b'p@12'),
+    ('sync', b'Y112T1700000000,S42,R17'),
+    ('handler call', b'c@12Pvps/cmd,T1700000000,D{"mode":"fast"}'),
+    ('72 kB data', b'c@12Pvps_shot,T1700000000,D' + b'A' * 72 * 1024),
+]
+
+
+def rate(fn, packet):
+    number = 20000 if len(packet) < 1024 else 200
+    return number / min(timeit.repeat(lambda: fn(packet), number=number, repeat=3))
+
+
+def main():
+    real_print = builtins.print
+    devnull = open(os.devnull, 'w')
+    print('%-14s %16s %16s %16s %9s' % ('packet', 'old (prints)', 'old (no print)', 'decode_packet', 'speedup'))
+    for name, packet in PACKETS:
+        view = memoryview(bytearray(packet))
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            printed = rate(legacy_decode, view)
+        finally:
+            sys.stdout = stdout
+        builtins.print = lambda *args, **kwargs: None
+        try:
+            silent = rate(legacy_decode, view)
+        finally:
+            builtins.print = real_print
+        new = rate(decode_packet, view)
+        print('%-14s %14.0f/s %14.0f/s %14.0f/s %8.1fx' % (name, printed, silent, new, new / printed))
+
+
+if __name__ == '__main__':
+    main()
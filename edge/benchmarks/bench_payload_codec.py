@@ -0,0 +1,73 @@
+#============================================================================
+#
+# Filename:  bench_payload_codec.py
+#
+# Purpose:   What each payload_codec costs on the UART for a real capture:
+#            the encoded size, the bytes on the wire once the push is HDLC
+#            framed and stuffed, how many of those are escapes, the time that
+#            takes at 9600 baud (8N1, 10 bits a byte), and the CPU to encode
+#            and decode. Every codec is checked to round-trip first.
+#
+#            Run from the edge/ directory, with JPEG files from the camera:
+#                python3 -m benchmarks.bench_payload_codec [capture.jpg ...]
+#
+#            Without arguments it uses the example shot in orp_transmission.
+#
+#----------------------------------------------------------------------------
+import base64
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.orp_protocol as orp_protocol
+import modules.payload_codec as payload_codec
+from modules.simple_hdlc import HDLC
+
+BAUD = 9600
+BITS_PER_BYTE = 10
+
+
+def example_shot():
+    # the base64 JPEG orp_transmission sends with 's'
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'orp_transmission.py')
+    with open(path) as f:
+        match = re.search(r"^vps_shot_example = '([^']*)'", f.read(), re.M)
+    return base64.b64decode(match.group(1))
+
+
+def best(fn):
+    number = 20
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number
+
+
+def run(name, jpeg):
+    print('%s: %d bytes' % (name, len(jpeg)))
+    print('%8s %9s %7s %9s %8s %9s %10s %10s' % (
+        'codec', 'encoded', 'ratio', 'wire', 'escapes', '@9600', 'encode', 'decode'))
+    for codec in payload_codec.CODECS:
+        text = payload_codec.encode(jpeg, codec)
+        assert payload_codec.decode(text) == jpeg
+        packet = orp_protocol.build_push('str', 'vps_shot', text, seq=1)
+        wire = len(HDLC._encode(bytearray(packet)))
+        # framing adds two flags and the CRC; the rest past the packet is stuffing
+        escapes = wire - len(packet) - 4
+        print('%8s %9d %6.2fx %9d %8d %7.2f s %7.2f ms %7.2f ms' % (
+            codec, len(text), len(text) / float(len(jpeg)), wire, escapes,
+            wire * BITS_PER_BYTE / float(BAUD),
+            best(lambda: payload_codec.encode(jpeg, codec)) * 1e3,
+            best(lambda: payload_codec.decode(text)) * 1e3))
+
+
+def main(paths):
+    if not paths:
+        run('orp_transmission example shot', example_shot())
+    for path in paths:
+        with open(path, 'rb') as f:
+            run(path, f.read())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
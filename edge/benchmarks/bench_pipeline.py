@@ -0,0 +1,78 @@
+#============================================================================
+#
+# Filename:  bench_pipeline.py
+#
+# Purpose:   Push throughput against a simulated mangOH that answers after a
+#            fixed delay: one push then sleep(0.5), as orp_transmission did,
+#            against ORPClient with 1, 4 and 16 pushes in flight. The link is
+#            a pty loopback paced to the UART's baud rate.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_pipeline [pushes] [payload_bytes] [baud]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from modules.orp_client import ORPClient
+from modules.orp_protocol import build_push
+from benchmarks.ptylink import PtyLoopback
+from benchmarks.fake_mangoh import FakeMangOH
+
+RESPONSE_DELAY = 0.05
+IN_FLIGHT = [1, 4, 16]
+
+
+def sleep_after_send(link, payloads):
+    link.startReader(onFrame=lambda data: None)
+    start = time.time()
+    for data in payloads:
+        link.sendFrame(build_push('str', 'vps_shot', data))
+        time.sleep(0.5)
+    elapsed = time.time() - start
+    link.stopReader()
+    return elapsed
+
+
+def pipelined(in_flight):
+    def run(link, payloads):
+        client = ORPClient(link, max_in_flight=in_flight)
+        client.start()
+        start = time.time()
+        futures = [client.push('str', 'vps_shot', data) for data in payloads]
+        for f in futures:
+            f.result(30)
+        elapsed = time.time() - start
+        client.stop()
+        return elapsed
+    return run
+
+
+def main(pushes, size, baud):
+    logging.disable(logging.WARNING)
+    # one frame per push, plus room for the ORP header and path
+    simple_hdlc.MAX_FRAME_LENGTH = max(simple_hdlc.MAX_FRAME_LENGTH, size + 64)
+    payloads = [os.urandom(size // 2).hex().encode() for _ in range(pushes)]
+    print('%d pushes of %d bytes at %d baud, mangOH answers after %d ms' % (
+        pushes, size, baud, RESPONSE_DELAY * 1e3))
+    print('%-16s %10s %12s' % ('mode', 'pushes/s', 'answered'))
+    modes = [('send + sleep', sleep_after_send)] + [('%d in flight' % n, pipelined(n)) for n in IN_FLIGHT]
+    for name, run in modes:
+        loop = PtyLoopback(line_rate=baud)
+        mangoh = FakeMangOH(HDLC(loop.port_b), RESPONSE_DELAY)
+        elapsed = run(HDLC(loop.port_a), payloads)
+        mangoh.stop()
+        loop.close()
+        print('%-16s %10.2f %12d' % (name, pushes / elapsed, mangoh.requests))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 20, int(args[1]) if len(args) > 1 else 64,
+         int(args[2]) if len(args) > 2 else 9600)
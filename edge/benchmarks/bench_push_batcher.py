@@ -0,0 +1,77 @@
+#============================================================================
+#
+# Filename:  bench_push_batcher.py
+#
+# Purpose:   Packets and UART time for an hour of one temperature sensor
+#            sampled once a second (a slow random walk with noise), pushed
+#            one value per packet as the 't' test mode did, against
+#            PushBatcher with a few windows and deadbands. Wire bytes are
+#            HDLC framed, plus the 4 preamble bytes orp_transmission writes
+#            before every packet.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_push_batcher [seconds]
+#
+#----------------------------------------------------------------------------
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.orp_protocol as orp_protocol
+from modules.push_batcher import PushBatcher
+from modules.simple_hdlc import HDLC
+
+BAUD = 9600
+PREAMBLE = 4
+
+# (window seconds, deadband)
+CASES = [(10, None), (60, None), (60, 0.1), (60, 0.5)]
+
+
+def trace(seconds):
+    rng = random.Random(1)
+    level = 21.0
+    for t in range(seconds):
+        level += rng.gauss(0, 0.02)
+        yield t, round(level + rng.gauss(0, 0.05), 2)
+
+
+class Wire(object):
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+
+    def __call__(self, packet):
+        self.packets += 1
+        self.bytes += len(HDLC._encode(bytearray(packet))) + PREAMBLE
+
+
+def main(seconds):
+    samples = list(trace(seconds))
+    print('%d samples of temp, %d baud' % (len(samples), BAUD))
+    print('%-26s %8s %8s %10s %10s' % ('mode', 'sent', 'packets', 'wire', 'airtime'))
+
+    wire = Wire()
+    for t, value in samples:
+        wire(orp_protocol.build_push('num', 'temp', json.dumps(value)))
+    rows = [('one push per value', len(samples), wire)]
+
+    for window, deadband in CASES:
+        wire = Wire()
+        batcher = PushBatcher(wire, window=window, deadband=deadband)
+        for t, value in samples:
+            batcher.add('temp', value, ts=1600000000 + t)
+        batcher.flush()
+        stats = batcher.asDict()
+        rows.append(('%ds window, deadband %s' % (window, deadband), stats['values'] - stats['dropped'], wire))
+
+    for name, sent, wire in rows:
+        print('%-26s %8d %8d %8d B %8.1f s' % (
+            name, sent, wire.packets, wire.bytes, wire.bytes * 10.0 / BAUD))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3600)
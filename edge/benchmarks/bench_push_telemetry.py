@@ -0,0 +1,121 @@
+#============================================================================
+#
+# Filename:  bench_push_telemetry.py
+#
+# Purpose:   What PushTelemetry reports against what the pushes took, and
+#            what it costs. Pushes go over a pty loopback paced like the
+#            UART (LinkPacer) to a simulated mangOH that forwards at a fixed
+#            byte rate before answering (see fake_mangoh), a few at a time
+#            as orp_transmission sends them.
+#
+#            measured is the time from queueing a push to its answer, taken
+#            around client.send; telemetry is its total stage. The cost is
+#            per push for queued/onSent/answered, and per rewrite of the
+#            file with max_records records in the window.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_push_telemetry [pushes] [push_bytes]
+#
+#----------------------------------------------------------------------------
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from modules.orp_client import ORPClient
+from modules.orp_protocol import build_push
+from modules.link_pacer import LinkPacer
+from modules.push_telemetry import PushTelemetry, percentile
+from benchmarks.ptylink import PtyLoopback
+from benchmarks.fake_mangoh import FakeMangOH
+
+BAUD = 9600
+MANGOH_RATE = 600
+ROUNDS = 2000
+
+
+def run_link(pushes, size):
+    loop = PtyLoopback(line_rate=BAUD)
+    mangoh = FakeMangOH(HDLC(loop.port_b), rate=MANGOH_RATE)
+    pacer = LinkPacer(HDLC(loop.port_a), BAUD)
+    telemetry = PushTelemetry()
+    pacer.sent_callback = telemetry.onSent
+    client = ORPClient(pacer, max_in_flight=4, timeout=60)
+    client.start()
+    measured = []
+    futures = []
+    for i in range(pushes):
+        packet = build_push('str', 'vps_shot', b'A' * size)
+        start = time.time()
+        record = telemetry.queued(packet)
+        future = client.send(packet)
+        telemetry.track(record, future)
+        future.add_done_callback(lambda f, start=start: measured.append(time.time() - start))
+        futures.append(future)
+    for future in futures:
+        future.result(120)
+    client.stop()
+    mangoh.stop()
+    loop.close()
+    return sorted(measured), telemetry.asDict()
+
+
+def run_cost():
+    telemetry = PushTelemetry(max_records=1024)
+    packet = build_push('str', 'vps_shot', b'A' * 9400)
+    future = Future()
+    future.set_result(None)
+    start = time.time()
+    for i in range(ROUNDS):
+        record = telemetry.queued(packet)
+        telemetry.onSent(packet, start, start)
+        telemetry.answered(record, future)
+    per_push = (time.time() - start) / ROUNDS
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'push.prom')
+    start = time.time()
+    for i in range(100):
+        telemetry.write(path)
+    prom = (time.time() - start) / 100
+    with open(path) as f:
+        prom_size = len(f.read())
+    os.remove(path)
+    path = os.path.join(directory, 'push.json')
+    start = time.time()
+    for i in range(100):
+        telemetry.write(path)
+    js = (time.time() - start) / 100
+    os.remove(path)
+    os.rmdir(directory)
+    return per_push, prom, prom_size, js
+
+
+def main(pushes, size):
+    logging.disable(logging.WARNING)
+    simple_hdlc.MAX_FRAME_LENGTH = max(simple_hdlc.MAX_FRAME_LENGTH, size + 64)
+    print('%d pushes of %d bytes, %d baud, mangOH forwards %d B/s' % (pushes, size, BAUD, MANGOH_RATE))
+    measured, stats = run_link(pushes, size)
+    total = stats['seconds']['total']
+    print('%-10s %8s %8s %8s' % ('total', 'p50', 'p90', 'max'))
+    print('%-10s %6.2f s %6.2f s %6.2f s' % ('measured', percentile(measured, 0.5), percentile(measured, 0.9),
+                                            measured[-1]))
+    print('%-10s %6.2f s %6.2f s %6.2f s (p99)' % ('telemetry', total['p50'], total['p90'], total['p99']))
+    for name in ('queue', 'wire', 'answer'):
+        stage = stats['seconds'][name]
+        print('  %-8s %6.2f s %6.2f s %6.2f s' % (name, stage['p50'], stage['p90'], stage['p99']))
+    print('results %s, pending %d' % (json.dumps(stats['results']), stats['pending']))
+    per_push, prom, prom_size, js = run_cost()
+    print('\ncost: %.1f us per push; rewrite with 1024 records: .prom %.2f ms (%d bytes), .json %.2f ms' % (
+        per_push * 1e6, prom * 1e3, prom_size, js * 1e3))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 12, int(args[1]) if len(args) > 1 else 600)
@@ -0,0 +1,95 @@
+#============================================================================
+#
+# Filename:  bench_reader.py
+#
+# Purpose:   Measure what the HDLC receive path costs while the link is idle,
+#            and how long it takes from a frame's closing flag arriving on
+#            the serial port until frame_callback / readFrame returns it.
+#            Runs over a pty, so no hardware is needed.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_reader [idle_seconds] [frames]
+#
+#----------------------------------------------------------------------------
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.simple_hdlc import HDLC
+from benchmarks.ptylink import open_pty_serial, write_all
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def idle_cpu(h, seconds):
+    h.startReader(onFrame=lambda frame: None)
+    time.sleep(0.2)
+    wall, cpu = time.time(), time.process_time()
+    time.sleep(seconds)
+    usage = (time.process_time() - cpu) / (time.time() - wall)
+    h.stopReader()
+    return usage
+
+
+def callback_latency(master, h, frames):
+    got = threading.Event()
+    stamps = []
+
+    def on_frame(frame):
+        stamps.append(time.perf_counter())
+        got.set()
+
+    h.startReader(onFrame=on_frame)
+    frame = HDLC._encode(bytearray(b'p@\x00\x01'))
+    latencies = []
+    for _ in range(frames):
+        got.clear()
+        t0 = time.perf_counter()
+        write_all(master, frame)
+        got.wait(5)
+        latencies.append(stamps[-1] - t0)
+        time.sleep(0.002)
+    h.stopReader()
+    return latencies
+
+
+def readframe_latency(master, h, frames):
+    frame = HDLC._encode(bytearray(b'p@\x00\x01'))
+    stamps = []
+
+    def delayed_write():
+        time.sleep(0.005)
+        stamps.append(time.perf_counter())
+        write_all(master, frame)
+
+    latencies = []
+    for _ in range(frames):
+        writer = threading.Thread(target=delayed_write)
+        writer.start()
+        h.readFrame()
+        latencies.append(time.perf_counter() - stamps[-1])
+        writer.join()
+    return latencies
+
+
+def main(idle_seconds, frames):
+    master, port = open_pty_serial()
+    h = HDLC(port)
+    print('idle reader cpu      : %.2f%% of one core' % (idle_cpu(h, idle_seconds) * 100))
+    for name, fn in (('frame_callback', callback_latency), ('readFrame', readframe_latency)):
+        lat = fn(master, h, frames)
+        print('%-20s : p50 %.3f ms  p99 %.3f ms  max %.3f ms' % (
+            name + ' latency', percentile(lat, 50) * 1e3, percentile(lat, 99) * 1e3, max(lat) * 1e3))
+    port.close()
+    os.close(master)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(float(args[0]) if args else 5.0, int(args[1]) if len(args) > 1 else 200)
@@ -0,0 +1,62 @@
+#============================================================================
+#
+# Filename:  bench_rx_alloc.py
+#
+# Purpose:   Count what receiving one HDLC frame allocates. Frames are written
+#            into a pty and read back through HDLC on the serial side; for
+#            each frame tracemalloc reports the number of new allocations
+#            still alive and the transient peak, the latter in multiples of
+#            the frame size ("copies" of the payload held at once).
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_rx_alloc [payload_bytes ...]
+#
+#----------------------------------------------------------------------------
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.simple_hdlc import MAX_FRAME_LENGTH, HDLC
+from benchmarks.ptylink import open_pty_serial, write_all
+
+FRAMES = 50
+
+
+def measure(h, master, frame):
+    peaks = []
+    blocks = []
+    for _ in range(FRAMES):
+        write_all(master, frame)
+        h._waitReadable(1.0)
+        snap = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        while not h._readAvailable():
+            h._waitReadable(1.0)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        diff = tracemalloc.take_snapshot().compare_to(snap, 'filename')
+        blocks.append(sum(max(0, d.count_diff) for d in diff
+                          if d.traceback[0].filename.endswith('simple_hdlc.py')))
+    return sorted(peaks)[len(peaks) // 2], sorted(blocks)[len(blocks) // 2]
+
+
+def main(sizes):
+    master, port = open_pty_serial()
+    h = HDLC(port)
+    h.frame_callback = lambda frame: None
+    tracemalloc.start()
+    print('%10s %16s %12s %14s' % ('bytes', 'peak transient', 'copies', 'live allocs'))
+    for size in sizes:
+        frame = HDLC._encode(bytearray(os.urandom(size)))
+        peak, blocks = measure(h, master, frame)
+        print('%10d %14d B %12.2f %14d' % (size, peak, peak / float(size), blocks))
+    tracemalloc.stop()
+    port.close()
+    os.close(master)
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [64, 256, MAX_FRAME_LENGTH - 2])
@@ -0,0 +1,202 @@
+#============================================================================
+#
+# Filename:  bench_spool.py
+#
+# Purpose:   Captures delivered and lost under bursty detection, with the
+#            single encoded_string.txt against the CaptureSpool, over a pty
+#            loopback paced like the UART and a simulated mangOH that
+#            forwards at a fixed byte rate (see fake_mangoh).
+#
+#            The detector stand-in writes bursts of captures, each with a
+#            random confidence, faster than the link can push them. The
+#            sender is orp_transmission's loop: FileWatcher on the file, or
+#            claim/push/done on the spool. Halfway through, the sender is
+#            restarted, dropping whatever it had in flight.
+#
+#            delivered counts captures the mangOH answered, conf their
+#            average confidence, latency the time from capture to answer.
+#            The spool runs without limits and with max_count 6, where the
+#            order decides which captures are evicted.
+#
+#            Run from the edge/ directory:
+#                python3 -m benchmarks.bench_spool [bursts] [burst_size] [capture_bytes]
+#
+#----------------------------------------------------------------------------
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.simple_hdlc as simple_hdlc
+from modules.simple_hdlc import HDLC
+from modules.orp_client import ORPClient
+from modules.file_watcher import FileWatcher
+from modules.capture_spool import CaptureSpool
+from benchmarks.ptylink import PtyLoopback
+from benchmarks.fake_mangoh import FakeMangOH
+
+BAUD = 38400
+MANGOH_RATE = 3000
+BURST_GAP = 0.15
+BURST_INTERVAL = 4.0
+TIMEOUT = 10.0
+DRAIN = 60.0
+
+# (name, spool order or None for encoded_string.txt, spool max_count)
+MODES = [
+    ('single file', None, None),
+    ('spool newest', 'newest', None),
+    ('spool priority', 'priority', None),
+    ('spool newest, max 6', 'newest', 6),
+    ('spool priority, max 6', 'priority', 6),
+]
+
+
+class Sender(object):
+    # orp_transmission's capture loop, stoppable
+    def __init__(self, client, capture_path=None, spool=None):
+        self.client = client
+        self.capture_path = capture_path
+        self.spool = spool
+        self.running = True
+        self.delivered = {}
+        self.thread = threading.Thread(target=self._spoolLoop if spool else self._fileLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _answered(self, future, data):
+        if future.exception() is None:
+            self.delivered[int(data[:8])] = time.time()
+
+    def _push(self, data):
+        future = self.client.push('str', 'vps_shot', data)
+        future.add_done_callback(lambda f: self._answered(f, data))
+        return future
+
+    def _fileLoop(self):
+        watcher = FileWatcher(self.capture_path)
+        while self.running:
+            if not watcher.wait(0.2):
+                continue
+            with open(self.capture_path, 'rb') as f:
+                self._push(f.read())
+        watcher.close()
+
+    def _spoolLoop(self):
+        watcher = FileWatcher(self.spool.index_path)
+        while self.running:
+            entry = self.spool.claim()
+            if entry is None:
+                watcher.wait(0.2)
+                continue
+            data = self.spool.read(entry)
+            if data is None:
+                self.spool.done(entry['id'], ok=False)
+                continue
+            future = self._push(data)
+            future.add_done_callback(lambda f, capture_id=entry['id']: self.spool.done(capture_id, f.exception() is None))
+        watcher.close()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+def write_file(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def run(mode, bursts, burst_size, size):
+    _, spool_order, max_count = mode
+    directory = tempfile.mkdtemp()
+    capture_path = os.path.join(directory, 'encoded_string.txt')
+    loop = PtyLoopback(line_rate=BAUD)
+    mangoh = FakeMangOH(HDLC(loop.port_b), rate=MANGOH_RATE, buffer=4 * size)
+    link = HDLC(loop.port_a)
+
+    def start_sender():
+        client = ORPClient(link, max_in_flight=4, timeout=TIMEOUT)
+        client.start()
+        spool = None
+        if spool_order:
+            spool = CaptureSpool(os.path.join(directory, 'spool'), order=spool_order, max_count=max_count)
+        return client, Sender(client, capture_path, spool)
+
+    client, sender = start_sender()
+    delivered = {}
+    made = {}
+    rnd = random.Random(1)
+    detector_spool = None
+    if spool_order:
+        detector_spool = CaptureSpool(os.path.join(directory, 'spool'), max_count=max_count)
+    start = time.time()
+    for burst in range(bursts):
+        if burst == bursts // 2:
+            # restart the sender: what it had in flight is lost with it
+            sender.stop()
+            client.stop()
+            delivered.update(sender.delivered)
+            client, sender = start_sender()
+        for i in range(burst_size):
+            index = len(made)
+            confidence = rnd.randint(70, 99)
+            made[index] = (time.time(), confidence)
+            data = b'%08d' % index + b'A' * (size - 8)
+            if detector_spool is not None:
+                detector_spool.put(data, priority=confidence)
+            else:
+                write_file(capture_path, data)
+            time.sleep(BURST_GAP)
+        time.sleep(BURST_INTERVAL)
+
+    # let the sender drain what it still can
+    deadline = time.time() + DRAIN
+    while time.time() < deadline and (client.pending or (sender.spool and len(sender.spool))):
+        time.sleep(0.1)
+    sender.stop()
+    client.stop()
+    delivered.update(sender.delivered)
+    elapsed = time.time() - start
+    mangoh.stop()
+    loop.close()
+    shutil.rmtree(directory)
+
+    latencies = sorted(delivered[i] - made[i][0] for i in delivered)
+    all_conf = [c for t, c in made.values()]
+    got_conf = [made[i][1] for i in delivered]
+    return {
+        'made': len(made),
+        'delivered': len(delivered),
+        'conf': sum(got_conf) / float(len(got_conf)) if got_conf else 0,
+        'all_conf': sum(all_conf) / float(len(all_conf)),
+        'p50': latencies[len(latencies) // 2] if latencies else 0,
+        'max': latencies[-1] if latencies else 0,
+        'elapsed': elapsed,
+    }
+
+
+def main(bursts, burst_size, size):
+    logging.disable(logging.WARNING)
+    simple_hdlc.MAX_FRAME_LENGTH = max(simple_hdlc.MAX_FRAME_LENGTH, size + 64)
+    print('%d bursts of %d captures of %d bytes, %.2f s apart, every %.0f s; %d baud, mangOH %d B/s' % (
+        bursts, burst_size, size, BURST_GAP, BURST_INTERVAL, BAUD, MANGOH_RATE))
+    print('%-22s %10s %6s %8s %8s %8s' % ('sender', 'delivered', 'conf', 'p50', 'max', 'time'))
+    for mode in MODES:
+        r = run(mode, bursts, burst_size, size)
+        print('%-22s %6d/%-3d %6.1f %6.1f s %6.1f s %6.1f s' % (
+            mode[0], r['delivered'], r['made'], r['conf'], r['p50'], r['max'], r['elapsed']))
+    print('(average confidence of all captures: %.1f)' % r['all_conf'])
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 4, int(args[1]) if len(args) > 1 else 8,
+         int(args[2]) if len(args) > 2 else 2000)
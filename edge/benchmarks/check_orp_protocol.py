@@ -0,0 +1,333 @@
+#============================================================================
+#
+# Filename:  check_orp_protocol.py
+#
+# Purpose:   Regression check for orp_protocol, in three parts:
+#
+#              - round trips: random packets of every type in ptypes, built
+#                and decoded again, must give back what went in; so must
+#                random text requests through encode_request
+#              - fuzzing: random, truncated and bit-flipped packets must
+#                decode or raise ValueError (too short), random text
+#                requests must encode or return None, nothing else
+#              - the corpus: the frames in orp_corpus.jsonl must decode to
+#                the dicts recorded next to them
+#
+#            and then times encode_request and decode_response (prints to
+#            /dev/null), writing the results as JSON so runs can be compared
+#            across commits:
+#
+#                python3 -m benchmarks.check_orp_protocol -o before.json
+#                (change something)
+#                python3 -m benchmarks.check_orp_protocol -c before.json
+#
+#            The exit status is 1 if any check failed, or with --compare if
+#            any timing got slower by more than --threshold. Runs are seeded
+#            (--seed) so a failure can be repeated.
+#
+#            Run from the edge/ directory.
+#
+#----------------------------------------------------------------------------
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.orp_protocol as orp_protocol
+from modules.orp_protocol import decode_packet, decode_response, encode_request, ORP_HEADER
+from benchmarks.bench_hdlc_suite import git_commit
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'orp_corpus.jsonl')
+
+ROUND_TRIPS = 2000
+FUZZ_CASES = 20000
+
+# path, timestamp and units text: anything but the separator
+TEXT = 'abcxyz019_-./:@ '
+SYNC_TYPES = (orp_protocol.ORP_PKT_SYNC_SYN, orp_protocol.ORP_PKT_SYNC_SYNACK)
+
+# name -> (function, argument); decode_response gets a memoryview like HDLC passes
+TIMINGS = [
+    ('encode push num', encode_request, 'push num vps/temp 1700000000 21.5'),
+    ('encode push json', encode_request, 'push json vps/data 0 {"object":"HU","confidence":99}'),
+    ('encode create', encode_request, 'create input json vps/data'),
+    ('decode push ack', decode_response, memoryview(bytearray(b'p@\x00\x0c'))),
+    ('decode sync', decode_response, memoryview(bytearray(b'Y\x01\x00\x00S42,R17'))),
+    ('decode handler call', decode_response,
+     memoryview(bytearray(b'c@\x01\x00Pvps/cmd,T1700000000,D{"mode":"fast"}'))),
+    ('decode 1 kB data', decode_response, memoryview(bytearray(b'c@\x01\x00Pvps/shot,D' + b'A' * 1024))),
+]
+
+
+@contextlib.contextmanager
+def quiet():
+    # the text parsers and decode_response print
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def random_text(rnd, empty=False):
+    return ''.join(rnd.choice(TEXT) for _ in range(rnd.randint(0 if empty else 1, 12)))
+
+
+#
+# Round trips
+#
+def random_packet(rnd, ptype):
+    # A packet of type ptype built field by field, and the fields it carries
+    seq = rnd.randrange(0x10000)
+    fields = {}
+    parts = [None]
+    if ptype in SYNC_TYPES:
+        second = chr(rnd.randrange(0x20))
+        for field_id, name in (('S', 'sent'), ('R', 'received')):
+            if rnd.random() < 0.8:
+                fields[name] = str(rnd.randrange(0x10000))
+                parts += ((',' if len(parts) > 1 else '') + field_id, fields[name])
+    else:
+        status = rnd.randrange(len(orp_protocol.status_list))
+        second = chr(64 + status)
+        fields['status'] = orp_protocol.status_list[status]
+        for field_id, name in (('P', 'path'), ('T', 'timestamp'), ('U', 'units')):
+            if rnd.random() < 0.6:
+                fields[name] = random_text(rnd, empty=True)
+                parts += ((',' if len(parts) > 1 else '') + field_id, fields[name])
+        if rnd.random() < 0.6:
+            # data runs to the end, separators and all
+            fields['data'] = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 40)))
+            parts += ((',' if len(parts) > 1 else '') + 'D', fields['data'])
+    parts = [None] + [orp_protocol.to_bytes(p) for p in parts[1:]]
+    return orp_protocol.build_packet(ptype, second, parts, seq), seq, fields
+
+
+def check_round_trips(rnd, count):
+    failures = []
+    for i in range(count):
+        ptype = rnd.choice(orp_protocol.ptypes)[0]
+        packet, seq, fields = random_packet(rnd, ptype)
+        decoded = decode_packet(bytearray(packet))
+        got = {'ptype': decoded.ptype, 'sequence': decoded.sequence}
+        want = {'ptype': ptype, 'sequence': seq}
+        for name in fields:
+            value = getattr(decoded, name)
+            got[name] = bytes(value) if name == 'data' else value
+            want[name] = fields[name]
+        if got != want:
+            failures.append('round trip %r: %r != %r' % (packet, got, want))
+    return failures
+
+
+def random_request(rnd):
+    # A valid text request and the fields its packet must carry
+    path = random_text(rnd).replace(' ', '_')
+    kind = rnd.choice(['create', 'delete', 'add', 'push', 'get', 'example'])
+    if kind == 'create':
+        what, ptype = rnd.choice([('input', 'I'), ('output', 'O'), ('sensor', 'S')])
+        data_type = rnd.choice(orp_protocol.data_types)
+        units = random_text(rnd) if rnd.random() < 0.5 else None
+        request = 'create %s %s %s' % (what, data_type[0], path) + (' ' + units if units else '')
+        return request, {'ptype': ptype, 'path': path, 'units': units}
+    if kind == 'delete':
+        what, ptype = rnd.choice([('resource', 'D'), ('handler', 'K'), ('sensor', 'R')])
+        return 'delete %s %s' % (what, path), {'ptype': ptype, 'path': path}
+    if kind == 'add':
+        return 'add handler ' + path, {'ptype': 'H', 'path': path}
+    if kind == 'get':
+        return 'get ' + path, {'ptype': 'G', 'path': path}
+    data = random_text(rnd).strip() or 'x'
+    if kind == 'example':
+        return 'example json %s %s' % (path, data), {'ptype': 'E', 'path': path, 'data': data.encode()}
+    ts = rnd.choice(['0', str(rnd.randint(1, 2000000000))])
+    return ('push %s %s %s %s' % (rnd.choice(['num', 'str', 'json']), path, ts, data),
+            {'ptype': 'P', 'path': path, 'timestamp': ts if ts != '0' else None, 'data': data.encode()})
+
+
+def check_requests(rnd, count):
+    failures = []
+    for i in range(count):
+        request, want = random_request(rnd)
+        try:
+            with quiet():
+                packet = encode_request(request)
+        except Exception as e:
+            failures.append('request %r: %s: %s' % (request, type(e).__name__, e))
+            continue
+        if packet is None:
+            failures.append('request %r: not encoded' % request)
+            continue
+        decoded = decode_packet(packet)
+        got = dict((name, getattr(decoded, name)) for name in want)
+        if got.get('data') is not None:
+            got['data'] = bytes(got['data'])
+        if got != want:
+            failures.append('request %r: %r != %r' % (request, got, want))
+    return failures
+
+
+#
+# Fuzzing
+#
+def mutate(rnd, packet):
+    packet = bytearray(packet)
+    how = rnd.randrange(3)
+    if how == 0 and packet:
+        del packet[rnd.randrange(len(packet)):]
+    elif how == 1 and packet:
+        for _ in range(rnd.randint(1, 4)):
+            packet[rnd.randrange(len(packet))] ^= 1 << rnd.randrange(8)
+    else:
+        packet[rnd.randint(0, len(packet)):0] = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(1, 8)))
+    return packet
+
+
+def fuzz_decode(rnd, count):
+    failures = []
+    for i in range(count):
+        if i % 2:
+            packet = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 24)))
+        else:
+            packet = mutate(rnd, random_packet(rnd, rnd.choice(orp_protocol.ptypes)[0])[0])
+        try:
+            with quiet():
+                decode_response(memoryview(bytearray(packet)))
+        except ValueError:
+            if len(packet) >= ORP_HEADER.size:
+                failures.append('decode %r: ValueError' % bytes(packet))
+        except Exception as e:
+            failures.append('decode %r: %s: %s' % (bytes(packet), type(e).__name__, e))
+    return failures
+
+
+def fuzz_requests(rnd, count):
+    words = ['create', 'delete', 'add', 'push', 'get', 'example', 'reply', 'send', 'x', '',
+             'input', 'output', 'sensor', 'resource', 'handler', 'trig', 'bool', 'num', 'str', 'json',
+             'y', 'B', 'C', '0', '1700000000', 'vps/data', '@', '"x"', "b'\\x01'", '{"a":1}', 'file://']
+    failures = []
+    for i in range(count):
+        request = ' '.join(rnd.choice(words) for _ in range(rnd.randint(0, 7)))
+        try:
+            with quiet():
+                encode_request(request)
+        except Exception as e:
+            failures.append('request %r: %s: %s' % (request, type(e).__name__, e))
+    return failures
+
+
+#
+# Corpus
+#
+def check_corpus(path):
+    failures = []
+    count = 0
+    with open(path) as f:
+        for line in f:
+            case = json.loads(line)
+            count += 1
+            frame = memoryview(bytearray.fromhex(case['frame']))
+            try:
+                with quiet():
+                    got = decode_response(frame)
+            except ValueError:
+                got = None
+                if case.get('error') != 'ValueError':
+                    failures.append('corpus %s: ValueError' % case['name'])
+            if got is not None and got != case.get('expect'):
+                failures.append('corpus %s: %r != %r' % (case['name'], got, case.get('expect')))
+    return count, failures
+
+
+#
+# Timings
+#
+def time_calls(fn, arg):
+    number = 5000
+    with quiet():
+        best = min(timeit.repeat(lambda: fn(arg), number=number, repeat=5))
+    return best / number * 1e6
+
+
+def compare(results, baseline, threshold):
+    base = dict((r['name'], r) for r in baseline['results'])
+    worse = 0
+    print('\ncompared with %s (%s)' % (baseline['meta'].get('commit'), baseline['meta'].get('date')))
+    for r in results:
+        b = base.get(r['name'])
+        if b is None:
+            continue
+        change = r['us_per_call'] / b['us_per_call'] - 1.0
+        regressed = change > threshold
+        worse += regressed
+        print('%-20s %6.2f -> %6.2f us %+5.0f%%%s' % (
+            r['name'], b['us_per_call'], r['us_per_call'], change * 100, ' REGRESSED' if regressed else ''))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='orp_protocol round trips, fuzzing, corpus and timings')
+    parser.add_argument('-o', '--output', help='write timings as JSON to this file')
+    parser.add_argument('-c', '--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('-t', '--threshold', type=float, default=0.25,
+                        help='relative slowdown that counts as a regression (default 0.25)')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='random seed (default from the time)')
+    parser.add_argument('-n', '--cases', type=float, default=1.0, help='scale the number of random cases')
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else int(time.time())
+    rnd = random.Random(seed)
+    failures = []
+    for name, check, count in (('round trips', check_round_trips, ROUND_TRIPS),
+                               ('text requests', check_requests, ROUND_TRIPS),
+                               ('decode fuzz', fuzz_decode, FUZZ_CASES),
+                               ('request fuzz', fuzz_requests, FUZZ_CASES)):
+        count = max(1, int(count * args.cases))
+        found = check(rnd, count)
+        print('%-14s %6d cases %5d failed' % (name, count, len(found)))
+        failures += found
+    count, found = check_corpus(CORPUS)
+    print('%-14s %6d cases %5d failed' % ('corpus', count, len(found)))
+    failures += found
+    for failure in failures[:20]:
+        print('  ' + failure)
+    if failures:
+        print('seed %d' % seed)
+
+    print('\n%-20s %10s' % ('call', 'us/call'))
+    results = []
+    for name, fn, arg in TIMINGS:
+        results.append({'name': name, 'us_per_call': time_calls(fn, arg)})
+        print('%-20s %10.2f' % (name, results[-1]['us_per_call']))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    worse = 0
+    if args.compare:
+        with open(args.compare) as f:
+            worse = compare(results, json.load(f), args.threshold)
+    if failures or worse:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
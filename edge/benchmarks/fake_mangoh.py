@@ -0,0 +1,125 @@
+#============================================================================
+#
+# Filename:  fake_mangoh.py
+#
+# Purpose:   Minimal stand-in for the mangOH end of the ORP link, for the
+#            benchmarks: answers every request with its response type,
+#            status OK and the request's sequence number, after a fixed
+#            processing delay.
+#
+#            With a rate it also stands in for the mangOH's uplink: requests
+#            are forwarded one at a time at that many bytes per second and
+#            answered when done. Requests that do not fit in the buffer
+#            behind them are lost, as on a UART overrun: never counted as
+#            received, never answered. With sync_interval it sends a SYNC
+#            carrying its sent/received counters, since it started, that
+#            often.
+#
+#----------------------------------------------------------------------------
+import collections
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.orp_protocol import ORP_HEADER, ORP_PKT_SYNC_SYN
+
+# response type byte for each request type byte
+RESPONSES = dict((ord(rq), ord(rs)) for rq, rs in zip('IODHKPGES', 'iodhkpges'))
+RESPONSES[ord('R')] = ord('r')
+
+STATUS_OK = ord('@')
+
+
+class FakeMangOH(object):
+    def __init__(self, hdlc, delay=0.0, rate=None, buffer=None, sync_interval=None):
+        self.hdlc = hdlc
+        self.delay = delay
+        self.rate = rate
+        self.buffer = buffer
+        self.requests = 0
+        self.bytes = 0
+        self.dropped = 0
+        # frames each way since it started
+        self.sent = 0
+        self.received = 0
+        self.lock = threading.Condition()
+        self.queue = collections.deque()
+        self.queued = 0
+        self.running = True
+        self.stopped = threading.Event()
+        self.threads = []
+        if rate:
+            self._spawn(self._forwardLoop)
+        if sync_interval:
+            self._spawn(self._syncLoop, sync_interval)
+        hdlc.startReader(onFrame=self._onFrame)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def _send(self, frame):
+        with self.lock:
+            self.sent += 1
+        self.hdlc.sendFrame(frame)
+
+    def _onFrame(self, data):
+        ptype, _, seq = ORP_HEADER.unpack_from(data)
+        with self.lock:
+            if self.buffer is not None and self.queued + len(data) > self.buffer:
+                self.dropped += 1
+                return
+            self.received += 1
+        response = RESPONSES.get(ptype)
+        if response is None:
+            return
+        with self.lock:
+            self.requests += 1
+            self.bytes += len(data)
+        reply = ORP_HEADER.pack(response, STATUS_OK, seq)
+        if self.rate:
+            with self.lock:
+                self.queue.append((len(data), reply))
+                self.queued += len(data)
+                self.lock.notify_all()
+        elif self.delay:
+            # answer from a timer so requests behind this one are not held up
+            timer = threading.Timer(self.delay, self._send, (reply,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._send(reply)
+
+    def _forwardLoop(self):
+        while True:
+            with self.lock:
+                while self.running and not self.queue:
+                    self.lock.wait()
+                if not self.running:
+                    return
+                size, reply = self.queue[0]
+            time.sleep(size / float(self.rate))
+            with self.lock:
+                self.queue.popleft()
+                self.queued -= size
+            self._send(reply)
+
+    def _syncLoop(self, interval):
+        while not self.stopped.wait(interval):
+            with self.lock:
+                counters = ('S%d,R%d' % (self.sent, self.received)).encode('ascii')
+            self.hdlc.sendFrame(ORP_HEADER.pack(ord(ORP_PKT_SYNC_SYN), ord('1'), 0) + counters)
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.hdlc.stopReader()
@@ -0,0 +1,130 @@
+#============================================================================
+#
+# Filename:  ptylink.py
+#
+# Purpose:   Pseudo-terminal helpers so simple_hdlc can be exercised through a
+#            real pyserial port without the mangOH attached.
+#
+#----------------------------------------------------------------------------
+import math
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+import serial
+
+
+#
+# Open a pty pair and return (master_fd, serial.Serial on the slave side).
+# Whatever is written to master_fd shows up on the serial port and vice versa.
+#
+def open_pty_serial(baudrate=9600, **kwargs):
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    port = serial.Serial(port=os.ttyname(slave), baudrate=baudrate, **kwargs)
+    # pyserial opened its own descriptor for the slave
+    os.close(slave)
+    return master, port
+
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        n = os.write(fd, view)
+        view = view[n:]
+
+
+#
+# Two serial ports joined by a relay thread that copies bytes between them,
+# flipping each bit with probability bit_error_rate on the way. With
+# line_rate set, each direction is paced to that many bits per second at
+# 8N1 (10 bits a byte) like a real UART; the rest waits in the pty, so the
+# writer sees the same backpressure. Otherwise bytes go through as fast as
+# the relay can copy them.
+#
+class PtyLoopback(object):
+    # Most bytes moved per read when paced, 10 ms of line time
+    PACE_INTERVAL = 0.01
+
+    def __init__(self, bit_error_rate=0.0, baudrate=9600, seed=None, line_rate=None):
+        self.bit_error_rate = bit_error_rate
+        self.line_rate = line_rate
+        self.random = random.Random(seed)
+        self.master_a, self.port_a = open_pty_serial(baudrate)
+        self.master_b, self.port_b = open_pty_serial(baudrate)
+        self.bit_errors = 0
+        self.bytes_relayed = 0
+        self.last_activity = time.time()
+        # CPU time spent in the relay thread, so benchmarks can leave it out
+        self.relay_cpu = 0.0
+        self.running = True
+        self.next_error = self._gap()
+        self.relay = threading.Thread(target=self._relayLoop)
+        self.relay.daemon = True
+        self.relay.start()
+
+    def _gap(self):
+        # bits until the next error: geometric with p = bit_error_rate
+        if self.bit_error_rate <= 0:
+            return float('inf')
+        return int(math.log(1.0 - self.random.random()) / math.log(1.0 - self.bit_error_rate))
+
+    def _corrupt(self, data):
+        bits = len(data) * 8
+        if self.next_error >= bits:
+            self.next_error -= bits
+            return data
+        data = bytearray(data)
+        pos = self.next_error
+        while pos < bits:
+            data[pos // 8] ^= 1 << (pos % 8)
+            self.bit_errors += 1
+            pos += 1 + self._gap()
+        self.next_error = pos - bits
+        return data
+
+    def _relayLoop(self):
+        try:
+            self._relay()
+        finally:
+            self.relay_cpu = time.thread_time()
+
+    def _relay(self):
+        peer = {self.master_a: self.master_b, self.master_b: self.master_a}
+        # when each direction's line is free again
+        free = dict.fromkeys(peer, 0.0)
+        chunk = 4096
+        if self.line_rate:
+            chunk = max(1, int(self.line_rate / 10.0 * self.PACE_INTERVAL))
+        while self.running:
+            now = time.time()
+            idle = [fd for fd in peer if free[fd] <= now]
+            timeout = 0.1
+            if len(idle) < len(peer):
+                timeout = min(timeout, min(free.values()) - now)
+            ready, _, _ = select.select(idle, [], [], max(timeout, 0))
+            for fd in ready:
+                try:
+                    data = os.read(fd, chunk)
+                except OSError:
+                    return
+                now = time.time()
+                if self.line_rate:
+                    free[fd] = max(free[fd], now) + len(data) * 10.0 / self.line_rate
+                self.bytes_relayed += len(data)
+                self.last_activity = now
+                write_all(peer[fd], self._corrupt(data))
+            self.relay_cpu = time.thread_time()
+
+    def close(self):
+        self.running = False
+        self.relay.join()
+        for port in (self.port_a, self.port_b):
+            port.close()
+        for fd in (self.master_a, self.master_b):
+            os.close(fd)
@@ -0,0 +1,259 @@
+#============================================================================
+#
+# Filename:  capture_ipc.py
+#
+# Purpose:   Hands captures from the detector to orp_transmission over a
+#            Unix domain socket, without writing them to the SD card and
+#            reading them back.
+#
+#                receiver = CaptureReceiver('/tmp/vps_capture.sock')   # orp_transmission
+#                receiver.start()
+#                capture = receiver.get()        # capture.data, capture.meta
+#
+#                ipc = CaptureSender('/tmp/vps_capture.sock')          # detector
+#                if not ipc.send(jpg_as_text, score=0.92, box=[...]):
+#                    createfile()                # nobody listening: the file
+#
+#            Message: magic 'VC'[2] meta_length[2] data_length[4] meta[]
+#            data[], meta being JSON (score, ts, box, label, ...). The
+#            receiver reads messages as they come into a queue of at most
+#            max_queue captures; when it is full, the lowest scored one
+#            (the oldest among equals) is dropped.
+#
+#            send() never blocks the detector for long: if there is no
+#            receiver, or a message cannot be written within timeout, it
+#            returns False and the caller falls back to the file or spool.
+#            After a failure it only tries to connect again after
+#            retry_interval.
+#
+#----------------------------------------------------------------------------
+import json
+import logging
+import os
+import select
+import socket
+import struct
+import time
+from threading import Condition, Thread
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VC'
+MESSAGE_HEADER = struct.Struct('>2sHI')
+MAX_META = 0xFFFF
+MAX_DATA = 16 * 1024 * 1024
+
+
+def available():
+    # Unix domain sockets: not on Windows
+    return hasattr(socket, 'AF_UNIX')
+
+
+def encode_message(data, meta):
+    meta = json.dumps(meta, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    if len(meta) > MAX_META or len(data) > MAX_DATA:
+        raise ValueError('capture too large: %d bytes of metadata, %d of data' % (len(meta), len(data)))
+    return MESSAGE_HEADER.pack(MAGIC, len(meta), len(data)) + meta
+
+
+def recv_exact(sock, size):
+    # size bytes from sock, or None if it closed first
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:], size - pos)
+        if not n:
+            return None
+        pos += n
+    return buf
+
+
+class Capture(object):
+    __slots__ = ('data', 'meta', 'received')
+
+    def __init__(self, data, meta, received):
+        self.data = data
+        self.meta = meta
+        self.received = received
+
+    @property
+    def score(self):
+        score = self.meta.get('score')
+        return score if isinstance(score, (int, float)) else 0
+
+
+class CaptureReceiver(object):
+    MAX_QUEUE = 8
+    # how long the accept and read loops block before rechecking self.running
+    POLL_TIMEOUT = 0.5
+
+    def __init__(self, path, max_queue=None):
+        self.path = path
+        self.max_queue = max_queue or self.MAX_QUEUE
+        self.cond = Condition()
+        self.queue = []
+        self.running = False
+        self.sock = None
+        self.threads = []
+        self.received = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.errors = 0
+        self.connections = 0
+
+    def start(self):
+        if os.path.exists(self.path):
+            # left over from an earlier run
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(2)
+        self.running = True
+        self._spawn(self._acceptLoop)
+
+    def _spawn(self, target, *args):
+        thread = Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def _acceptLoop(self):
+        while self.running:
+            if not select.select([self.sock], [], [], self.POLL_TIMEOUT)[0]:
+                continue
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                continue
+            self.connections += 1
+            self._spawn(self._readLoop, conn)
+
+    def _readLoop(self, conn):
+        try:
+            while self.running:
+                if not select.select([conn], [], [], self.POLL_TIMEOUT)[0]:
+                    continue
+                header = recv_exact(conn, MESSAGE_HEADER.size)
+                if header is None:
+                    return
+                magic, meta_length, data_length = MESSAGE_HEADER.unpack(bytes(header))
+                if magic != MAGIC or data_length > MAX_DATA:
+                    raise ValueError('bad capture message header %r' % bytes(header))
+                meta = recv_exact(conn, meta_length)
+                data = recv_exact(conn, data_length)
+                if meta is None or data is None:
+                    raise ValueError('connection closed mid-message')
+                self._put(Capture(bytes(data), json.loads(meta.decode('utf-8')), time.time()))
+        except (socket.error, ValueError) as e:
+            self.errors += 1
+            logger.warning("capture connection dropped: %s", e)
+        finally:
+            conn.close()
+
+    def _put(self, capture):
+        with self.cond:
+            self.received += 1
+            self.bytes += len(capture.data)
+            self.queue.append(capture)
+            if len(self.queue) > self.max_queue:
+                # lowest score goes; the oldest of those, min() takes the first
+                self.queue.remove(min(self.queue, key=lambda c: c.score))
+                self.dropped += 1
+            self.cond.notify_all()
+
+    def get(self, timeout=None):
+        # The oldest queued capture, or None after timeout seconds
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while not self.queue:
+                left = None if deadline is None else deadline - time.time()
+                if (left is not None and left <= 0) or not self.running:
+                    return None
+                self.cond.wait(left)
+            return self.queue.pop(0)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def asDict(self):
+        with self.cond:
+            return {
+                'received': self.received,
+                'bytes': self.bytes,
+                'queued': len(self.queue),
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'connections': self.connections,
+            }
+
+
+class CaptureSender(object):
+    TIMEOUT = 1.0
+    RETRY_INTERVAL = 5.0
+
+    def __init__(self, path, timeout=None, retry_interval=None):
+        self.path = path
+        self.timeout = timeout or self.TIMEOUT
+        self.retry_interval = self.RETRY_INTERVAL if retry_interval is None else retry_interval
+        self.sock = None
+        self.next_try = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def send(self, data, **meta):
+        # data: the capture (bytes); meta: anything JSON, e.g. score, ts,
+        # box, label. True once it is written to the socket.
+        if not available():
+            return False
+        meta.setdefault('ts', time.time())
+        header = encode_message(data, meta)
+        for attempt in range(2):
+            fresh = self.sock is None
+            if fresh:
+                if time.time() < self.next_try:
+                    break
+                try:
+                    self.sock = self._connect()
+                except socket.error:
+                    self.next_try = time.time() + self.retry_interval
+                    break
+            try:
+                self.sock.sendall(header)
+                self.sock.sendall(data)
+                self.sent += 1
+                return True
+            except socket.error as e:
+                # half a message may have gone out: start over on a new
+                # connection. One that worked before may only be stale (the
+                # receiver restarted), so that is retried once straight away.
+                logger.warning("capture not sent over %s: %s", self.path, e)
+                self.close()
+                if fresh:
+                    self.next_try = time.time() + self.retry_interval
+                    break
+        self.failed += 1
+        return False
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
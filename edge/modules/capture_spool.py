@@ -0,0 +1,275 @@
+#============================================================================
+#
+# Filename:  capture_spool.py
+#
+# Purpose:   On-disk queue of captures waiting to be pushed, so a capture
+#            that arrives while an earlier one is still going out is queued
+#            instead of overwriting it, and one that was not yet answered
+#            when the sender restarted is sent again.
+#
+#                spool = CaptureSpool('/home/pi/spool', order='priority')
+#                spool.put(jpg_as_text, priority=confidence)     # detector
+#
+#                entry = spool.claim()                           # sender
+#                future = client.push('str', 'vps_shot', spool.read(entry))
+#                ...
+#                spool.done(entry['id'], ok=True)    # answered: removed
+#                spool.done(entry['id'], ok=False)   # retried later
+#
+#            Each capture is a file <id>.cap next to index.json, which holds
+#            id, timestamp, priority, size and attempts for every capture,
+#            and its claim while one is sending it (see below).
+#            Both are written to a temporary file and renamed into place;
+#            the index is updated under an flock on .lock, so the detector
+#            and the sender can share the spool. If the index is lost, it is
+#            rebuilt from the .cap files (priorities are then 0).
+#
+#            claim() hands out the newest capture first (order 'newest') or
+#            the one with the highest priority, newest among equals (order
+#            'priority'). Over max_count or max_bytes, the captures that
+#            would be sent last are evicted; captures older than max_age
+#            seconds, or failed max_attempts times, are dropped.
+#
+#            A claim is kept in the capture's index entry (the spool object
+#            that claimed it, by pid, and when), so no process evicts or
+#            hands out a capture another is sending: the detector's put()
+#            sees the sender's claims. A claim lapses when its process has
+#            exited or after claim_timeout seconds, and the capture is sent
+#            again.
+#
+#----------------------------------------------------------------------------
+import errno
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no locking between processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ORDERS = ('newest', 'priority')
+
+
+def process_alive(pid):
+    if os.name == 'nt':
+        # os.kill would end it; only claim_timeout applies
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class CaptureSpool(object):
+    INDEX = 'index.json'
+    LOCK = '.lock'
+    SUFFIX = '.cap'
+    MAX_COUNT = 100
+    MAX_BYTES = 16 * 1024 * 1024
+    MAX_AGE = 24 * 3600
+    MAX_ATTEMPTS = 5
+    CLAIM_TIMEOUT = 600
+
+    def __init__(self, directory, order='newest', max_count=None, max_bytes=None,
+                 max_age=None, max_attempts=None, claim_timeout=None):
+        if order not in ORDERS:
+            raise ValueError("Unknown spool order '{0}', one of: {1}".format(order, ', '.join(ORDERS)))
+        self.directory = directory
+        self.order = order
+        self.max_count = max_count or self.MAX_COUNT
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.max_age = max_age or self.MAX_AGE
+        self.max_attempts = max_attempts or self.MAX_ATTEMPTS
+        self.claim_timeout = claim_timeout or self.CLAIM_TIMEOUT
+        self.index_path = os.path.join(directory, self.INDEX)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        # what claim() writes into the entries it hands out
+        self.owner = '%d:%x' % (os.getpid(), id(self))
+        self.added = 0
+        self.sent = 0
+        self.failed = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def _path(self, capture_id):
+        return os.path.join(self.directory, capture_id + self.SUFFIX)
+
+    def _lockFile(self):
+        f = open(os.path.join(self.directory, self.LOCK), 'a')
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    def _load(self):
+        # (index, the index file's text); the text is None if it was rebuilt
+        try:
+            with open(self.index_path) as f:
+                text = f.read()
+            return json.loads(text), text
+        except (IOError, OSError, ValueError):
+            return self._rebuild(), None
+
+    def _rebuild(self):
+        # index missing or unreadable: the captures are still there
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            st = os.stat(path)
+            entries.append({'id': name[:-len(self.SUFFIX)], 'ts': st.st_mtime, 'priority': 0,
+                            'size': st.st_size, 'attempts': 0})
+        if entries:
+            logger.warning("spool index rebuilt from %d captures in %s", len(entries), self.directory)
+        return {'next': len(entries), 'entries': entries}
+
+    def _save(self, text):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.rename(tmp, self.index_path)
+
+    def _rank(self, entry):
+        # larger is sent first
+        if self.order == 'priority':
+            return (entry['priority'], entry['ts'])
+        return (entry['ts'],)
+
+    def _held(self, entry, now):
+        # claimed, by a spool object whose process is still there
+        owner = entry.get('owner')
+        if owner is None:
+            return False
+        if owner == self.owner:
+            return True
+        if now - entry['claimed'] > self.claim_timeout:
+            return False
+        return process_alive(int(owner.split(':')[0]))
+
+    def _remove(self, index, entry):
+        index['entries'].remove(entry)
+        try:
+            os.remove(self._path(entry['id']))
+        except OSError:
+            pass
+
+    def _enforce(self, index, now):
+        # drop expired captures, then evict until within the limits
+        for entry in [e for e in index['entries'] if now - e['ts'] > self.max_age and not self._held(e, now)]:
+            self._remove(index, entry)
+            self.expired += 1
+        entries = index['entries']
+        while entries and (len(entries) > self.max_count or
+                           sum(e['size'] for e in entries) > self.max_bytes):
+            # captures being sent stay, over the limits if need be
+            victims = [e for e in entries if not self._held(e, now)]
+            if not victims:
+                break
+            self._remove(index, min(victims, key=self._rank))
+            self.evicted += 1
+
+    def _update(self, change):
+        # change(index, now) under both locks; the index is saved after it
+        # only if it changed. Every save is renamed into place, which wakes
+        # a FileWatcher on the index: a claim() that finds nothing to send
+        # must not wake the sender that made it.
+        with self.lock:
+            lock = self._lockFile()
+            try:
+                index, text = self._load()
+                result = change(index, time.time())
+                new_text = json.dumps(index, sort_keys=True)
+                if new_text != text:
+                    self._save(new_text)
+                return result
+            finally:
+                lock.close()
+
+    def put(self, data, priority=0, ts=None):
+        # Queue a capture (bytes); returns its id
+        def change(index, now):
+            capture_id = '%013d-%06d' % (int((ts or now) * 1000), index['next'] % 1000000)
+            index['next'] += 1
+            path = self._path(capture_id)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.rename(path + '.tmp', path)
+            index['entries'].append({'id': capture_id, 'ts': ts or now, 'priority': priority,
+                                     'size': len(data), 'attempts': 0})
+            self.added += 1
+            self._enforce(index, now)
+            return capture_id
+        return self._update(change)
+
+    def claim(self):
+        # The next capture to send, as an index entry, or None. It is not
+        # handed out again, nor evicted, until done() is called or the
+        # claim lapses.
+        def change(index, now):
+            self._enforce(index, now)
+            free = [e for e in index['entries'] if not self._held(e, now)]
+            if not free:
+                return None
+            entry = max(free, key=self._rank)
+            entry['owner'] = self.owner
+            entry['claimed'] = now
+            return dict(entry)
+        return self._update(change)
+
+    def read(self, entry):
+        # the capture's bytes; None if it was evicted in the meantime
+        try:
+            with open(self._path(entry['id']), 'rb') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def done(self, capture_id, ok=True):
+        # ok: the push was answered, the capture is removed. Otherwise it
+        # goes back in the queue, until it has failed max_attempts times.
+        def change(index, now):
+            for entry in index['entries']:
+                if entry['id'] == capture_id:
+                    break
+            else:
+                return
+            if ok:
+                self._remove(index, entry)
+                self.sent += 1
+                return
+            self.failed += 1
+            entry['attempts'] += 1
+            entry.pop('owner', None)
+            entry.pop('claimed', None)
+            if entry['attempts'] >= self.max_attempts:
+                logger.warning("capture %s dropped after %d attempts", capture_id, entry['attempts'])
+                self._remove(index, entry)
+        self._update(change)
+
+    def __len__(self):
+        with self.lock:
+            return len(self._load()[0]['entries'])
+
+    def asDict(self):
+        now = time.time()
+        with self.lock:
+            entries = self._load()[0]['entries']
+            return {
+                'queued': len(entries),
+                'queued_bytes': sum(e['size'] for e in entries),
+                'in_flight': sum(1 for e in entries if self._held(e, now)),
+                'added': self.added,
+                'sent': self.sent,
+                'failed': self.failed,
+                'evicted': self.evicted,
+                'expired': self.expired,
+            }
@@ -0,0 +1,170 @@
+#============================================================================
+#
+# Filename:  file_watcher.py
+#
+# Purpose:   Waits for a file to be written, for the capture the detector
+#            leaves in encoded_string.txt. On Linux it sleeps on inotify
+#            (through ctypes, no extra package) until the file is closed
+#            after writing or renamed into place, so it costs no CPU while
+#            idle and wakes as soon as a capture is complete. Elsewhere, or
+#            if inotify cannot be set up, it falls back to checking the
+#            file's mtime, size and inode every poll_interval.
+#
+#                watcher = FileWatcher('/home/pi/.../encoded_string.txt')
+#                while True:
+#                    watcher.wait()
+#                    with open(watcher.path, 'rb') as f:
+#                        data = f.read()
+#
+#            The directory is watched, not the file, so a file replaced by
+#            rename (as the detector does it, write then rename) is still
+#            seen. Changes made while the caller is busy are not lost, but
+#            several of them count as one. The first wait() returns at once
+#            if the file already exists.
+#
+#----------------------------------------------------------------------------
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event: wd, mask, cookie, len, then len bytes of name
+EVENT_HEADER = struct.Struct('iIII')
+
+_libc = None
+
+
+def load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return _libc
+
+
+def file_signature(path):
+    # what changes when the file is rewritten or replaced; None if missing
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size, st.st_ino)
+
+
+class FileWatcher(object):
+    POLL_INTERVAL = 0.5
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, path, poll_interval=None, use_inotify=True):
+        self.path = os.path.abspath(path)
+        self.directory, self.name = os.path.split(self.path)
+        self.poll_interval = poll_interval or self.POLL_INTERVAL
+        self.fd = None
+        # changes seen since the last wait() returned
+        self.changed = os.path.exists(self.path)
+        self.signature = file_signature(self.path)
+        self.wakeups = 0
+        self.events = 0
+        if use_inotify:
+            self._openInotify()
+
+    def _openInotify(self):
+        try:
+            libc = load_libc()
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+            if libc.inotify_add_watch(fd, self.directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+                err = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(err, os.strerror(err))
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            # not Linux, no libc inotify, or the directory is missing
+            logger.warning("inotify unavailable for %s (%s), polling every %.1f s",
+                           self.directory, e, self.poll_interval)
+
+    @property
+    def mode(self):
+        return 'inotify' if self.fd is not None else 'poll'
+
+    def _readEvents(self):
+        # Drain the queued events; True if one was for our file
+        found = False
+        while True:
+            try:
+                buf = os.read(self.fd, self.READ_SIZE)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return found
+                raise
+            pos = 0
+            while pos + EVENT_HEADER.size <= len(buf):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buf, pos)
+                name = buf[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip(b'\0')
+                pos += EVENT_HEADER.size + length
+                self.events += 1
+                # on overflow events were dropped; assume ours was one of them
+                if mask & IN_Q_OVERFLOW or name.decode('utf-8', 'replace') == self.name:
+                    found = True
+
+    def _poll(self):
+        signature = file_signature(self.path)
+        if signature is not None and signature != self.signature:
+            self.signature = signature
+            return True
+        self.signature = signature
+        return False
+
+    def _waitEvents(self, timeout):
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except select.error as e:
+            # interrupted by a signal (Python 2 does not retry)
+            if e.args[0] == errno.EINTR:
+                return False
+            raise
+        return bool(ready) and self._readEvents()
+
+    def wait(self, timeout=None):
+        # Block until the file has been written since the last call. Returns
+        # False if timeout seconds passed first.
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.changed:
+            left = None if deadline is None else max(0.0, deadline - time.time())
+            if self.fd is not None:
+                self.changed = self._waitEvents(left)
+            else:
+                self.changed = self._poll()
+                if not self.changed and left != 0.0:
+                    time.sleep(self.poll_interval if left is None else min(self.poll_interval, left))
+            self.wakeups += 1
+            if deadline is not None and time.time() >= deadline:
+                break
+        changed, self.changed = self.changed, False
+        return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def asDict(self):
+        return {
+            'mode': self.mode,
+            'wakeups': self.wakeups,
+            'events': self.events,
+        }
@@ -0,0 +1,196 @@
+#============================================================================
+#
+# Filename:  hdlc_asyncio.py
+#
+# Purpose:   asyncio variant of simple_hdlc for Python 3. The serial port's
+#            descriptor is watched by the event loop instead of a reader
+#            thread, so pushes, timers and file watchers can share one loop.
+#
+#                link = AsyncHDLC(serial.Serial(dev, 9600))
+#                link.start()                 # inside the running loop
+#                await link.send_frame(packet)
+#                async for frame in link:
+#                    ...
+#
+#            send_frame() waits while more than WRITE_HIGH_WATER bytes are
+#            queued for the UART, and reading pauses while MAX_QUEUED frames
+#            are waiting for the consumer. Framing, CRC and stats are the
+#            threaded HDLC's; only one of the two APIs should write to a
+#            given port.
+#
+#----------------------------------------------------------------------------
+import asyncio
+import collections
+import logging
+import os
+import time
+
+from .simple_hdlc import END_BYTE, HDLC
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHDLC(HDLC):
+    # send_frame() blocks above the high mark until the queue drains below
+    # the low one
+    WRITE_HIGH_WATER = 16 * 1024
+    WRITE_LOW_WATER = 4 * 1024
+    # Stop reading the port while this many frames are not yet consumed
+    MAX_QUEUED = 64
+
+    def __init__(self, serial, reset=True):
+        HDLC.__init__(self, serial, reset)
+        self.loop = None
+        self.fd = None
+        self.write_buffer = bytearray()
+        self.writable = None
+        self.received = collections.deque()
+        self.waiter = None
+        self.paused = False
+        self.exception = None
+
+    def start(self):
+        # Must be called with the event loop running
+        if self.fd is not None:
+            raise RuntimeError("already started")
+        fd = self._fileno()
+        if fd is None:
+            raise ValueError("AsyncHDLC needs a port with a file descriptor")
+        os.set_blocking(fd, False)
+        self.loop = asyncio.get_running_loop()
+        self.fd = fd
+        self.exception = None
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self.loop.add_reader(fd, self._onReadable)
+
+    def stop(self):
+        self._fail(EOFError("link stopped"))
+
+    def _fail(self, exc):
+        if self.fd is None:
+            return
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.fd = None
+        self.exception = exc
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+        # let blocked senders see the error
+        if self.writable is not None:
+            self.writable.set()
+
+    # --- receiving ---------------------------------------------------------
+
+    def _onReadable(self):
+        try:
+            n = os.readv(self.fd, [self.read_view])
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fail(e)
+            return
+        if n < 1:
+            # hang-up: readable with nothing to read
+            self._fail(EOFError("serial port hung up"))
+            return
+        self.stats.wire_bytes_received += n
+        self._feed(self.read_buffer, n)
+
+    def _onFrame(self, frame):
+        HDLC._onFrame(self, frame)
+        # the ring slot is reused RING_SLOTS frames later, the queue may be longer
+        self.received.append(bytes(frame.data))
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+        if len(self.received) >= self.MAX_QUEUED and not self.paused:
+            self.paused = True
+            self.loop.remove_reader(self.fd)
+
+    async def recv_frame(self):
+        while not self.received:
+            if self.exception is not None:
+                raise self.exception
+            self.waiter = self.loop.create_future()
+            await self.waiter
+        data = self.received.popleft()
+        if self.paused and len(self.received) <= self.MAX_QUEUED // 2 and self.fd is not None:
+            self.paused = False
+            self.loop.add_reader(self.fd, self._onReadable)
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.recv_frame()
+        except EOFError:
+            raise StopAsyncIteration
+
+    # --- sending -----------------------------------------------------------
+
+    async def send_frame(self, data):
+        start = time.time()
+        if self.fd is None:
+            raise self.exception or RuntimeError("link not started")
+        data = self.toBytes(data)
+        bs = self._encode(data)
+        self._write(bs)
+        await self.drain()
+        self.stats.frameSent(len(data), len(bs), time.time() - start)
+
+    async def send_frames(self, frames):
+        # Like HDLC.sendFrames: one write, flags shared between frames
+        start = time.time()
+        if self.fd is None:
+            raise self.exception or RuntimeError("link not started")
+        sizes = []
+        bodies = []
+        for data in frames:
+            data = self.toBytes(data)
+            sizes.append(len(data))
+            bodies.append(self._stuff(data))
+        if not bodies:
+            return 0
+        self._write(END_BYTE + END_BYTE.join(bodies) + END_BYTE)
+        await self.drain()
+        seconds = time.time() - start
+        for i, body in enumerate(bodies):
+            flags = 2 if i == 0 else 1
+            self.stats.frameSent(sizes[i], len(body) + flags, seconds, flags)
+        return len(bodies)
+
+    def _write(self, bs):
+        if not self.write_buffer:
+            try:
+                n = os.write(self.fd, bs)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            if n == len(bs):
+                return
+            bs = memoryview(bs)[n:]
+            self.loop.add_writer(self.fd, self._onWritable)
+        self.write_buffer += bs
+
+    def _onWritable(self):
+        try:
+            n = os.write(self.fd, self.write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fail(e)
+            return
+        del self.write_buffer[:n]
+        if not self.write_buffer:
+            self.loop.remove_writer(self.fd)
+        if len(self.write_buffer) <= self.WRITE_LOW_WATER:
+            self.writable.set()
+
+    async def drain(self):
+        # Wait until the write queue is below the high water mark
+        while len(self.write_buffer) > self.WRITE_HIGH_WATER:
+            if self.exception is not None:
+                raise self.exception
+            self.writable.clear()
+            await self.writable.wait()
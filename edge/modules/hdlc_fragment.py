@@ -0,0 +1,117 @@
+#============================================================================
+#
+# Filename:  hdlc_fragment.py
+#
+# Purpose:   Fragmentation and reassembly on top of simple_hdlc, so payloads
+#            larger than MAX_FRAME_LENGTH (a whole base64 capture) travel as a
+#            run of bounded frames. A CRC failure then costs one fragment
+#            instead of the whole push.
+#
+#            Fragment frame: marker[1] msg_id[1] index[2] count[2] chunk[]
+#
+#            Payloads that fit into one frame and do not start with the
+#            marker byte are sent unchanged, so plain ORP packets from the
+#            mangOH still come through the same reader.
+#
+#----------------------------------------------------------------------------
+import logging
+import struct
+import time
+from threading import Lock
+
+from .simple_hdlc import MAX_FRAME_LENGTH
+
+logger = logging.getLogger(__name__)
+
+
+FRAGMENT_MARKER = 0xFF
+FRAGMENT_HEADER = struct.Struct(">BBHH")
+MAX_FRAGMENTS = 0xFFFF
+
+# HDLC payload bytes per fragment frame, header included. Smaller frames
+# lose less to a CRC failure on a noisy UART, larger ones spend less on
+# headers, flags and CRCs.
+DEFAULT_FRAGMENT_SIZE = 256
+
+# Frame.addByte counts the CRC trailer against MAX_FRAME_LENGTH
+MAX_FRAGMENT_SIZE = MAX_FRAME_LENGTH - 2
+
+
+class FragmentedHDLC(object):
+    def __init__(self, hdlc, frame_size=DEFAULT_FRAGMENT_SIZE, reassembly_timeout=30.0):
+        if not FRAGMENT_HEADER.size < frame_size <= MAX_FRAGMENT_SIZE:
+            raise ValueError("frame_size must be between %d and %d" % (FRAGMENT_HEADER.size + 1, MAX_FRAGMENT_SIZE))
+        self.hdlc = hdlc
+        self.frame_size = frame_size
+        self.reassembly_timeout = reassembly_timeout
+        self.frame_callback = None
+        self.error_callback = None
+        self.next_id = 0
+        self.id_lock = Lock()
+        # msg_id -> [deadline, count, {index: chunk}]
+        self.partial = {}
+
+    def fragment(self, data):
+        data = memoryview(bytes(data))
+        if len(data) <= self.frame_size and not (len(data) and data[0] == FRAGMENT_MARKER):
+            return [data]
+        chunk = self.frame_size - FRAGMENT_HEADER.size
+        count = max(1, (len(data) + chunk - 1) // chunk)
+        if count > MAX_FRAGMENTS:
+            raise ValueError("payload too large: %d fragments" % count)
+        with self.id_lock:
+            msg_id = self.next_id
+            self.next_id = (self.next_id + 1) & 0xFF
+        return [FRAGMENT_HEADER.pack(FRAGMENT_MARKER, msg_id, index, count) + data[index * chunk:(index + 1) * chunk]
+                for index in range(count)]
+
+    def sendFrame(self, data):
+        for frame in self.fragment(data):
+            self.hdlc.sendFrame(frame)
+
+    def _deliver(self, data):
+        if self.frame_callback is not None:
+            self.frame_callback(data)
+
+    def _expire(self, now):
+        for msg_id in [k for k, v in self.partial.items() if v[0] < now]:
+            _, count, chunks = self.partial.pop(msg_id)
+            logger.warning("dropping message %d: %d of %d fragments after timeout", msg_id, len(chunks), count)
+
+    def _onFrame(self, data):
+        if len(data) < 1 or bytearray(data[:1])[0] != FRAGMENT_MARKER:
+            return self._deliver(data)
+        if len(data) < FRAGMENT_HEADER.size:
+            logger.warning("short fragment (%d bytes)", len(data))
+            return
+        _, msg_id, index, count = FRAGMENT_HEADER.unpack_from(data)
+        if index >= count:
+            logger.warning("bad fragment %d of %d for message %d", index, count, msg_id)
+            return
+
+        now = time.time()
+        self._expire(now)
+        entry = self.partial.get(msg_id)
+        if entry is None or entry[1] != count:
+            if entry is not None:
+                logger.warning("message %d restarted before it was complete", msg_id)
+            entry = self.partial[msg_id] = [0, count, {}]
+        entry[0] = now + self.reassembly_timeout
+        entry[2][index] = bytes(data[FRAGMENT_HEADER.size:])
+
+        if len(entry[2]) == count:
+            del self.partial[msg_id]
+            chunks = entry[2]
+            self._deliver(b''.join(chunks[i] for i in range(count)))
+
+    def _onError(self, data):
+        if self.error_callback is not None:
+            self.error_callback(data)
+
+    def startReader(self, onFrame, onError=None):
+        self.frame_callback = onFrame
+        self.error_callback = onError
+        self.hdlc.startReader(onFrame=self._onFrame, onError=self._onError)
+
+    def stopReader(self):
+        self.hdlc.stopReader()
@@ -0,0 +1,209 @@
+#============================================================================
+#
+# Filename:  hdlc_reliable.py
+#
+# Purpose:   Optional reliable mode for simple_hdlc: numbered frames, a
+#            sliding send window and selective ACK/NAK, so a frame that
+#            fails its CRC is retransmitted on its own instead of losing the
+#            whole push.
+#
+#            Reliable frame: marker[1] kind[1] seq[2] payload[]
+#
+#            The receiver ACKs every numbered frame it sees, buffers frames
+#            that arrive ahead of a gap and delivers them in order. Gaps and
+#            CRC failures are NAKed so the sender retransmits just those
+#            frames; anything still unacknowledged after the retransmit
+#            timeout is sent again, with backoff, until it is acknowledged.
+#            Frames without the marker are passed through untouched.
+#
+#            Both ends number their frames from 0 when they are created.
+#
+#----------------------------------------------------------------------------
+import logging
+import struct
+import time
+from threading import Condition, Thread
+
+logger = logging.getLogger(__name__)
+
+
+RELIABLE_MARKER = 0xFE
+RELIABLE_HEADER = struct.Struct(">BBH")
+
+KIND_DATA = 0x01
+KIND_ACK = 0x02
+KIND_NAK = 0x03
+
+SEQ_MOD = 0x10000
+
+
+class ReliableHDLC(object):
+    def __init__(self, hdlc, window=8, retransmit_timeout=2.0):
+        if not 0 < window < SEQ_MOD // 2:
+            raise ValueError("window must be between 1 and %d" % (SEQ_MOD // 2 - 1))
+        self.hdlc = hdlc
+        self.window = window
+        self.retransmit_timeout = retransmit_timeout
+        self.frame_callback = None
+        self.error_callback = None
+        self.running = False
+        self.timer = None
+        self.cond = Condition()
+
+        # sender: oldest unacknowledged seq, next seq, seq -> [frame, deadline, retries]
+        self.tx_base = 0
+        self.tx_next = 0
+        self.unacked = {}
+        # receiver: next in-order seq, out-of-order buffer and NAK times
+        self.rx_next = 0
+        self.rx_buffer = {}
+        self.nak_sent = {}
+
+        self.retransmits = 0
+        self.naks = 0
+
+    def _control(self, kind, seq):
+        self.hdlc.sendFrame(RELIABLE_HEADER.pack(RELIABLE_MARKER, kind, seq))
+
+    def sendFrame(self, data, timeout=None):
+        # Blocks while the send window is full; returns the frame's sequence number
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            # the window spans from the oldest unacknowledged frame, so the
+            # receiver can always tell a new frame from a duplicate
+            while (self.tx_next - self.tx_base) % SEQ_MOD >= self.window:
+                left = None if deadline is None else deadline - time.time()
+                if left is not None and left <= 0:
+                    raise RuntimeError("send window full")
+                self.cond.wait(left)
+            seq = self.tx_next
+            self.tx_next = (seq + 1) % SEQ_MOD
+            frame = RELIABLE_HEADER.pack(RELIABLE_MARKER, KIND_DATA, seq) + bytes(data)
+            self.unacked[seq] = [frame, time.time() + self.retransmit_timeout, 0]
+        self.hdlc.sendFrame(frame)
+        return seq
+
+    def flush(self, timeout=None):
+        # Wait until every frame sent so far is acknowledged
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while self.unacked:
+                left = None if deadline is None else deadline - time.time()
+                if left is not None and left <= 0:
+                    return False
+                self.cond.wait(left)
+        return True
+
+    def _resend(self, seq, now):
+        # called with self.cond held
+        entry = self.unacked.get(seq)
+        if entry is None:
+            return None
+        entry[2] += 1
+        # back off so a slow link is not flooded with copies
+        entry[1] = now + self.retransmit_timeout * min(2 ** entry[2], 16)
+        self.retransmits += 1
+        return entry[0]
+
+    def _retransmitLoop(self):
+        while self.running:
+            now = time.time()
+            with self.cond:
+                due = [seq for seq, entry in self.unacked.items() if entry[1] <= now]
+                frames = [self._resend(seq, now) for seq in due]
+                wake = min([entry[1] for entry in self.unacked.values()] or [now + self.retransmit_timeout])
+            for frame in frames:
+                self.hdlc.sendFrame(frame)
+            with self.cond:
+                if self.running:
+                    self.cond.wait(max(0.01, min(wake - time.time(), self.retransmit_timeout)))
+
+    def _nak(self, seq, now):
+        # called with self.cond held; rate limited per sequence number
+        if self.nak_sent.get(seq, 0) > now:
+            return False
+        self.nak_sent[seq] = now + self.retransmit_timeout / 2
+        self.naks += 1
+        return True
+
+    def _onData(self, seq, payload):
+        now = time.time()
+        deliver = []
+        naks = []
+        with self.cond:
+            ahead = (seq - self.rx_next) % SEQ_MOD
+            if ahead < self.window:
+                if ahead == 0:
+                    deliver.append(payload)
+                    self.rx_next = (self.rx_next + 1) % SEQ_MOD
+                    while self.rx_next in self.rx_buffer:
+                        deliver.append(self.rx_buffer.pop(self.rx_next))
+                        self.rx_next = (self.rx_next + 1) % SEQ_MOD
+                elif seq not in self.rx_buffer:
+                    self.rx_buffer[seq] = bytes(payload)
+                    for i in range(ahead):
+                        missing = (self.rx_next + i) % SEQ_MOD
+                        if missing not in self.rx_buffer and self._nak(missing, now):
+                            naks.append(missing)
+                self.nak_sent.pop(seq, None)
+            elif (self.rx_next - seq) % SEQ_MOD > self.window:
+                logger.warning("frame %d outside the receive window at %d", seq, self.rx_next)
+                return
+            # otherwise it duplicates a frame we already delivered
+
+        # ACK duplicates too, in case our earlier ACK was lost
+        self._control(KIND_ACK, seq)
+        for missing in naks:
+            self._control(KIND_NAK, missing)
+        for data in deliver:
+            if self.frame_callback is not None:
+                self.frame_callback(data)
+
+    def _onFrame(self, data):
+        if len(data) < RELIABLE_HEADER.size or bytearray(data[:1])[0] != RELIABLE_MARKER:
+            if self.frame_callback is not None:
+                self.frame_callback(data)
+            return
+        _, kind, seq = RELIABLE_HEADER.unpack_from(data)
+        if kind == KIND_DATA:
+            return self._onData(seq, data[RELIABLE_HEADER.size:])
+
+        frame = None
+        with self.cond:
+            if kind == KIND_ACK:
+                if self.unacked.pop(seq, None) is not None:
+                    while self.tx_base != self.tx_next and self.tx_base not in self.unacked:
+                        self.tx_base = (self.tx_base + 1) % SEQ_MOD
+                    self.cond.notify_all()
+            elif kind == KIND_NAK:
+                frame = self._resend(seq, time.time())
+        if frame is not None:
+            self.hdlc.sendFrame(frame)
+
+    def _onError(self, data):
+        # Whatever was lost, the oldest gap is the best guess; NAK it now
+        # rather than waiting for the sender's timeout.
+        with self.cond:
+            seq = self.rx_next
+            nak = self._nak(seq, time.time())
+        if nak:
+            self._control(KIND_NAK, seq)
+        if self.error_callback is not None:
+            self.error_callback(data)
+
+    def startReader(self, onFrame, onError=None):
+        self.frame_callback = onFrame
+        self.error_callback = onError
+        self.running = True
+        self.timer = Thread(target=self._retransmitLoop)
+        self.timer.daemon = True
+        self.timer.start()
+        self.hdlc.startReader(onFrame=self._onFrame, onError=self._onError)
+
+    def stopReader(self):
+        self.hdlc.stopReader()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.timer.join()
+        self.timer = None
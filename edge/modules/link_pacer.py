@@ -0,0 +1,194 @@
+#============================================================================
+#
+# Filename:  link_pacer.py
+#
+# Purpose:   Paces frames to the UART's baud rate and wakes the mangOH's
+#            UART only when it may have gone to sleep, instead of writing
+#            the '~~' preamble twice with a 0.1 s sleep before every packet.
+#
+#                pacer = LinkPacer(hdlc, baud=9600)
+#                client = ORPClient(pacer)
+#
+#            Frames take their size on the wire (flags, CRC and escapes
+#            included) from a byte token bucket that refills at baud / 10
+#            bytes a second (8N1) and holds burst bytes, about what the
+#            serial driver buffers. A frame waits for enough tokens, or for
+#            a full bucket if it is larger than that, so a send returns
+#            about when its bytes are on the line rather than minutes
+#            before, and a burst of requests queues in the client, where
+#            responses can still overtake it, not in the tty buffer.
+#
+#            The bucket also tells when the line last carried a byte. If
+#            neither side has sent anything for idle_wake seconds, the
+#            preamble goes out first, the way it always did.
+#
+#            Wraps HDLC or FragmentedHDLC like they wrap each other
+#            (sendFrame/startReader/stopReader). The preamble is written to
+#            port, by default the wrapped link's serial port.
+#
+#            sent_callback, if set, gets every frame sent (bytes, or the
+#            list of parts) with the times its first and last byte are on
+#            the line by the bucket's reckoning (see push_telemetry).
+#
+#----------------------------------------------------------------------------
+import logging
+import time
+from threading import Lock
+
+from .simple_hdlc import ESCAPE_BYTE, END_BYTE, iterChunks
+
+logger = logging.getLogger(__name__)
+
+
+def wire_size(data):
+    # bytes of data as one HDLC frame: two flags, the CRC (escapes in it
+    # not counted) and one extra byte per escaped byte
+    data = bytes(data)
+    return len(data) + data.count(END_BYTE) + data.count(ESCAPE_BYTE) + 4
+
+
+class LinkPacer(object):
+    # 8N1: start bit, eight data bits, stop bit
+    BITS_PER_BYTE = 10
+    BURST = 1024
+    IDLE_WAKE = 1.0
+    WAKE_DELAY = 0.1
+    PREAMBLE = b'~~'
+    # streamed (file://) frames are joined in pieces this large if the
+    # wrapped link cannot stream
+    JOIN_CHUNK = 64 * 1024
+
+    def __init__(self, link, baud, burst=None, idle_wake=None, preamble=None, port=None,
+                 bits_per_byte=None):
+        self.link = link
+        self.port = port if port is not None else getattr(link, 'serial', None)
+        self.rate = float(baud) / (bits_per_byte or self.BITS_PER_BYTE)
+        self.capacity = burst or self.BURST
+        self.idle_wake = self.IDLE_WAKE if idle_wake is None else idle_wake
+        self.preamble = self.PREAMBLE if preamble is None else preamble
+        # held by senders only, while they wait for tokens and write: the
+        # reader and asDict() never take it
+        self.lock = Lock()
+        self.tokens = float(self.capacity)
+        self.stamp = time.time()
+        # when the last byte sent leaves the line, and the last frame came in;
+        # None: never, so the first send wakes the mangOH
+        self.busy_until = None
+        self.last_received = None
+        self.frame_callback = None
+        self.error_callback = None
+        self.sent_callback = None
+        self.frames = 0
+        self.bytes = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.wakes = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def _take(self, size):
+        # called with self.lock held: wait for size tokens (a full bucket for
+        # frames larger than it) and take them, going into debt if need be.
+        # Returns when the first of the bytes goes on the line.
+        need = min(size, self.capacity)
+        start = time.time()
+        slept = False
+        while True:
+            now = time.time()
+            self._refill(now)
+            if self.tokens >= need:
+                break
+            time.sleep((need - self.tokens) / self.rate)
+            slept = True
+        if slept:
+            self.waits += 1
+            self.waited += now - start
+        self.tokens -= size
+        first = max(self.busy_until or now, now)
+        self.busy_until = first + size / self.rate
+        self.bytes += size
+        return first
+
+    def idleFor(self, now=None):
+        # seconds since the line last carried a byte either way; None if never
+        now = time.time() if now is None else now
+        last = max(t for t in (self.busy_until, self.last_received, 0.0) if t is not None)
+        return None if not last else max(0.0, now - last)
+
+    def _wake(self):
+        # called with self.lock held
+        idle = self.idleFor()
+        if self.port is None or not self.preamble or (idle is not None and idle <= self.idle_wake):
+            return
+        self.port.write(self.preamble)
+        time.sleep(self.WAKE_DELAY)
+        self.port.write(self.preamble)
+        self.wakes += 1
+        self._take(2 * len(self.preamble))
+
+    def sendFrame(self, data):
+        with self.lock:
+            self._wake()
+            first = self._take(wire_size(data))
+            self.frames += 1
+            result = self.link.sendFrame(data)
+            last = self.busy_until
+        if self.sent_callback is not None:
+            self.sent_callback(data, first, last)
+        return result
+
+    def sendFrameParts(self, parts):
+        # streamed frame: escapes in a memory mapped file are not known up
+        # front, the difference is settled once it is sent
+        estimate = 4 + sum(wire_size(part) - 4 if isinstance(part, (bytes, bytearray)) else len(part)
+                           for part in parts)
+        with self.lock:
+            self._wake()
+            first = self._take(estimate)
+            self.frames += 1
+            send_parts = getattr(self.link, 'sendFrameParts', None)
+            if send_parts is None:
+                data = b''.join(iterChunks(parts, self.JOIN_CHUNK))
+                self.link.sendFrame(data)
+                wire = wire_size(data)
+            else:
+                wire = send_parts(parts)
+            if wire:
+                self.tokens -= wire - estimate
+                self.busy_until += (wire - estimate) / self.rate
+                self.bytes += wire - estimate
+            last = self.busy_until
+        if self.sent_callback is not None:
+            self.sent_callback(parts, first, last)
+        return wire
+
+    def _onFrame(self, data):
+        self.last_received = time.time()
+        if self.frame_callback is not None:
+            self.frame_callback(data)
+
+    def _onError(self, data):
+        if self.error_callback is not None:
+            self.error_callback(data)
+
+    def startReader(self, onFrame, onError=None):
+        self.frame_callback = onFrame
+        self.error_callback = onError
+        self.link.startReader(onFrame=self._onFrame, onError=self._onError)
+
+    def stopReader(self):
+        self.link.stopReader()
+
+    def asDict(self):
+        # without the lock, which a throttled send holds for as long as it
+        # waits; the counters may be one frame apart
+        return {
+            'frames': self.frames,
+            'wire_bytes': self.bytes,
+            'waits': self.waits,
+            'waited_s': self.waited,
+            'wakes': self.wakes,
+            'rate_Bps': self.rate,
+        }
@@ -0,0 +1,171 @@
+#============================================================================
+#
+# Filename:  link_pool.py
+#
+# Purpose:   Spreads pushes over several mangOH gateways, each on its own
+#            serial port with its own HDLC link and ORPClient, so a site
+#            with more than one uploads over all their cellular links.
+#
+#                pool = LinkPool()
+#                pool.add('ttyUSB0', client0, rate=960)
+#                pool.add('ttyUSB1', client1, rate=960)
+#                future = pool.send(build_push('str', 'vps_shot', data))
+#
+#            send() takes what ORPClient.send takes and hands it to the link
+#            that should have it answered first: the one with the least
+#            backlog (bytes sent to it and not yet answered, this packet
+#            included) for its measured throughput. A link that is slow,
+#            or whose answers stop coming, gets less until it catches up.
+#            Links whose client would block (max_in_flight requests or its
+#            flow control window out) come last.
+#
+#            A link's throughput starts at rate, by default what its UART
+#            carries, and follows its answers: each one's bytes over the
+#            time the link was busy with it (from when it was sent, or the
+#            previous answer if that came later). A request that fails
+#            halves it, as a lost window does in orp_flow.
+#
+#            Each link has its own sequence numbers: send() renumbers the
+#            packet with the chosen client's stamp(). A caller that needs
+#            the number before it is sent (PushTelemetry) picks the link
+#            itself:
+#
+#                link = pool.pick(packet_size(packet))
+#                packet = link.client.stamp(packet)
+#                future = pool.send(packet, link)
+#
+#----------------------------------------------------------------------------
+import collections
+import logging
+import time
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+def packet_size(packet):
+    # bytes, or a list of parts (build_push_parts)
+    if isinstance(packet, list):
+        return sum(len(part) for part in packet)
+    return len(packet)
+
+
+class PoolLink(object):
+    # one gateway's share of the pool; its fields are guarded by the pool
+    def __init__(self, name, client, rate):
+        self.name = name
+        self.client = client
+        self.rate = float(rate)
+        self.backlog = 0
+        self.last_answer = 0.0
+        self.sent = 0
+        self.answered = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def cost(self, size):
+        # seconds until a packet of size bytes would be answered
+        return (self.backlog + size) / self.rate
+
+    def ready(self, size):
+        # read without the client's lock: a hint, send() may still block
+        client = self.client
+        return client.in_flight < client.max_in_flight and client.flow.canSend(size)
+
+    def asDict(self):
+        return {
+            'sent': self.sent,
+            'answered': self.answered,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'backlog': self.backlog,
+            'in_flight': self.client.in_flight,
+            'rate_Bps': self.rate,
+        }
+
+
+class LinkPool(object):
+    # UART bytes per second at 9600 baud, 8N1
+    RATE = 960.0
+    # weight of the newest throughput sample
+    SMOOTHING = 0.3
+    MIN_RATE = 1.0
+    # what the aggregate throughput is taken over, seconds
+    WINDOW = 60.0
+
+    def __init__(self, window=None):
+        self.window = window or self.WINDOW
+        self.lock = Lock()
+        self.links = []
+        # (time, bytes) of answers in the last window
+        self.delivered = collections.deque()
+        self.started = time.time()
+
+    def __len__(self):
+        return len(self.links)
+
+    def add(self, name, client, rate=None):
+        with self.lock:
+            self.links.append(PoolLink(name, client, rate or self.RATE))
+
+    def clients(self):
+        return [link.client for link in self.links]
+
+    def pick(self, size):
+        # The link for a packet of size bytes: the earliest answer, fewest
+        # sent on ties, among links whose client would not block on it if
+        # any. The packet is counted in its backlog from here; pass the
+        # link to send().
+        if not self.links:
+            raise ValueError("no links in the pool")
+        with self.lock:
+            link = min(self.links, key=lambda link: (not link.ready(size), link.cost(size), link.sent))
+            link.backlog += size
+            link.sent += 1
+        return link
+
+    def send(self, packet, link=None, block_timeout=None):
+        # link: from pick(), the packet already stamped by its client
+        size = packet_size(packet)
+        if link is None:
+            link = self.pick(size)
+            packet = link.client.stamp(packet)
+        start = time.time()
+        try:
+            future = link.client.send(packet, block_timeout)
+        except Exception:
+            self._done(link, size, start, False)
+            raise
+        future.add_done_callback(lambda f: self._done(link, size, start, f.exception() is None))
+        return future
+
+    def _done(self, link, size, start, ok):
+        now = time.time()
+        with self.lock:
+            link.backlog -= size
+            if ok:
+                busy = now - max(start, link.last_answer)
+                if busy > 0:
+                    sample = size / busy
+                    link.rate += self.SMOOTHING * (sample - link.rate)
+                link.last_answer = now
+                link.answered += 1
+                link.bytes += size
+                self.delivered.append((now, size))
+            else:
+                link.failed += 1
+                link.rate = max(self.MIN_RATE, link.rate / 2)
+
+    def asDict(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            while self.delivered and self.delivered[0][0] < now - self.window:
+                self.delivered.popleft()
+            recent = sum(size for t, size in self.delivered)
+            span = min(self.window, now - self.started) or 1.0
+            return {
+                'links': dict((link.name, link.asDict()) for link in self.links),
+                'bytes': sum(link.bytes for link in self.links),
+                'throughput_Bps': recent / span,
+                'capacity_Bps': sum(link.rate for link in self.links),
+            }
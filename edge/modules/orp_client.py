@@ -0,0 +1,382 @@
+#============================================================================
+#
+# Filename:  orp_client.py
+#
+# Purpose:   ORP requests with responses matched back by sequence number,
+#            so several requests can be in flight on one link instead of
+#            sleeping after each frame and hoping it arrived.
+#
+#                client = ORPClient(HDLC(serial), max_in_flight=4)
+#                client.start(onPacket=handle_unsolicited)
+#                future = client.push('str', 'vps_shot', data)
+#                ...
+#                packet = future.result(timeout=10)   # the 'p' response
+#
+#            Every request gets a concurrent.futures.Future. It resolves to
+#            the decoded response Packet when the mangOH answers with the
+#            same sequence number, or fails with ORPError on a non-OK status,
+#            an unknown-request reply, a timeout (ORPTimeout), or when the mangOH
+#            restarts (SYNC) and pending requests will never be answered.
+#            At most max_in_flight requests are outstanding, and no more
+#            request bytes than the flow control window allows (see
+#            orp_flow); further sends block until answers free a slot.
+#            Sequence numbers come from the client's own counter (request,
+#            stamp), so every link has its own.
+#
+#            The client counts the packets it sends and receives. The
+#            mangOH's SYNCs carry its own sent/received counters, running
+#            since it started. At every SYNC the client first checks for a
+#            restart: a SYNC without counters, or with counters lower than
+#            the previous one's, means the mangOH restarted, and everything
+#            in flight fails at once. Otherwise the counts since the previous
+#            SYNC are compared (see settle): packets it has not received may
+#            still be on the wire, but those still missing at the next SYNC
+#            were lost, and the window is halved. Requests in flight keep
+#            waiting for their answers.
+#
+#----------------------------------------------------------------------------
+import logging
+import struct
+import time
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+from . import orp_protocol
+from .orp_flow import CreditWindow
+from .orp_protocol import MappedFile, decode_packet
+from .simple_hdlc import iterChunks
+
+logger = logging.getLogger(__name__)
+
+
+# Requests the mangOH answers, by packet type byte
+REQUEST_TYPES = frozenset(ord(t) for t in (
+    orp_protocol.ORP_PKT_RQST_INPUT_CREATE,
+    orp_protocol.ORP_PKT_RQST_OUTPUT_CREATE,
+    orp_protocol.ORP_PKT_RQST_DELETE,
+    orp_protocol.ORP_PKT_RQST_HANDLER_ADD,
+    orp_protocol.ORP_PKT_RQST_HANDLER_REMOVE,
+    orp_protocol.ORP_PKT_RQST_PUSH,
+    orp_protocol.ORP_PKT_RQST_GET,
+    orp_protocol.ORP_PKT_RQST_EXAMPLE_SET,
+    orp_protocol.ORP_PKT_RQST_SENSOR_CREATE,
+    orp_protocol.ORP_PKT_RQST_SENSOR_REMOVE,
+))
+
+# ... and the responses it answers them with
+RESPONSE_TYPES = frozenset((
+    orp_protocol.ORP_PKT_RESP_INPUT_CREATE,
+    orp_protocol.ORP_PKT_RESP_OUTPUT_CREATE,
+    orp_protocol.ORP_PKT_RESP_DELETE,
+    orp_protocol.ORP_PKT_RESP_HANDLER_ADD,
+    orp_protocol.ORP_PKT_RESP_HANDLER_REMOVE,
+    orp_protocol.ORP_PKT_RESP_PUSH,
+    orp_protocol.ORP_PKT_RESP_GET,
+    orp_protocol.ORP_PKT_RESP_EXAMPLE_SET,
+    orp_protocol.ORP_PKT_RESP_SENSOR_CREATE,
+    orp_protocol.ORP_PKT_RESP_SENSOR_REMOVE,
+    orp_protocol.ORP_PKT_RESP_UNKNOWN_RQST,
+))
+
+SYNC_TYPES = frozenset((orp_protocol.ORP_PKT_SYNC_SYN, orp_protocol.ORP_PKT_SYNC_SYNACK))
+
+SEQUENCE = struct.Struct('>H')
+
+
+def packet_size(packet):
+    # bytes, or a list of parts (build_push_parts)
+    if isinstance(packet, list):
+        return sum(len(part) for part in packet)
+    return len(packet)
+
+
+class ORPError(Exception):
+    def __init__(self, message, packet=None):
+        Exception.__init__(self, message)
+        self.packet = packet
+
+
+class ORPTimeout(ORPError):
+    # no answer within the client's timeout
+    pass
+
+
+def settle(carried, deficit):
+    # Counters compared at a SYNC: deficit packets more were sent than the
+    # other end received since the last one. Packets on the wire then are
+    # counted at the next SYNC instead; what was missing at the previous SYNC
+    # and still is was lost. Returns (lost, carried to the next SYNC).
+    outstanding = max(0, carried + deficit)
+    lost = min(carried, outstanding)
+    return lost, outstanding - lost
+
+
+class ORPClient(object):
+    def __init__(self, link, max_in_flight=4, timeout=30.0, flow=None):
+        # link: HDLC or one of its wrappers (sendFrame/startReader/stopReader)
+        # flow: a CreditWindow, or None for the default one
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.link = link
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.flow = flow or CreditWindow()
+        self.packet_callback = None
+        self.running = False
+        self.timer = None
+        self.cond = Condition()
+        # seq -> [future, deadline, size, sent_at]
+        self.pending = {}
+        # this link's own sequence numbers, see stamp()
+        self.sequence = 0
+        self.completed = 0
+        self.failed = 0
+        # packets each way since the last SYNC, those not yet accounted for
+        # by the other end, and those lost: ours (peer_missed) and its
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.unconfirmed = 0
+        self.unreceived = 0
+        self.peer_missed = 0
+        self.missed = 0
+        # the mangOH's (sent, received) at its previous SYNC, None before
+        # the first one and after a restart
+        self.peer_counters = None
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    def _allocate(self, seq, block_timeout, size):
+        # called with self.cond held: wait for a free slot and window credit,
+        # then register seq
+        deadline = None if block_timeout is None else time.time() + block_timeout
+        while len(self.pending) >= self.max_in_flight or not self.flow.canSend(size):
+            left = None if deadline is None else deadline - time.time()
+            if left is not None and left <= 0:
+                raise ORPError("too many requests in flight")
+            self.cond.wait(left)
+        future = Future()
+        now = time.time()
+        self.pending[seq] = [future, now + self.timeout, size, now]
+        self.flow.onSent(size)
+        return future
+
+    def _nextSequence(self):
+        # called with self.cond held; skip numbers still waiting for an answer
+        while True:
+            self.sequence = (self.sequence + 1) & 0xffff
+            if self.sequence not in self.pending:
+                return self.sequence
+
+    def stamp(self, packet):
+        # The packet (bytes, or a list of parts) renumbered with this
+        # client's next sequence number, for send(). Each link then counts
+        # on its own, whatever number the builder gave the packet.
+        with self.cond:
+            seq = self._nextSequence()
+        if isinstance(packet, list):
+            return [bytes(packet[0][:2]) + SEQUENCE.pack(seq) + bytes(packet[0][4:])] + packet[1:]
+        return b''.join((bytes(packet[:2]), SEQUENCE.pack(seq), memoryview(packet)[4:]))
+
+    def send(self, packet, block_timeout=None):
+        # Send a packet built elsewhere (encode_request, orp_protocol.build_*),
+        # as bytes or as a list of parts to stream (build_push_parts); its
+        # own sequence number is used to match the response
+        header = packet[0] if isinstance(packet, list) else packet
+        ptype = bytearray(header[:1])[0]
+        if ptype not in REQUEST_TYPES:
+            # acks and raw packets get no response
+            self._write(packet)
+            future = Future()
+            future.set_result(None)
+            return future
+        seq = SEQUENCE.unpack_from(header, 2)[0]
+        with self.cond:
+            if seq in self.pending:
+                raise ORPError("sequence number %d already in flight" % seq)
+            future = self._allocate(seq, block_timeout, packet_size(packet))
+        self._sendFrame(seq, packet)
+        return future
+
+    def request(self, build, *args, **kwargs):
+        # build: one of the orp_protocol.build_* functions; the sequence
+        # number is this client's, so it cannot collide with one in flight
+        block_timeout = kwargs.pop('block_timeout', None)
+        with self.cond:
+            seq = self._nextSequence()
+        packet = build(*args, seq=seq, **kwargs)
+        with self.cond:
+            future = self._allocate(seq, block_timeout, packet_size(packet))
+        self._sendFrame(seq, packet)
+        return future
+
+    def _sendFrame(self, seq, packet):
+        try:
+            self._write(packet)
+        except Exception as e:
+            self._complete(seq, exception=e, sent=False)
+            raise
+
+    def _write(self, packet):
+        with self.cond:
+            self.frames_sent += 1
+        if isinstance(packet, list):
+            send_parts = getattr(self.link, 'sendFrameParts', None)
+            if send_parts is not None:
+                return send_parts(packet)
+            # wrappers (fragmenting, reliable) need the packet whole
+            packet = b''.join(iterChunks(packet, MappedFile.CHUNK))
+        return self.link.sendFrame(packet)
+
+    def create(self, what, data_type, path, units=None, **kwargs):
+        return self.request(orp_protocol.build_create, what, data_type, path, units, **kwargs)
+
+    def delete(self, what, path, **kwargs):
+        return self.request(orp_protocol.build_delete, what, path, **kwargs)
+
+    def add_handler(self, path, **kwargs):
+        return self.request(orp_protocol.build_add_handler, path, **kwargs)
+
+    def push(self, data_type, path, data=None, ts=None, **kwargs):
+        return self.request(orp_protocol.build_push, data_type, path, data, ts, **kwargs)
+
+    def push_file(self, data_type, path, filename, ts=None, **kwargs):
+        # the file is memory mapped and streamed, never read in whole
+        return self.request(orp_protocol.build_push_parts, data_type, path, MappedFile(filename), ts, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request(orp_protocol.build_get, path, **kwargs)
+
+    def example(self, data_type, path, data=None, **kwargs):
+        return self.request(orp_protocol.build_example, data_type, path, data, **kwargs)
+
+    def flush(self, timeout=None):
+        # Wait until nothing is in flight
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while self.pending:
+                left = None if deadline is None else deadline - time.time()
+                if left is not None and left <= 0:
+                    return False
+                self.cond.wait(left)
+        return True
+
+    def _complete(self, seq, packet=None, exception=None, sent=True):
+        # packet: the answer, error status or not; without one a request
+        # that was sent counts as lost
+        with self.cond:
+            entry = self.pending.pop(seq, None)
+            if entry is None:
+                return False
+            if exception is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if packet is not None:
+                self.flow.onAcked(entry[2], entry[3])
+            elif sent:
+                self.flow.onLost(entry[2], entry[3])
+            else:
+                self.flow.onReleased(entry[2])
+            self.cond.notify_all()
+        # resolve outside the lock, done callbacks run right here
+        if exception is not None:
+            entry[0].set_exception(exception)
+        else:
+            entry[0].set_result(packet)
+        return True
+
+    def _failAll(self, message):
+        with self.cond:
+            pending = list(self.pending)
+        for seq in pending:
+            self._complete(seq, exception=ORPError(message))
+
+    def _onSync(self, packet):
+        # Ours run from our previous SYNC, the SYNC itself not counted; the
+        # mangOH's from its start
+        try:
+            counters = int(packet.sent), int(packet.received)
+        except (TypeError, ValueError):
+            counters = None
+        with self.cond:
+            previous, self.peer_counters = self.peer_counters, counters
+            sent, received = self.frames_sent, self.frames_received - 1
+            self.frames_sent = self.frames_received = 0
+            restarted = counters is None or (previous is not None and
+                                             (counters[0] < previous[0] or counters[1] < previous[1]))
+            if restarted:
+                # what was unaccounted for went with the requests failed below
+                self.unconfirmed = self.unreceived = 0
+            elif previous is not None:
+                self._settle(sent, received, counters[0] - previous[0], counters[1] - previous[1])
+        if restarted:
+            # the mangOH restarted, what is in flight will not be answered
+            self._failAll("link resynchronised")
+
+    def _settle(self, sent, received, peer_sent, peer_received):
+        # called with self.cond held; packets each way since the previous SYNC
+        lost, self.unconfirmed = settle(self.unconfirmed, sent - peer_received)
+        missed, self.unreceived = settle(self.unreceived, peer_sent - received)
+        self.peer_missed += lost
+        self.missed += missed
+        if lost:
+            self.flow.onCongestion()
+
+    def _onFrame(self, data):
+        with self.cond:
+            self.frames_received += 1
+        try:
+            packet = decode_packet(data)
+        except ValueError as e:
+            logger.warning("undecodable packet: %s", e)
+            return
+
+        if packet.ptype in RESPONSE_TYPES:
+            # the frame's buffer is reused by the link, the future may outlive it
+            if packet.data is not None:
+                packet.data = bytes(packet.data)
+            if packet.ptype == orp_protocol.ORP_PKT_RESP_UNKNOWN_RQST:
+                error = ORPError("request %d not understood" % packet.sequence, packet)
+            elif packet.status != 'OK':
+                error = ORPError("request %d failed: %s" % (packet.sequence, packet.status), packet)
+            else:
+                error = None
+            if not self._complete(packet.sequence, packet, error):
+                logger.info("response %r for no pending request %d", packet.ptype, packet.sequence)
+        elif packet.ptype in SYNC_TYPES:
+            self._onSync(packet)
+
+        if self.packet_callback is not None:
+            self.packet_callback(packet)
+
+    def _timeoutLoop(self):
+        while self.running:
+            now = time.time()
+            with self.cond:
+                expired = [seq for seq, entry in self.pending.items() if entry[1] <= now]
+                wake = min([entry[1] for entry in self.pending.values()] or [now + self.timeout])
+            for seq in expired:
+                self._complete(seq, exception=ORPTimeout("request %d timed out" % seq))
+            with self.cond:
+                if self.running:
+                    self.cond.wait(max(0.01, min(wake - time.time(), 1.0)))
+
+    def start(self, onPacket=None):
+        # onPacket gets every decoded Packet, responses included
+        self.packet_callback = onPacket
+        self.running = True
+        self.timer = Thread(target=self._timeoutLoop)
+        self.timer.daemon = True
+        self.timer.start()
+        self.link.startReader(onFrame=self._onFrame)
+
+    def stop(self):
+        self.link.stopReader()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.timer.join()
+        self.timer = None
+        self._failAll("client stopped")
@@ -0,0 +1,243 @@
+#============================================================================
+#
+# Filename:  orp_dispatch.py
+#
+# Purpose:   Handles what the mangOH sends on its own (handler calls, sensor
+#            polls, SYNCs) without holding up the HDLC reader thread, which
+#            ORPClient calls onPacket from. A slow handler, or an ACK stuck
+#            behind a large push on the paced link, used to stop frames
+#            being read at all.
+#
+#                dispatcher = ORPDispatcher(client.send, workers=2)
+#                dispatcher.onHandlerCall('light', set_light)
+#                dispatcher.onSensorPoll('temp', read_temp)
+#                dispatcher.start()
+#                client.start(onPacket=dispatcher.dispatch)
+#
+#            dispatch() only queues: the ACK ('C' for a handler call, 'B'
+#            for a sensor poll, 'y' for a SYNC) goes to a thread of its own
+#            that does nothing but write ACKs, so one is never behind a
+#            handler. The handler registered for the packet's path (or
+#            with path None, for any other path) runs on one of workers
+#            threads and gets the Packet.
+#
+#            Calls for one path run one at a time, in order; different
+#            paths run side by side. At most max_queue calls wait. When
+#            more come, the oldest waiting one is dropped: the mangOH has
+#            its ACK already, and a newer call is worth more than a stale
+#            one.
+#
+#----------------------------------------------------------------------------
+import collections
+import logging
+import time
+from threading import Condition, Thread
+
+from . import orp_protocol
+from .orp_protocol import build_ack
+
+logger = logging.getLogger(__name__)
+
+# packet type -> the ACK it gets
+ACK_TYPES = {
+    orp_protocol.ORP_PKT_NTFY_HANDLER_CALL: 'C',
+    orp_protocol.ORP_PKT_NTFY_SENSOR_CALL: 'B',
+    orp_protocol.ORP_PKT_SYNC_SYN: 'y',
+    orp_protocol.ORP_PKT_SYNC_SYNACK: 'y',
+}
+
+ACK_STATUS = '0'
+
+
+class PathStats(object):
+    __slots__ = ('calls', 'errors', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed, ok):
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def asDict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_s': self.total / self.calls if self.calls else 0.0,
+            'max_s': self.max,
+        }
+
+
+class ORPDispatcher(object):
+    WORKERS = 2
+    MAX_QUEUE = 32
+
+    def __init__(self, send, workers=None, max_queue=None, auto_ack=True):
+        # send: writes a packet, e.g. ORPClient.send
+        self.send = send
+        self.workers = workers or self.WORKERS
+        self.max_queue = max_queue or self.MAX_QUEUE
+        self.auto_ack = auto_ack
+        self.cond = Condition()
+        self.handlers = {}
+        # [packet, handler, key, received]
+        self.queue = collections.deque()
+        # (type, path) of calls running now
+        self.busy = set()
+        # [ack type, received]
+        self.acks = collections.deque()
+        self.running = False
+        self.threads = []
+        self.acked = 0
+        self.ack_errors = 0
+        self.ack_total = 0.0
+        self.ack_max = 0.0
+        self.queued_max = 0
+        self.wait_max = 0.0
+        self.dropped = 0
+        self.unhandled = 0
+        self.paths = {}
+
+    def register(self, ptype, path, handler):
+        # handler(packet) for packets of type ptype to path; path None for
+        # any path without a handler of its own. None removes it.
+        with self.cond:
+            if handler is None:
+                self.handlers.pop((ptype, path), None)
+            else:
+                self.handlers[(ptype, path)] = handler
+
+    def onHandlerCall(self, path, handler):
+        self.register(orp_protocol.ORP_PKT_NTFY_HANDLER_CALL, path, handler)
+
+    def onSensorPoll(self, path, handler):
+        self.register(orp_protocol.ORP_PKT_NTFY_SENSOR_CALL, path, handler)
+
+    def onSync(self, handler):
+        self.register(orp_protocol.ORP_PKT_SYNC_SYN, None, handler)
+        self.register(orp_protocol.ORP_PKT_SYNC_SYNACK, None, handler)
+
+    def start(self):
+        self.running = True
+        self._spawn(self._ackLoop)
+        for i in range(self.workers):
+            self._spawn(self._workLoop)
+
+    def _spawn(self, target):
+        thread = Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def dispatch(self, packet):
+        # called from the link's reader thread: queue and return
+        now = time.time()
+        ack = ACK_TYPES.get(packet.ptype)
+        with self.cond:
+            if ack is not None and self.auto_ack:
+                self.acks.append([ack, now])
+                self.cond.notify_all()
+            key = (packet.ptype, packet.path)
+            handler = self.handlers.get(key) or self.handlers.get((packet.ptype, None))
+            if handler is None:
+                if ack is not None:
+                    self.unhandled += 1
+                return
+            # the frame's buffer is reused by the link
+            if packet.data is not None:
+                packet.data = bytes(packet.data)
+            if len(self.queue) >= self.max_queue:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append([packet, handler, key, now])
+            self.queued_max = max(self.queued_max, len(self.queue))
+            self.cond.notify_all()
+
+    def _ackLoop(self):
+        while True:
+            with self.cond:
+                while self.running and not self.acks:
+                    self.cond.wait()
+                if not self.acks:
+                    return
+                ack, received = self.acks.popleft()
+            try:
+                self.send(build_ack(ack, ACK_STATUS))
+            except Exception as e:
+                logger.warning("%s ACK not sent: %s", ack, e)
+                with self.cond:
+                    self.ack_errors += 1
+                continue
+            elapsed = time.time() - received
+            with self.cond:
+                self.acked += 1
+                self.ack_total += elapsed
+                self.ack_max = max(self.ack_max, elapsed)
+
+    def _next(self):
+        # called with self.cond held: the first call whose path is not busy
+        for i, entry in enumerate(self.queue):
+            if entry[2] not in self.busy:
+                del self.queue[i]
+                return entry
+        return None
+
+    def _workLoop(self):
+        while True:
+            with self.cond:
+                entry = None
+                while self.running:
+                    entry = self._next()
+                    if entry is not None:
+                        break
+                    self.cond.wait()
+                if entry is None:
+                    return
+                packet, handler, key, received = entry
+                self.busy.add(key)
+                self.wait_max = max(self.wait_max, time.time() - received)
+            start = time.time()
+            ok = True
+            try:
+                handler(packet)
+            except Exception:
+                ok = False
+                logger.exception("handler for %r %s failed", packet.ptype, packet.path)
+            elapsed = time.time() - start
+            with self.cond:
+                self.busy.discard(key)
+                stats = self.paths.get(packet.path)
+                if stats is None:
+                    stats = self.paths[packet.path] = PathStats()
+                stats.add(elapsed, ok)
+                self.cond.notify_all()
+
+    def stop(self):
+        # ACKs still queued are sent, calls still waiting are not run
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def asDict(self):
+        with self.cond:
+            return {
+                'acks': self.acked,
+                'ack_errors': self.ack_errors,
+                'ack_avg_s': self.ack_total / self.acked if self.acked else 0.0,
+                'ack_max_s': self.ack_max,
+                'queued': len(self.queue),
+                'queued_max': self.queued_max,
+                'wait_max_s': self.wait_max,
+                'dropped': self.dropped,
+                'unhandled': self.unhandled,
+                'paths': dict((str(path), stats.asDict()) for path, stats in self.paths.items()),
+            }
@@ -0,0 +1,109 @@
+#============================================================================
+#
+# Filename:  orp_flow.py
+#
+# Purpose:   Credit-based flow control for ORPClient. The window is the
+#            number of request bytes the mangOH may hold unanswered; a send
+#            waits until answers free enough of it, so requests go out at
+#            the rate the mangOH actually gets through them instead of after
+#            a fixed sleep.
+#
+#            The window grows while requests are answered (doubling per
+#            window's worth until the first loss, then by about one packet
+#            per window) and halves when a request is lost: it timed out, or
+#            the mangOH's SYNC counters show packets that never arrived. It
+#            is also kept under twice the bytes answered per shortest round
+#            trip, so a slow mangOH is not pushed into overrunning its buffer
+#            just to find out where the limit is. One packet is always let
+#            through, however large, so nothing starves.
+#
+#----------------------------------------------------------------------------
+import time
+
+
+class CreditWindow(object):
+    INITIAL = 2 * 1024
+    MINIMUM = 256
+    MAXIMUM = 64 * 1024
+    # weight of the newest sample in the smoothed rtt and ack rate
+    SMOOTHING = 0.25
+    # window limit, in bytes answered per shortest round trip
+    RATE_GAIN = 2.0
+
+    def __init__(self, initial=None, minimum=None, maximum=None):
+        self.minimum = minimum or self.MINIMUM
+        self.maximum = maximum or self.MAXIMUM
+        self.window = min(self.maximum, max(self.minimum, initial or self.INITIAL))
+        self.threshold = self.maximum
+        self.in_flight = 0
+        self.acked = 0
+        self.lost = 0
+        self.reductions = 0
+        # losses of packets sent before the last reduction do not halve again
+        self.reduced_at = 0.0
+        self.rtt = None
+        self.min_rtt = None
+        self.ack_rate = None
+        self.last_ack = None
+
+    def _smooth(self, old, sample):
+        return sample if old is None else old + self.SMOOTHING * (sample - old)
+
+    def canSend(self, size):
+        return self.in_flight == 0 or self.in_flight + size <= self.window
+
+    def onSent(self, size):
+        self.in_flight += size
+
+    def onAcked(self, size, sent_at, now=None):
+        now = time.time() if now is None else now
+        self.in_flight -= size
+        self.acked += size
+        self.rtt = self._smooth(self.rtt, now - sent_at)
+        self.min_rtt = now - sent_at if self.min_rtt is None else min(self.min_rtt, now - sent_at)
+        if self.last_ack is not None and now > self.last_ack:
+            self.ack_rate = self._smooth(self.ack_rate, size / (now - self.last_ack))
+        self.last_ack = now
+        if self.window < self.threshold:
+            self.window += size
+        else:
+            self.window += max(1, size * size // self.window)
+        limit = self.maximum
+        if self.ack_rate:
+            limit = min(limit, max(self.minimum, int(self.RATE_GAIN * self.ack_rate * self.min_rtt)))
+        self.window = min(self.window, limit)
+
+    def _reduce(self, now):
+        self.threshold = max(self.minimum, self.window // 2)
+        self.window = self.threshold
+        self.reductions += 1
+        self.reduced_at = now
+
+    def onLost(self, size, sent_at, now=None):
+        now = time.time() if now is None else now
+        self.in_flight -= size
+        self.lost += size
+        if sent_at >= self.reduced_at:
+            self._reduce(now)
+
+    def onCongestion(self, now=None):
+        # the mangOH is missing packets; halve at most once per round trip
+        now = time.time() if now is None else now
+        if now - self.reduced_at >= (self.rtt or 0.0):
+            self._reduce(now)
+
+    def onReleased(self, size):
+        # never sent (write failed): neither answered nor lost
+        self.in_flight -= size
+
+    def asDict(self):
+        return {
+            'window': self.window,
+            'in_flight': self.in_flight,
+            'acked_bytes': self.acked,
+            'lost_bytes': self.lost,
+            'reductions': self.reductions,
+            'rtt_s': self.rtt,
+            'min_rtt_s': self.min_rtt,
+            'ack_rate_Bps': self.ack_rate,
+        }
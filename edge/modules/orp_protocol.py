@@ -32,9 +32,18 @@
 # NOTES:
 #
 import os.path
-import sys
 import ast
+import mmap
+import re
 import shlex
+import struct
+import threading
+
+# imported both as modules.orp_protocol and, on Python 2, from modules/
+try:
+    from . import payload_codec
+except ImportError:
+    import payload_codec
 
 #
 # Packet type field - byte 0
@@ -217,6 +226,8 @@ syntax_list = [
 #
 sentCount = 0
 recvCount = 0
+# sequence numbers are handed out from several threads (reader acks, senders)
+sequenceLock = threading.Lock()
 
 #
 # Usage
@@ -272,9 +283,7 @@ def encode_sequence(count):
 # Increment local sent count and encode sequence number
 #
 def increment_encode_sequence():
-    global sentCount
-    sentCount += 1
-    return encode_sequence(sentCount)
+    return encode_sequence(next_sequence())
 
 sentCount
 #
@@ -310,50 +319,206 @@ def encode_timestamp(timestamp):
 
 
 #
-# create input|output|sensor data-type path [units]
+# Bytes-native packet builders
 #
-def encode_create(argc, args):
+# Each builder takes its fields as arguments and returns the finished packet
+# as bytes: header (type, data type or status, big-endian sequence number)
+# followed by the variable length fields. The fields are collected as a list
+# of references and joined once, so a large data field is copied exactly once
+# into the packet. str arguments are encoded as UTF-8; bytes, bytearray and
+# memoryview are used as they are. Invalid arguments raise ValueError.
+#
+# seq defaults to the next local sequence number.
+#
+ORP_HEADER = struct.Struct('>BBH')
+
+create_types = {
+    'i': ORP_PKT_RQST_INPUT_CREATE,
+    'o': ORP_PKT_RQST_OUTPUT_CREATE,
+    's': ORP_PKT_RQST_SENSOR_CREATE,
+}
+
+delete_types = {
+    'r': ORP_PKT_RQST_DELETE,
+    'h': ORP_PKT_RQST_HANDLER_REMOVE,
+    's': ORP_PKT_RQST_SENSOR_REMOVE,
+}
+
+ack_types = {
+    'y': ORP_PKT_SYNC_ACK,
+    'C': ORP_PKT_RESP_HANDLER_CALL,
+    'B': ORP_PKT_RESP_SENSOR_CALL,
+}
+
+dtype_codes = dict((name[0], code) for name, code in data_types)
+
+# Field prefixes; the path always comes first, the others follow a separator
+PATH_FIELD  = ORP_FIELD_ID_PATH.encode('ascii')
+TIME_FIELD  = (ORP_VARLENGTH_SEPARATOR + ORP_FIELD_ID_TIME).encode('ascii')
+UNITS_FIELD = (ORP_VARLENGTH_SEPARATOR + ORP_FIELD_ID_UNITS).encode('ascii')
+DATA_FIELD  = (ORP_VARLENGTH_SEPARATOR + ORP_FIELD_ID_DATA).encode('ascii')
+
+
+def next_sequence():
+    global sentCount
+    with sequenceLock:
+        sentCount = (sentCount + 1) & 0xffff
+        return sentCount
+
+
+def to_bytes(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    return str(value).encode('utf-8')
+
+
+def dtype_code(data_type):
+    code = dtype_codes.get(data_type[:1].lower())
+    if code is None:
+        raise ValueError('Invalid data type')
+    return code
+
+
+def lookup_type(types, key):
+    ptype = types.get(key)
+    if ptype is None:
+        raise ValueError('Invalid request')
+    return ptype
 
-    packet = ''
-    dtype = ''
-    syntax = syntax_list[0]
 
+def build_packet(ptype, second, parts, seq=None):
+    # parts: [None, prefix, value, prefix, value, ...]; slot 0 takes the header
+    if seq is None:
+        seq = next_sequence()
+    parts[0] = ORP_HEADER.pack(ord(ptype), ord(second), seq)
+    return b''.join(parts)
+
+
+def build_create(what, data_type, path, units=None, seq=None):
+    parts = [None, PATH_FIELD, to_bytes(path)]
+    if units is not None:
+        parts += (UNITS_FIELD, to_bytes(units))
+    return build_packet(lookup_type(create_types, what[:1].lower()), dtype_code(data_type), parts, seq)
+
+
+def build_delete(what, path, seq=None):
+    return build_packet(lookup_type(delete_types, what[:1].lower()), '.', [None, PATH_FIELD, to_bytes(path)], seq)
+
+
+def build_add_handler(path, seq=None):
+    # data type - ignored
+    return build_packet(ORP_PKT_RQST_HANDLER_ADD, '.', [None, PATH_FIELD, to_bytes(path)], seq)
+
+
+def build_push(data_type, path, data=None, ts=None, seq=None, codec=None):
+    # codec: encode binary data first, see payload_codec ('b64', 'a85', ...)
+    if codec is not None and data is not None:
+        data = payload_codec.encode(to_bytes(data), codec)
+    return b''.join(build_push_parts(data_type, path, data, ts, seq))
+
+
+def build_push_parts(data_type, path, data=None, ts=None, seq=None):
+    # The push as a list of parts instead of one bytes object. data may be a
+    # MappedFile; send the parts with HDLC.sendFrameParts to stream it.
+    # ts None or 0: the mangOH stamps the push with its current time
+    dtype = dtype_code(data_type)
+    if seq is None:
+        seq = next_sequence()
+    parts = [ORP_HEADER.pack(ord(ORP_PKT_RQST_PUSH), ord(dtype), seq),
+             PATH_FIELD, to_bytes(path)]
+    if ts and str(ts) != '0':
+        parts += (TIME_FIELD, to_bytes(ts))
+    if data is not None and len(data):
+        parts += (DATA_FIELD, data if isinstance(data, MappedFile) else to_bytes(data))
+    return parts
+
+
+#
+# Read-only memory map of a file, iterated in CHUNK sized slices. Pages
+# are dropped again once their chunk has been handed on, so streaming a file
+# keeps about one chunk resident whatever the file size. The map is closed
+# when iteration finishes; a MappedFile is streamed once.
+#
+class MappedFile(object):
+    CHUNK = 64 * 1024
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # an empty file cannot be mapped
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        try:
+            for pos in range(0, self.size, self.CHUNK):
+                # a bytes slice, not a view: a view still held by the caller
+                # would keep the map from closing
+                yield self.map[pos:pos + self.CHUNK]
+                if hasattr(self.map, 'madvise'):
+                    self.map.madvise(mmap.MADV_DONTNEED, pos, min(self.CHUNK, self.size - pos))
+        finally:
+            self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+def build_get(path, seq=None):
+    # data type ignored
+    return build_packet(ORP_PKT_RQST_GET, '.', [None, PATH_FIELD, to_bytes(path)], seq)
+
+
+def build_example(data_type, path, data=None, seq=None):
+    parts = [None, PATH_FIELD, to_bytes(path)]
+    if data is not None and len(data):
+        parts += (DATA_FIELD, to_bytes(data))
+    return build_packet(ORP_PKT_RQST_EXAMPLE_SET, dtype_code(data_type), parts, seq)
+
+
+def build_ack(what, status, seq=None):
+    # status: one character, e.g. '0', or '@' for OK in a response
+    if len(status) != 1:
+        raise ValueError('Invalid status')
+    return build_packet(lookup_type(ack_types, what[:1]), status, [None], seq)
+
+
+#
+# Text command parsers, thin wrappers around the builders above. On bad
+# input they print the problem and the syntax and return None.
+#
+def parse_error(error, syntax):
+    print(error)
+    print(syntax)
+
+
+#
+# create input|output|sensor data-type path [units]
+#
+def encode_create(argc, args):
 
     if argc < 3 :
         print('Invalid number of arguments')
         print(syntax_list[0])
         return
 
+    # units may contain spaces
     if argc > 3 :
-        what,data_type,path,units = args.split(' ')
+        what,data_type,path,units = args.split(' ', 3)
 
     else:
         what,data_type,path = args.split(' ')
         units = None
 
-    what = what.lower()
-
-    if what[0] == 'i':
-        packet = packet + ORP_PKT_RQST_INPUT_CREATE
-    elif what[0] == 'o':
-        packet = packet + ORP_PKT_RQST_OUTPUT_CREATE
-    elif what[0] == 's':
-        packet = packet + ORP_PKT_RQST_SENSOR_CREATE
-    else:
-        print('Invalid request')
-        print(syntax_list[0])
-        return
-
-    dtype = encode_dtype(data_type)
-    if dtype == '':
-        return
-    packet = packet + dtype
-    packet = packet + increment_encode_sequence()
-    packet = packet + encode_path(path)
-    if units != None:
-        packet = packet + ORP_VARLENGTH_SEPARATOR
-        packet = packet + encode_units(units)
-    return packet
+    try:
+        return build_create(what, data_type, path, units)
+    except ValueError as e:
+        parse_error(e, syntax_list[0])
 
 
 #
@@ -361,34 +526,17 @@ def encode_create(argc, args):
 #
 def encode_delete(argc, args):
 
-    packet = ''
-
-
     if argc < 2 :
         print('Invalid number of arguments')
         print(syntax_list[1])
         return
 
-    what,path = args.split(' ')
-    what = what.lower()
+    what,path = args.split(' ', 1)
 
-    # packet type
-    if what[0] == 'r':
-        packet = packet + ORP_PKT_RQST_DELETE
-    elif what[0] == 'h':
-        packet = packet + ORP_PKT_RQST_HANDLER_REMOVE
-    elif what[0] == 's':
-        packet = packet + ORP_PKT_RQST_SENSOR_REMOVE
-    else:
-        print('Invalid request')
-        print(syntax_list[1])
-        return
-
-    packet = packet + '.'
-    packet = packet + increment_encode_sequence()
-    packet = packet + encode_path(path)
-
-    return packet
+    try:
+        return build_delete(what, path)
+    except ValueError as e:
+        parse_error(e, syntax_list[1])
 
 
 #
@@ -396,29 +544,19 @@ def encode_delete(argc, args):
 #
 def encode_add(argc, args):
 
-    packet = ''
-
-
     if argc < 2 :
         print('Invalid number of arguments')
         print(syntax_list[2])
         return
 
-    what,path = args.split(' ')
-    what = what.lower()
+    what,path = args.split(' ', 1)
 
-    if what[0] != 'h':
+    if what[:1].lower() != 'h':
         print('Invalid request ' + what)
         print(syntax_list[2])
         return
 
-    packet = packet + ORP_PKT_RQST_HANDLER_ADD
-    # data type - ignored
-    packet = packet + '.'
-    packet = packet + increment_encode_sequence()
-    packet = packet + encode_path(path)
-
-    return packet
+    return build_add_handler(path)
 
 
 #
@@ -426,9 +564,6 @@ def encode_add(argc, args):
 #
 def encode_push(argc, args):
 
-    packet = ''
-    dtype = ''
-
     if argc < 3 :
         print('Invalid number of arguments')
         print(syntax_list[3])
@@ -444,45 +579,32 @@ def encode_push(argc, args):
         data_type, path, timestamp = args.split(' ')
         data = ''
 
-    packet = packet + ORP_PKT_RQST_PUSH
-
-    dtype = encode_dtype(data_type)
-    if dtype == '':
-        return
-    packet = str(packet) + str(dtype)
-
-    packet = packet + increment_encode_sequence()
-    packet = packet + encode_path(path)
-
-    if timestamp != '0':
-        packet = packet + ORP_VARLENGTH_SEPARATOR
-        packet = packet + encode_timestamp(timestamp)
-
-    if data != '':
-        # This is a bit of a hack:  If data field is actually a path to a
-        # file, read the data from the file instead.  Format must be
-        #     file://<host>/<path>
-        # @Note:  Currently only local host ==  null is supported:
-        #     file://<path>
-        if data.startswith('file://'):
-            path = data.split('file://')[1]
-            if os.path.isfile(path):
-                try:
-                    f = open(path, "r")
-                    data = f.read()
-                    print("Sending data from file: " + path)
-                except FileNotFoundError:
-                    print("File not accessible: " + path)
-                finally:
-                    f.close()
-            else:
-                print("File does not exist: " + path)
-
-        # append separator for variable length field
-        packet = packet + ORP_VARLENGTH_SEPARATOR
-        packet = packet + encode_data(data)
-
-    return packet
+    # This is a bit of a hack:  If data field is actually a path to a
+    # file, read the data from the file instead.  Format must be
+    #     file://<host>/<path>
+    # @Note:  Currently only local host ==  null is supported:
+    #     file://<path>
+    # The file is memory mapped and the push returned as a list of parts,
+    # for HDLC.sendFrameParts to stream.
+    if data.startswith('file://'):
+        fpath = data.split('file://')[1]
+        if os.path.isfile(fpath):
+            try:
+                data = MappedFile(fpath)
+                print("Sending data from file: " + fpath)
+            except (IOError, OSError, ValueError):
+                print("File not accessible: " + fpath)
+        else:
+            print("File does not exist: " + fpath)
+
+    try:
+        if isinstance(data, MappedFile):
+            return build_push_parts(data_type, path, data, timestamp)
+        return build_push(data_type, path, data, timestamp)
+    except ValueError as e:
+        if isinstance(data, MappedFile):
+            data.close()
+        parse_error(e, syntax_list[3])
 
 
 #
@@ -490,21 +612,12 @@ def encode_push(argc, args):
 #
 def encode_get(argc, args):
 
-    packet = ''
-    dtype = ''
-
     if argc < 1 :
         print('Invalid number of arguments')
         print(syntax_list[4])
         return
 
-    packet = packet + ORP_PKT_RQST_GET
-    # data type ignored
-    packet = packet + '.'
-    packet = packet + increment_encode_sequence()
-    packet = packet + encode_path(args)
-
-    return packet
+    return build_get(args)
 
 
 
@@ -513,9 +626,6 @@ def encode_get(argc, args):
 #
 def encode_example(argc, args):
 
-    packet = ''
-    dtype = ''
-
     if argc < 2 :
         print('Invalid number of arguments')
         print(syntax_list[5])
@@ -529,20 +639,10 @@ def encode_example(argc, args):
         data_type,path = args.split(' ')
         data = ''
 
-    packet = packet + ORP_PKT_RQST_EXAMPLE_SET
-
-    dtype = encode_dtype(data_type)
-    if dtype == '':
-        return
-    packet = packet + dtype
-
-    packet = packet + increment_encode_sequence()
-    packet = packet + encode_path(path)
-    if data != '':
-        packet = packet + ORP_VARLENGTH_SEPARATOR
-        packet = packet + encode_data(data)
-
-    return packet
+    try:
+        return build_example(data_type, path, data)
+    except ValueError as e:
+        parse_error(e, syntax_list[5])
 
 
 #
@@ -550,32 +650,22 @@ def encode_example(argc, args):
 #
 def encode_acknowledge(argc, args):
 
-    packet = ''
-    dtype = ''
-
     if argc < 2 :
         print('Invalid number of arguments')
         print(syntax_list[6])
         return
 
-    what,status = args.split(' ')
-
-    # packet type
-    if what[0] == 'y':
-        packet = packet + ORP_PKT_SYNC_ACK
-    elif what[0] == 'C':
-        packet = packet + ORP_PKT_RESP_HANDLER_CALL
-    elif what[0] == 'B':
-        packet = packet + ORP_PKT_RESP_SENSOR_CALL
-    else:
-        print('Invalid request')
+    if argc > 2 :
+        print('Invalid number of arguments')
         print(syntax_list[6])
         return
 
-    packet = packet + status
-    packet = packet + increment_encode_sequence()
+    what,status = args.split(' ')
 
-    return packet
+    try:
+        return build_ack(what, status)
+    except ValueError as e:
+        parse_error(e, syntax_list[6])
 
 
 #
@@ -595,32 +685,36 @@ def encode_request(request):
         return
 
     request_type,args = request.split(' ', 1)
-    request_type = request_type.lower()
+    request_type = request_type[:1].lower()
 
-    if request_type[0] == 'c':
+    if request_type == 'c':
         p = encode_create(argc, args)
 
-    elif request_type[0] == 'd':
+    elif request_type == 'd':
         p = encode_delete(argc, args)
 
-    elif request_type[0] == 'a':
+    elif request_type == 'a':
         p = encode_add(argc, args)
 
-    elif request_type[0] == 'p':
+    elif request_type == 'p':
         p = encode_push(argc, args)
 
-    elif request_type[0] == 'g':
+    elif request_type == 'g':
         p = encode_get(argc, args)
 
-    elif request_type[0] == 'e':
+    elif request_type == 'e':
         p = encode_example(argc, args)
 
-    elif request_type[0] == 'r':
+    elif request_type == 'r':
         p = encode_acknowledge(argc, args)
 
     # raw mode
-    elif request_type[0] == 's':
-        p = ast.literal_eval(shlex.quote(args))
+    elif request_type == 's':
+        try:
+            p = to_bytes(ast.literal_eval(shlex.quote(args)))
+        except (ValueError, SyntaxError) as e:
+            parse_error(e, syntax_list[7])
+            return
 
     else:
         print_usage()
@@ -630,72 +724,130 @@ def encode_request(request):
 
 
 #
-# Decode and print contents of an incoming packet
-#
-def decode_response(response):
-
-    resp = {}
+# Decoded packet. Fields the packet does not carry are None. data is a
+# memoryview into the decoded frame, so it is only valid as long as the
+# frame is (HDLC reuses its receive buffers); bytes(packet.data) keeps it.
+#
+class Packet(object):
+    __slots__ = ('ptype', 'description', 'status', 'version', 'sequence',
+                 'path', 'timestamp', 'units', 'sent', 'received', 'data')
+
+    def __init__(self, ptype, sequence):
+        self.ptype = ptype
+        self.description = None
+        self.status = None
+        self.version = None
+        self.sequence = sequence
+        self.path = None
+        self.timestamp = None
+        self.units = None
+        self.sent = None
+        self.received = None
+        self.data = None
+
+    def as_dict(self):
+        # the dict decode_response has always returned
+        resp = {}
+        if self.description is not None:
+            resp['responseType'] = self.ptype
+        if self.version is not None:
+            resp['version'] = self.version
+        else:
+            resp['status'] = self.status
+        resp['sequence'] = self.sequence
+        for name in ('path', 'timestamp', 'sent', 'received'):
+            value = getattr(self, name)
+            if value is not None:
+                resp[name] = value
+        if self.data is not None:
+            resp['data'] = bytes(self.data).decode('utf-8', 'replace')
+        return resp
+
+    def __repr__(self):
+        return 'Packet(%r, seq=%d, %s)' % (self.ptype, self.sequence, self.as_dict())
+
+
+# byte 0 -> description, byte 1 -> status, for every possible byte value
+ptype_descriptions = dict((ord(ptype), description) for ptype, description in ptypes)
+status_table = tuple(status_list[b - 64] if 0 <= b - 64 < len(status_list) else None for b in range(256))
+sync_types = (ord(ORP_PKT_SYNC_SYN), ord(ORP_PKT_SYNC_SYNACK))
+
+# variable length field id -> Packet attribute; D is always the last field
+field_names = {
+    ORP_FIELD_ID_PATH.encode('ascii'):  'path',
+    ORP_FIELD_ID_TIME.encode('ascii'):  'timestamp',
+    ORP_FIELD_ID_UNITS.encode('ascii'): 'units',
+    b'S': 'sent',
+    b'R': 'received',
+}
+ORP_FIELD_ID_DATA_BYTE = ORP_FIELD_ID_DATA.encode('ascii')
+separator_re = re.compile(re.escape(ORP_VARLENGTH_SEPARATOR.encode('ascii')))
+
+
+#
+# Decode an incoming packet (bytes, bytearray or memoryview) into a Packet,
+# without printing. Raises ValueError if it is shorter than the header.
+#
+def decode_packet(response):
+    view = memoryview(response)
+    end = len(view)
+    if end < ORP_HEADER.size:
+        raise ValueError('packet too short: %d bytes' % end)
+    ptype, second, seq = ORP_HEADER.unpack_from(view)
+
+    packet = Packet(chr(ptype), seq)
+    packet.description = ptype_descriptions.get(ptype)
+    # If this is a SYNC packet, byte 1 contains the version number.  Otherwise, it
+    # may contain status, in ASCII starting with '@' (0x40) for OK.
+    if ptype in sync_types:
+        packet.version = chr(second + 1)
+    else:
+        packet.status = status_table[second]
+
+    # Labeled, variable length fields: one pass, splitting on the separator
+    # until the data field, which runs to the end and may contain anything
+    pos = ORP_HEADER.size
+    while pos < end:
+        field_id = view[pos:pos + 1].tobytes()
+        if field_id == ORP_FIELD_ID_DATA_BYTE:
+            packet.data = view[pos + 1:]
+            break
+        match = separator_re.search(view, pos)
+        stop = match.start() if match else end
+        name = field_names.get(field_id)
+        if name is not None:
+            setattr(packet, name, view[pos + 1:stop].tobytes().decode('utf-8', 'replace'))
+        pos = stop + 1
+    return packet
 
-    if sys.version_info[0] == 2:
-        # Positional fields:
-        ptype      = response[0]
-        status_ver = ord(response[1])
-        seq_num    = int(response[2:4])
-        # Labeled, variable length fields
-        var_length = response[4:]
-        print('Received     : ' + response)
 
+#
+# Human readable rendering of a Packet, the lines decode_response prints
+#
+def format_packet(packet):
+    lines = []
+    if packet.description is not None:
+        lines.append('Message type : ' + packet.description)
+    if packet.version is not None:
+        lines.append('Version      : ' + packet.version)
     else:
-        # Positional fields:
-        ptype      = chr(response[0])
-        status_ver = response[1]
-        seq_num    = int(response[2:4])
-        # Labeled, variable length fields
-        var_length = (response[4:len(response)]).decode("utf-8")
-        print('Received     : ' + chr(response[0]) + chr(response[1]) + chr(response[2]) + chr(response[3]) + var_length)
-
-    for i in range(len(ptypes)):
-        test = ptypes[i]
-        if test[0] == ptype:
-            print('Message type : ' + test[1])
-            resp['responseType'] = test[0]
+        lines.append('Status       : ' + str(packet.status))
+    lines.append('Sequence     : ' + str(packet.sequence))
+    for label, value in (('Path         : ', packet.path),
+                         ('Timestamp    : ', packet.timestamp),
+                         ('Sent         : ', packet.sent),
+                         ('Received     : ', packet.received)):
+        if value is not None:
+            lines.append(label + value)
+    if packet.data is not None:
+        lines.append('Data         : ' + bytes(packet.data).decode('utf-8', 'replace'))
+    return '\n'.join(lines)
 
-    # If this is a SYNC packet, byte 1 contains the version number.  Otherwise, it
-    # may contain status
-    if ORP_PKT_SYNC_SYN == ptype or ORP_PKT_SYNC_SYNACK == ptype:
-        version = chr(status_ver + 1)
-        resp['version'] = version
-        print('Version      : ' + version)
-    else:
-        # Status is represented in ASCII, starting with '@' (0x40) for OK.
-        # Subtract 0x40 to index into the table, above
-        #
-        status = status_list[status_ver - 64]
-        resp['status'] = status
-        print('Status       : ' + status)
-
-    resp['sequence'] = seq_num
-    print('Sequence     : ' + str(seq_num))
-
-    if len(var_length):
-        var_fields = var_length.split(',')
-        for i in range(len(var_fields)):
-            field = var_fields[i]
-            if field[0] == 'P':
-                resp['path'] = field[1:]
-                print('Path         : ' + field[1:])
-            if field[0] == 'T':
-                resp['timestamp'] = field[1:]
-                print('Timestamp    : ' + field[1:])
-            if field[0] == 'D':
-                resp['data'] = field[1:]
-                print('Data         : ' + field[1:])
-                break
-            if field[0] == 'S':
-                resp['sent'] = field[1:]
-                print('Sent         : ' + field[1:])
-            if field[0] == 'R':
-                resp['sent'] = field[1:]
-                print('Received     : ' + field[1:])
-
-    return resp
+
+#
+# Decode and print contents of an incoming packet
+#
+def decode_response(response):
+    packet = decode_packet(response)
+    print(format_packet(packet))
+    return packet.as_dict()
@@ -0,0 +1,77 @@
+#============================================================================
+#
+# Filename:  payload_codec.py
+#
+# Purpose:   Text encodings for binary payloads (camera captures) pushed as
+#            ORP 'str' data. Every encoding but the legacy one starts with a
+#            tag naming it, so the cloud side can tell them apart:
+#
+#                b64      base64, untagged, as the detector always sent it
+#                b85:     base64's 4/3 expansion cut to 5/4 (RFC 1924 alphabet)
+#                a85:     Ascii85, also 5/4, and its alphabet has no 0x7D or
+#                         0x7E so HDLC never has to escape a byte of it
+#                zb64: zb85: za85:
+#                         the same after zlib, for payloads that compress
+#                         (JPEGs mostly do not)
+#
+#                text = payload_codec.encode(jpeg, 'a85')    # b'a85:...'
+#                jpeg = payload_codec.decode(text)
+#
+#            The base64 alphabet has no ':', so a payload without a known
+#            tag is taken as legacy base64.
+#
+#----------------------------------------------------------------------------
+import base64
+import zlib
+
+TAG_SEPARATOR = b':'
+
+# name -> (encode, decode)
+BASE_CODECS = {
+    'b64': (base64.b64encode, base64.b64decode),
+    'b85': (base64.b85encode, base64.b85decode),
+    'a85': (base64.a85encode, base64.a85decode),
+}
+
+CODECS = sorted(list(BASE_CODECS) + ['z' + name for name in BASE_CODECS])
+
+DEFAULT_CODEC = 'b64'
+ZLIB_LEVEL = 6
+
+
+def split_codec(codec):
+    # 'za85' -> ('a85', True)
+    compressed = codec.startswith('z')
+    name = codec[1:] if compressed else codec
+    if name not in BASE_CODECS:
+        raise ValueError("Unknown payload codec '{0}', one of: {1}".format(codec, ', '.join(CODECS)))
+    return name, compressed
+
+
+def tag(codec):
+    return b'' if codec == DEFAULT_CODEC else codec.encode() + TAG_SEPARATOR
+
+
+def encode(data, codec=DEFAULT_CODEC, level=ZLIB_LEVEL):
+    name, compressed = split_codec(codec)
+    if compressed:
+        data = zlib.compress(data, level)
+    return tag(codec) + BASE_CODECS[name][0](data)
+
+
+def codec_of(payload):
+    # The codec a payload was encoded with, from its tag
+    head = bytes(payload[:6])
+    end = head.find(TAG_SEPARATOR)
+    if end > 0:
+        codec = head[:end].decode('ascii', 'replace')
+        if codec in CODECS and codec != DEFAULT_CODEC:
+            return codec
+    return DEFAULT_CODEC
+
+
+def decode(payload):
+    codec = codec_of(payload)
+    name, compressed = split_codec(codec)
+    data = BASE_CODECS[name][1](bytes(payload[len(tag(codec)):]))
+    return zlib.decompress(data) if compressed else data
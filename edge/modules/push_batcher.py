@@ -0,0 +1,217 @@
+#============================================================================
+#
+# Filename:  push_batcher.py
+#
+# Purpose:   Batches sensor values into one JSON push per resource path and
+#            window, instead of one ORP packet (and preamble) per value.
+#
+#                batcher = PushBatcher(send_packet, window=60, deadband=0.5)
+#                batcher.start()
+#                batcher.add('temp', 21.4)
+#                batcher.submit('push num temp 0 21.5')    # same thing
+#                ...
+#                batcher.stop()                            # flushes
+#
+#            A value within the deadband of the last one kept for its path
+#            is dropped: numbers by absolute difference, JSON objects and
+#            arrays field by field, anything else only if equal. A batch is
+#            pushed when its window has passed since its first value, or
+#            when it reaches max_values or max_bytes (by default what fits
+#            one HDLC frame).
+#
+#            The push is a JSON array of [offset, value] pairs, offset in
+#            seconds from the first value, whose time goes in the packet's
+#            timestamp field. With timestamps=False it is just the values.
+#            The mangOH forwards it as one JSON resource, so batched paths
+#            must be created as json inputs.
+#
+#----------------------------------------------------------------------------
+import json
+import logging
+import time
+from threading import Condition, Thread
+
+from . import orp_protocol
+from .simple_hdlc import MAX_FRAME_LENGTH
+
+logger = logging.getLogger(__name__)
+
+
+def within_deadband(value, last, deadband):
+    if isinstance(value, bool) or isinstance(last, bool):
+        return value == last
+    if isinstance(value, (int, float)) and isinstance(last, (int, float)):
+        return abs(value - last) <= deadband
+    if isinstance(value, dict) and isinstance(last, dict):
+        return (value.keys() == last.keys() and
+                all(within_deadband(value[k], last[k], deadband) for k in value))
+    if isinstance(value, list) and isinstance(last, list):
+        return (len(value) == len(last) and
+                all(within_deadband(v, l, deadband) for v, l in zip(value, last)))
+    return value == last
+
+
+def push_size(path, data):
+    # bytes of an ORP push of data to path, without a timestamp
+    return (orp_protocol.ORP_HEADER.size + len(orp_protocol.PATH_FIELD) + len(path) +
+            len(orp_protocol.DATA_FIELD) + len(data))
+
+
+class Batch(object):
+    __slots__ = ('started', 'items', 'size', 'unbatched')
+
+    def __init__(self, started):
+        self.started = started
+        self.items = []
+        # bytes of the JSON array so far, brackets included
+        self.size = 2
+        # bytes the items would have taken as pushes of their own
+        self.unbatched = 0
+
+
+class PushBatcher(object):
+    # leave room for the header, path and timestamp in one frame
+    MAX_BYTES = MAX_FRAME_LENGTH - 128
+
+    def __init__(self, send, window=60.0, max_values=64, max_bytes=None,
+                 deadband=None, deadbands=None, timestamps=True):
+        # send: called with each packet, e.g. orp_transmission.send_packet
+        # deadband: for every path, None to keep every value; deadbands:
+        # path -> deadband, overriding it
+        self.send = send
+        self.window = window
+        self.max_values = max_values
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.deadband = deadband
+        self.deadbands = dict(deadbands or {})
+        self.timestamps = timestamps
+        self.cond = Condition()
+        self.batches = {}
+        self.last = {}
+        self.running = False
+        self.timer = None
+        # values in and dropped by the deadband; packets and bytes sent,
+        # against those one push per value sent would have taken
+        self.values = 0
+        self.dropped = 0
+        self.packets = 0
+        self.bytes = 0
+        self.unbatched_packets = 0
+        self.unbatched_bytes = 0
+
+    def add(self, path, value, ts=None):
+        # value: a number, or anything JSON; ts: seconds, default now
+        ts = time.time() if ts is None else ts
+        deadband = self.deadbands.get(path, self.deadband)
+        packets = []
+        with self.cond:
+            self.values += 1
+            if deadband is not None and path in self.last and within_deadband(value, self.last[path], deadband):
+                self.dropped += 1
+                return False
+            self.last[path] = value
+            text = json.dumps(value, separators=(',', ':'))
+
+            batch = self.batches.get(path)
+            if batch is not None and ts - batch.started >= self.window:
+                packets.append(self._take(path))
+                batch = None
+            if batch is None:
+                batch = self.batches[path] = Batch(ts)
+                self.cond.notify_all()
+            item = '[%s,%s]' % (round(ts - batch.started, 3), text) if self.timestamps else text
+            if batch.items and batch.size + 1 + len(item) > self.max_bytes:
+                packets.append(self._take(path))
+                batch = self.batches[path] = Batch(ts)
+                item = '[0,%s]' % text if self.timestamps else text
+            batch.items.append(item)
+            batch.size += len(item) + (len(batch.items) > 1)
+            batch.unbatched += push_size(path, text)
+            if len(batch.items) >= self.max_values or batch.size >= self.max_bytes:
+                packets.append(self._take(path))
+        # sent outside the lock, send may block on flow control
+        for packet in packets:
+            self.send(packet)
+        return True
+
+    def submit(self, request):
+        # A text request as for encode_request: numeric and JSON pushes are
+        # batched, anything else is encoded and sent now
+        parts = request.split(' ', 4)
+        if len(parts) == 5 and parts[0] == 'push' and parts[1][:1].lower() in ('n', 'j'):
+            data_type, path, ts, data = parts[1:]
+            try:
+                value = json.loads(data)
+                ts = float(ts) if ts not in ('', '0') else None
+            except ValueError as e:
+                orp_protocol.parse_error(e, orp_protocol.syntax_list[3])
+                return
+            return self.add(path, value, ts)
+        packet = orp_protocol.encode_request(request)
+        if packet is not None:
+            self.send(packet)
+
+    def _take(self, path):
+        # called with self.cond held: the batch for path as a push packet
+        batch = self.batches.pop(path)
+        data = '[' + ','.join(batch.items) + ']'
+        ts = '%.3f' % batch.started if self.timestamps else None
+        packet = orp_protocol.build_push('json', path, data, ts)
+        self.packets += 1
+        self.bytes += len(packet)
+        self.unbatched_packets += len(batch.items)
+        self.unbatched_bytes += batch.unbatched
+        return packet
+
+    def flush(self, now=None):
+        # Push the batches whose window has passed, all of them without now
+        with self.cond:
+            paths = [path for path, batch in self.batches.items()
+                     if now is None or now - batch.started >= self.window]
+            packets = [self._take(path) for path in paths]
+        for packet in packets:
+            self.send(packet)
+        return len(packets)
+
+    def _timerLoop(self):
+        while True:
+            with self.cond:
+                if not self.running:
+                    return
+                if not self.batches:
+                    self.cond.wait()
+                    continue
+                left = min(batch.started for batch in self.batches.values()) + self.window - time.time()
+                if left > 0:
+                    self.cond.wait(left)
+                    continue
+            try:
+                self.flush(time.time())
+            except Exception:
+                logger.exception("push batcher flush failed")
+
+    def start(self):
+        self.running = True
+        self.timer = Thread(target=self._timerLoop)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.timer is not None:
+            self.timer.join()
+            self.timer = None
+        self.flush()
+
+    def asDict(self):
+        with self.cond:
+            return {
+                'values': self.values,
+                'dropped': self.dropped,
+                'packets': self.packets,
+                'bytes': self.bytes,
+                'packets_saved': self.unbatched_packets - self.packets,
+                'bytes_saved': self.unbatched_bytes - self.bytes,
+            }
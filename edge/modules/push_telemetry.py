@@ -0,0 +1,277 @@
+#============================================================================
+#
+# Filename:  push_telemetry.py
+#
+# Purpose:   How long pushes take to reach the mangOH and whether they got
+#            there, for local monitoring to scrape.
+#
+#                telemetry = PushTelemetry(window=300)
+#                pacer.sent_callback = telemetry.onSent
+#                ...
+#                record = telemetry.queued(packet)       # before client.send
+#                future = client.send(packet)
+#                telemetry.track(record, future)
+#                ...
+#                telemetry.start('/run/vps/push.prom', interval=10)
+#
+#            Every push gets a record: when it was queued, when its first
+#            and last byte were on the line (from LinkPacer, by its bucket's
+#            reckoning) and when and how the mangOH answered: its 'p'
+#            status, or the client's error (timed out, link resynchronised).
+#            Other requests are not recorded. Records are kept by link and
+#            sequence number, as each link counts on its own: with several,
+#            pass the same link (e.g. its ORPClient) to queued() and onSent().
+#
+#            The records of the last window seconds, at most max_records,
+#            give percentiles of four stages: queue (queued to first byte),
+#            wire (first to last byte), answer (last byte to answer) and
+#            total. Counts of answers by result, and each stage's sum and
+#            count, are kept since start, as Prometheus counters and
+#            summaries need them.
+#
+#            start() rewrites path every interval seconds, renaming a new
+#            file into place: Prometheus text format if path ends in .prom,
+#            JSON otherwise.
+#
+#----------------------------------------------------------------------------
+import collections
+import json
+import logging
+import os
+import time
+from threading import Condition, Thread
+
+from . import orp_protocol
+from .orp_client import ORPTimeout
+from .orp_protocol import decode_packet
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('queue', 'wire', 'answer', 'total')
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(values, p):
+    # values sorted; nearest rank
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def outcome(error):
+    # 'ok', 'timeout', the mangOH's status if it answered with an error, or
+    # the exception's type
+    if error is None:
+        return 'ok'
+    if isinstance(error, ORPTimeout):
+        return 'timeout'
+    packet = getattr(error, 'packet', None)
+    if packet is not None and packet.status:
+        return packet.status
+    return type(error).__name__
+
+
+class PushRecord(object):
+    __slots__ = ('link', 'seq', 'path', 'size', 'queued', 'first', 'last', 'answered', 'result')
+
+    def __init__(self, link, seq, path, size, queued):
+        self.link = link
+        self.seq = seq
+        self.path = path
+        self.size = size
+        self.queued = queued
+        self.first = None
+        self.last = None
+        self.answered = None
+        self.result = None
+
+    def stage(self, name):
+        # seconds, None if not known (never sent, or not paced)
+        if name == 'total':
+            start, end = self.queued, self.answered
+        elif name == 'queue':
+            start, end = self.queued, self.first
+        elif name == 'wire':
+            start, end = self.first, self.last
+        else:
+            start, end = self.last, self.answered
+        if start is None or end is None:
+            return None
+        return max(0.0, end - start)
+
+
+class PushTelemetry(object):
+    WINDOW = 300.0
+    MAX_RECORDS = 1024
+    INTERVAL = 10.0
+    PREFIX = 'vps_push'
+
+    def __init__(self, window=None, max_records=None):
+        self.window = window or self.WINDOW
+        self.cond = Condition()
+        # (link, seq) -> record, queued and not yet answered
+        self.pending = {}
+        self.records = collections.deque(maxlen=max_records or self.MAX_RECORDS)
+        self.results = {}
+        self.bytes = 0
+        # stage -> [seconds, pushes] since start, pushes answered OK
+        self.totals = dict((name, [0.0, 0]) for name in STAGES)
+        self.started = time.time()
+        self.running = False
+        self.thread = None
+
+    def queued(self, packet, link=None, now=None):
+        # packet: bytes or a list of parts, as ORPClient.send takes it, with
+        # the sequence number it goes out with; link: what it goes out on.
+        # Returns the record for track(), or None if it is not a push.
+        head = b''.join(packet[:3]) if isinstance(packet, list) else packet
+        if bytearray(head[:1]) != bytearray(orp_protocol.ORP_PKT_RQST_PUSH.encode('ascii')):
+            return None
+        try:
+            decoded = decode_packet(head)
+        except ValueError:
+            return None
+        size = sum(len(part) for part in packet) if isinstance(packet, list) else len(packet)
+        record = PushRecord(link, decoded.sequence, decoded.path, size, time.time() if now is None else now)
+        with self.cond:
+            self.pending[(link, record.seq)] = record
+        return record
+
+    def onSent(self, packet, first, last, link=None):
+        # LinkPacer.sent_callback; link as given to queued()
+        head = packet[0] if isinstance(packet, list) else packet
+        if len(head) < orp_protocol.ORP_HEADER.size:
+            return
+        seq = orp_protocol.ORP_HEADER.unpack_from(head)[2]
+        with self.cond:
+            record = self.pending.get((link, seq))
+            if record is not None and record.first is None:
+                record.first = first
+                record.last = last
+
+    def track(self, record, future):
+        # future: ORPClient's, for the packet record was made from
+        if record is not None:
+            future.add_done_callback(lambda f: self.answered(record, f))
+
+    def answered(self, record, future, now=None):
+        self._finish(record, outcome(future.exception()), now)
+
+    def failed(self, record, error, now=None):
+        # client.send raised: the push never went out
+        if record is not None:
+            self._finish(record, outcome(error), now)
+
+    def _finish(self, record, result, now):
+        with self.cond:
+            key = (record.link, record.seq)
+            if self.pending.get(key) is record:
+                del self.pending[key]
+            record.answered = time.time() if now is None else now
+            record.result = result
+            self.records.append(record)
+            self.results[result] = self.results.get(result, 0) + 1
+            if result == 'ok':
+                self.bytes += record.size
+                for name in STAGES:
+                    value = record.stage(name)
+                    if value is not None:
+                        self.totals[name][0] += value
+                        self.totals[name][1] += 1
+
+    def _recent(self, now):
+        # called with self.cond held
+        return [r for r in self.records if r.answered >= now - self.window]
+
+    def asDict(self, now=None):
+        now = time.time() if now is None else now
+        with self.cond:
+            recent = self._recent(now)
+            results = dict(self.results)
+            pending = len(self.pending)
+            sent = self.bytes
+            totals = dict((name, list(total)) for name, total in self.totals.items())
+        stages = {}
+        for name in STAGES:
+            # percentiles over the window, sum and count since start
+            values = sorted(v for v in (r.stage(name) for r in recent if r.result == 'ok') if v is not None)
+            stages[name] = dict(('p%g' % (q * 100), percentile(values, q)) for q in QUANTILES)
+            stages[name]['sum'], stages[name]['count'] = totals[name]
+        return {
+            'window_s': self.window,
+            'pushes': sum(results.values()),
+            'results': results,
+            'recent': len(recent),
+            'recent_ok': sum(1 for r in recent if r.result == 'ok'),
+            'pending': pending,
+            'bytes_ok': sent,
+            'seconds': stages,
+            'uptime_s': now - self.started,
+        }
+
+    def prometheus(self, now=None):
+        stats = self.asDict(now)
+        prefix = self.PREFIX
+        lines = [
+            '# HELP %s_total Pushes answered or failed since start, by result' % prefix,
+            '# TYPE %s_total counter' % prefix,
+        ]
+        for result, count in sorted(stats['results'].items()):
+            lines.append('%s_total{result="%s"} %d' % (prefix, result, count))
+        lines += [
+            '# HELP %s_bytes_total Bytes of pushes the mangOH answered OK' % prefix,
+            '# TYPE %s_bytes_total counter' % prefix,
+            '%s_bytes_total %d' % (prefix, stats['bytes_ok']),
+            '# HELP %s_pending Pushes queued or sent and not yet answered' % prefix,
+            '# TYPE %s_pending gauge' % prefix,
+            '%s_pending %d' % (prefix, stats['pending']),
+            '# HELP %s_seconds Push latency by stage, pushes answered OK; quantiles over the last %g s'
+            % (prefix, self.window),
+            '# TYPE %s_seconds summary' % prefix,
+        ]
+        for name in STAGES:
+            stage = stats['seconds'][name]
+            for q in QUANTILES:
+                value = stage['p%g' % (q * 100)]
+                lines.append('%s_seconds{stage="%s",quantile="%g"} %s' % (
+                    prefix, name, q, 'NaN' if value is None else '%.6f' % value))
+            lines.append('%s_seconds_sum{stage="%s"} %.6f' % (prefix, name, stage['sum']))
+            lines.append('%s_seconds_count{stage="%s"} %d' % (prefix, name, stage['count']))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # whole file or nothing for whoever reads it
+        if path.endswith('.prom'):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.asDict(), sort_keys=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.rename(tmp, path)
+
+    def _writeLoop(self, path, interval):
+        while True:
+            try:
+                self.write(path)
+            except (IOError, OSError) as e:
+                logger.warning("telemetry not written to %s: %s", path, e)
+            with self.cond:
+                if self.running:
+                    self.cond.wait(interval)
+                if not self.running:
+                    return
+
+    def start(self, path, interval=None):
+        self.running = True
+        self.thread = Thread(target=self._writeLoop, args=(path, interval or self.INTERVAL))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
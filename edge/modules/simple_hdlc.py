@@ -30,12 +30,15 @@ __version__ = '0.3'
 
 import sys
 import logging
+import os
 import struct
 import time
 import six
 import binascii
-from threading import Thread
-from PyCRC.CRCCCITT import CRCCCITT
+import bisect
+import json
+import select
+from threading import Condition, Lock, Thread
 
 logger = logging.getLogger(__name__)
 
@@ -44,8 +47,46 @@ ESCAPE_CHAR = 0x7d
 END_CHAR = 0x7e
 ESCAPE_MASK = 0x20
 
+ESCAPE_BYTE = six.int2byte(ESCAPE_CHAR)
+END_BYTE = six.int2byte(END_CHAR)
+ESCAPED_ESCAPE = ESCAPE_BYTE + six.int2byte(ESCAPE_CHAR ^ ESCAPE_MASK)
+ESCAPED_END = ESCAPE_BYTE + six.int2byte(END_CHAR ^ ESCAPE_MASK)
+
 MAX_FRAME_LENGTH = 1024
 
+# CRC-16/CCITT (poly 0x1021, init 0xFFFF, no final xor), the same variant
+# PyCRC's CRCCCITT("FFFF") computes. Running the CRC over a frame *including*
+# its big-endian CRC trailer yields CRC_RESIDUE, which lets a receiver check
+# a frame without slicing the trailer off first.
+CRC_INIT = 0xFFFF
+CRC_POLY = 0x1021
+CRC_RESIDUE = 0x0000
+
+
+def _makeCRCTable():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ CRC_POLY) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _makeCRCTable()
+
+
+def crcUpdateByte(crc, b):
+    return ((crc << 8) & 0xFFFF) ^ CRC_TABLE[(crc >> 8) ^ b]
+
+
+def crcUpdate(crc, data):
+    # binascii.crc_hqx is the same table-driven CRC-CCITT, run in C
+    return binascii.crc_hqx(data, crc)
+
 
 def bin_to_hex(b):
     if sys.version_info[0] == 2:
@@ -53,33 +94,164 @@ def bin_to_hex(b):
     return b.hex()
 
 
+def iterChunks(parts, size):
+    # Yield bytes-like parts in slices of at most size bytes; parts that are
+    # not bytes-like are iterated for their own chunks (e.g. a mapped file)
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            view = memoryview(part)
+            for pos in range(0, len(view), size):
+                yield view[pos:pos + size]
+        else:
+            for chunk in part:
+                for piece in iterChunks((chunk,), size):
+                    yield piece
+
+
 def calcCRC(data):
-    crc = CRCCCITT("FFFF").calculate(six.binary_type(data))
+    crc = crcUpdate(CRC_INIT, six.binary_type(data))
     b = bytearray(struct.pack(">H", crc))
     return b
 
 
+class LatencyHistogram(object):
+    # Bucket upper bounds in seconds, the last bucket is open ended. A full
+    # 1 kB frame takes about a second at 9600 baud, a 72 kB push over a minute.
+    BOUNDS = (0.001, 0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def asDict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            # [upper bound, count]; None is the open ended last bucket
+            "buckets": [[b, n] for b, n in zip(self.BOUNDS + (None,), self.buckets)],
+        }
+
+
+class HDLCStats(object):
+    # Plain counters, updated in place by HDLC and cheap to poll. They are
+    # read without locking, so a snapshot may straddle a frame in flight.
+
+    def __init__(self):
+        self.started = time.time()
+        # payload bytes, and what went over the line after stuffing
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.wire_bytes_sent = 0
+        self.escapes_sent = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.wire_bytes_received = 0
+        self.escapes_received = 0
+        # bad frames: failed CRC, or aborted (too long, broken escape)
+        self.crc_failures = 0
+        self.aborts = 0
+        # sendFrame call to write returned, first byte to frame complete
+        self.send_latency = LatencyHistogram()
+        self.receive_latency = LatencyHistogram()
+
+    def frameSent(self, payload, wire, seconds, flags=2):
+        self.frames_sent += 1
+        self.bytes_sent += payload
+        self.wire_bytes_sent += wire
+        # flags and two CRC bytes around the payload, the rest are escapes
+        self.escapes_sent += wire - payload - 2 - flags
+        self.send_latency.add(seconds)
+
+    @staticmethod
+    def _ratio(escapes, frames, payload):
+        # escapes per stuffed byte (payload plus the 2 CRC bytes)
+        return escapes / float(payload + 2 * frames) if frames else 0.0
+
+    def asDict(self):
+        return {
+            "uptime": time.time() - self.started,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "wire_bytes_sent": self.wire_bytes_sent,
+            "escape_ratio_sent": self._ratio(self.escapes_sent, self.frames_sent, self.bytes_sent),
+            "frames_received": self.frames_received,
+            "bytes_received": self.bytes_received,
+            "wire_bytes_received": self.wire_bytes_received,
+            "escape_ratio_received": self._ratio(self.escapes_received, self.frames_received, self.bytes_received),
+            "crc_failures": self.crc_failures,
+            "aborts": self.aborts,
+            "send_latency": self.send_latency.asDict(),
+            "receive_latency": self.receive_latency.asDict(),
+        }
+
+    def toJSON(self):
+        return json.dumps(self.asDict(), sort_keys=True)
+
+
+class FrameRing(object):
+    # Preallocated frame slots handed out in turn, so receiving a frame does
+    # not allocate. A frame's memoryview stays valid until the ring wraps
+    # around to its slot again, RING_SLOTS frames later.
+
+    def __init__(self, slots, slot_size):
+        self.slot_size = slot_size
+        self.slots = slots
+        self.buffer = memoryview(bytearray(slots * slot_size))
+        self.index = 0
+
+    def next(self):
+        start = self.index * self.slot_size
+        self.index = (self.index + 1) % self.slots
+        return self.buffer[start:start + self.slot_size]
+
+
 class Frame(object):
     STATE_READ = 0x01
     STATE_ESCAPE = 0x02
 
-    def __init__(self):
+    def __init__(self, buffer=None):
         self.finished = False
         self.error_message = None
         self.error = False
+        self.crc_error = False
         self.state = self.STATE_READ
-        self.data = bytearray()
-        self.crc = bytearray()
+        self.escapes = 0
+        self.started = None
+        # Bytes are unescaped straight into buffer (a writable memoryview,
+        # normally a FrameRing slot); data and crc are views into it.
+        if buffer is None:
+            buffer = memoryview(bytearray(MAX_FRAME_LENGTH))
+        self.buffer = buffer
+        self.length = 0
+        self.crc = self.buffer[:0]
+        self.crc_value = CRC_INIT
         self.reader = None
 
     def __len__(self):
-        return len(self.data)
+        return self.length
+
+    @property
+    def data(self):
+        return self.buffer[:self.length]
 
     def reset(self):
-        self.data = bytearray()
+        self.length = 0
+        self.crc_value = CRC_INIT
         self.finished = False
         self.error = False
+        self.crc_error = False
         self.state = self.STATE_READ
+        self.escapes = 0
 
     def addByte(self, b):
         if b == END_CHAR:
@@ -88,7 +260,7 @@ class Frame(object):
                 return self.abort("invalid framing (got end in escapemode)")
             else:
                 # maybe finished
-                if len(self.data) >= 3:
+                if self.length >= 3:
                     return self.finish()
             return False
 
@@ -97,23 +269,78 @@ class Frame(object):
             b = b ^ 0x20
         elif (b == ESCAPE_CHAR):
             self.state = self.STATE_ESCAPE
+            self.escapes += 1
             return False
 
-        self.data.append(b)
+        return self._append(b)
 
-        if len(self.data) > MAX_FRAME_LENGTH:
+    def _append(self, b):
+        if self.length >= len(self.buffer):
             return self.abort("frame to big")
-
+        self.buffer[self.length] = b
+        self.length += 1
+        self.crc_value = crcUpdateByte(self.crc_value, b)
         return False
 
+    def addBytes(self, data, start=0, end=None):
+        # Bulk variant of addByte for data[start:end], which must not contain
+        # END_CHAR; HDLC splits the incoming stream on flags first. Runs
+        # between escapes are copied straight from data into the frame, and
+        # the CRC is updated once over everything written.
+        pos = start
+        if end is None:
+            end = len(data)
+        buf = self.buffer
+        cap = len(buf)
+        first = length = self.length
+        view = memoryview(data)
+        res = False
+
+        if pos < end and self.state == self.STATE_ESCAPE:
+            self.state = self.STATE_READ
+            if length >= cap:
+                return self.abort("frame to big")
+            buf[length] = six.indexbytes(data, pos) ^ ESCAPE_MASK
+            length += 1
+            pos += 1
+
+        esc = data.find(ESCAPE_BYTE, pos, end)
+        while True:
+            stop = end if esc < 0 else esc
+            if stop > pos:
+                n = stop - pos
+                if length + n > cap:
+                    res = self.abort("frame to big")
+                    break
+                buf[length:length + n] = view[pos:stop]
+                length += n
+            if esc < 0:
+                break
+            self.escapes += 1
+            if esc + 1 == end:
+                self.state = self.STATE_ESCAPE
+                break
+            if length >= cap:
+                res = self.abort("frame to big")
+                break
+            buf[length] = six.indexbytes(data, esc + 1) ^ ESCAPE_MASK
+            length += 1
+            pos = esc + 2
+            esc = data.find(ESCAPE_BYTE, pos, end)
+
+        self.crc_value = crcUpdate(self.crc_value, buf[first:length])
+        self.length = length
+        return res
+
     def finish(self):
         res = self._checkCRC()
-        self.crc = self.data[-2:]
-        self.data = self.data[:-2]
+        self.length -= 2
+        self.crc = self.buffer[self.length:self.length + 2]
         if res:
             self.error = False
             self.finished = True
             return True
+        self.crc_error = True
         return self.abort("Invalid Frame (CRC FAIL)")
 
     def abort(self, message):
@@ -123,20 +350,28 @@ class Frame(object):
         return True
 
     def _checkCRC(self):
-        data_without_crc = self.data[:-2]
-        crc = self.data[-2:]
-        res = bool(crc == calcCRC(data_without_crc))
+        # crc_value already covers the payload and the received trailer
+        res = self.crc_value == CRC_RESIDUE
         if not res:
-            c1 = six.binary_type(crc)
-            c2 = six.binary_type(calcCRC(data_without_crc))
+            c1 = self.buffer[self.length - 2:self.length].tobytes()
+            c2 = six.binary_type(calcCRC(self.buffer[:self.length - 2].tobytes()))
             logger.warning("invalid crc %s != %s <- our calculation", bin_to_hex(c1), bin_to_hex(c2))
         return res
 
     def toString(self):
-        return six.binary_type(self.data)
+        return self.data.tobytes()
 
 
 class HDLC(object):
+    # How long the reader blocks in select() before rechecking self.running
+    POLL_TIMEOUT = 0.5
+    # Received frames are assembled in a ring of this many preallocated slots
+    RING_SLOTS = 8
+    # Size of the preallocated buffer the port is read into
+    READ_CHUNK = 4096
+    # sendFrameParts encodes and writes this much payload at a time
+    STREAM_CHUNK = 64 * 1024
+
     def __init__(self, serial, reset=True):
         self.serial = serial
         self.current_frame = None
@@ -144,6 +379,15 @@ class HDLC(object):
         self.frame_callback = None
         self.error_callback = None
         self.running = False
+        # Notified each time a frame completes, good or bad
+        self.frame_cond = Condition()
+        self.frame_count = 0
+        # Keeps frames written from different threads from interleaving
+        self.write_lock = Lock()
+        self.ring = FrameRing(self.RING_SLOTS, MAX_FRAME_LENGTH)
+        self.read_buffer = bytearray(self.READ_CHUNK)
+        self.read_view = memoryview(self.read_buffer)
+        self.stats = HDLCStats()
         logger.debug("HDLC INIT: %s bytes in buffer", self.serial.in_waiting)
         if reset:
             self.serial.reset_input_buffer()
@@ -153,95 +397,246 @@ class HDLC(object):
         return bytearray(data)
 
     def sendFrame(self, data):
-        bs = self._encode(self.toBytes(data))
-        logger.info("Sending Frame: %s", bin_to_hex(bs))
-        res = self.serial.write(bs)
-        logger.info("Send %s bytes", res)
-
+        start = time.time()
+        data = self.toBytes(data)
+        bs = self._encode(data)
+        # the hex dump of a large frame is expensive, only build it for DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending Frame: %s", bin_to_hex(bs))
+        with self.write_lock:
+            res = self.serial.write(bs)
+            self.stats.frameSent(len(data), len(bs), time.time() - start)
+        logger.debug("Send %s bytes", res)
+
+    def sendFrameParts(self, parts):
+        # Send one frame whose payload is the concatenation of parts, without
+        # ever holding it in memory whole: each STREAM_CHUNK is CRCed,
+        # escaped and written in turn. Used to stream large files.
+        start = time.time()
+        crc = CRC_INIT
+        payload = 0
+        with self.write_lock:
+            self.serial.write(END_BYTE)
+            wire = 1
+            for chunk in iterChunks(parts, self.STREAM_CHUNK):
+                crc = crcUpdate(crc, chunk)
+                payload += len(chunk)
+                bs = self._escape(six.binary_type(chunk))
+                self.serial.write(bs)
+                wire += len(bs)
+            bs = self._escape(struct.pack(">H", crc)) + END_BYTE
+            self.serial.write(bs)
+            wire += len(bs)
+            self.stats.frameSent(payload, wire, time.time() - start)
+        logger.debug("Send %s bytes", wire)
+        return wire
+
+    def sendFrames(self, frames):
+        # Send several frames with one write. Back to back frames share the
+        # flag between them (...~frame~frame~...), as HDLC allows.
+        start = time.time()
+        sizes = []
+        bodies = []
+        for data in frames:
+            data = self.toBytes(data)
+            sizes.append(len(data))
+            bodies.append(self._stuff(data))
+        if not bodies:
+            return 0
+        bs = END_BYTE + END_BYTE.join(bodies) + END_BYTE
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending %d Frames: %s", len(bodies), bin_to_hex(bs))
+        with self.write_lock:
+            res = self.serial.write(bs)
+            seconds = time.time() - start
+            for i, body in enumerate(bodies):
+                # the first frame also carries the opening flag
+                flags = 2 if i == 0 else 1
+                self.stats.frameSent(sizes[i], len(body) + flags, seconds, flags)
+        logger.debug("Send %s bytes", res)
+        return len(bodies)
+
+    # Callbacks get the frame as a memoryview into the receive ring; it is
+    # only valid until RING_SLOTS more frames have arrived, so copy it
+    # (bytes(view)) to keep it longer.
     def _onFrame(self, frame):
         self.last_frame = frame
-        s = self.last_frame.toString()
-        logger.info("Received Frame: %s", bin_to_hex(s))
+        s = self.last_frame.data
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received Frame: %s", bin_to_hex(s))
         if self.frame_callback is not None:
             self.frame_callback(s)
 
     def _onError(self, frame):
         self.last_frame = frame
-        s = self.last_frame.toString()
-        logger.warning("Frame Error: %s", bin_to_hex(s))
+        s = self.last_frame.data
+        logger.warning("Frame Error: %s (%d bytes)", frame.error_message, len(s))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Bad Frame: %s", bin_to_hex(s))
         if self.error_callback is not None:
             self.error_callback(s)
 
+    def _newFrame(self):
+        frame = Frame(self.ring.next())
+        frame.started = time.time()
+        return frame
+
     def _readBytes(self, size):
-        cnt = 0
-        while cnt < size:
-            b = six.binary_type(self.serial.read(1))
-            if len(b) < 1:
+        fd = self._fileno()
+        if fd is None or not hasattr(os, "readv"):
+            data = six.binary_type(self.serial.read(size))
+            if len(data) < 1:
                 return False
-            cnt += len(b)
-            res = self._readByte(six.byte2int(b))
-            if res:
-                return True
+            self.stats.wire_bytes_received += len(data)
+            return self._feed(data)
+
+        # read straight into the preallocated buffer instead of a new bytes
+        res = False
+        while size > 0:
+            try:
+                n = os.readv(fd, [self.read_view[:min(size, self.READ_CHUNK)]])
+            except (BlockingIOError, InterruptedError):
+                break
+            if n < 1:
+                break
+            self.stats.wire_bytes_received += n
+            if self._feed(self.read_buffer, n):
+                res = True
+            size -= n
+        return res
+
+    def _feed(self, data, end=None):
+        # Hand every run between flags to the current frame in one call.
+        # A frame that aborts mid-run drops the rest of that run, so the
+        # next frame resynchronises on the following flag.
+        res = False
+        pos = 0
+        if end is None:
+            end = len(data)
+        while pos < end:
+            flag = data.find(END_BYTE, pos, end)
+            stop = end if flag < 0 else flag
+            if stop > pos:
+                if self.current_frame is None:
+                    self.current_frame = self._newFrame()
+                if self.current_frame.addBytes(data, pos, stop):
+                    self._frameDone()
+                    res = True
+            if flag < 0:
+                break
+            if self._readByte(END_CHAR):
+                res = True
+            pos = flag + 1
+        return res
 
     def _readByte(self, b):
         assert 0 <= b <= 255
 
-        if not self.current_frame:
-            self.current_frame = Frame()
+        if self.current_frame is None:
+            self.current_frame = self._newFrame()
 
         res = self.current_frame.addByte(b)
         if res:
-            if self.current_frame.error:
-                self._onError(self.current_frame)
-                self.current_frame = None
-            else:
-                self._onFrame(self.current_frame)
-                self.current_frame = None
+            self._frameDone()
         return res
 
+    def _frameDone(self):
+        frame = self.current_frame
+        self.current_frame = None
+        stats = self.stats
+        if frame.error:
+            if frame.crc_error:
+                stats.crc_failures += 1
+            else:
+                stats.aborts += 1
+            self._onError(frame)
+        else:
+            stats.frames_received += 1
+            stats.bytes_received += frame.length
+            stats.escapes_received += frame.escapes
+            stats.receive_latency.add(time.time() - frame.started)
+            self._onFrame(frame)
+        with self.frame_cond:
+            self.frame_count += 1
+            self.frame_cond.notify_all()
+
+    def _fileno(self):
+        fileno = getattr(self.serial, "fileno", None)
+        if fileno is None:
+            return None
+        try:
+            return fileno()
+        except Exception:
+            return None
+
+    def _waitReadable(self, timeout):
+        fd = self._fileno()
+        if fd is None:
+            # No descriptor to block on (e.g. Windows): fall back to polling
+            if self.serial.in_waiting:
+                return True
+            time.sleep(min(timeout, 0.001))
+            return False
+        try:
+            r, _, _ = select.select([fd], [], [], timeout)
+        except (select.error, ValueError):
+            # port closed underneath us
+            return False
+        return bool(r)
+
+    def _readAvailable(self):
+        i = self.serial.in_waiting
+        if i < 1:
+            # readable with nothing to read: hang-up or a closed pty, do not spin
+            time.sleep(0.001)
+            return False
+        return self._readBytes(i)
+
     def readFrame(self, timeout=5):
         timer = time.time() + timeout
-        while time.time() < timer:
-            i = self.serial.in_waiting
-            if i < 1:
-                time.sleep(0.0001)
-                continue
-
-            res = self._readBytes(i)
-
-            if res:
-                if self.last_frame.finished:
-                    if not self.last_frame.error:
-                        # Success
-                        s = self.last_frame.toString()
-                        return s
-                    # error
-                    raise ValueError(self.last_frame.error_message)
-                raise RuntimeError("Unexpected Framing Error")
-        raise RuntimeError("readFrame timeout")
+        if self.running:
+            # the reader thread owns the port; wait for it to finish a frame
+            with self.frame_cond:
+                count = self.frame_count
+                while self.frame_count == count:
+                    left = timer - time.time()
+                    if left <= 0:
+                        raise RuntimeError("readFrame timeout")
+                    self.frame_cond.wait(left)
+                frame = self.last_frame
+        else:
+            frame = None
+            while frame is None:
+                left = timer - time.time()
+                if left <= 0:
+                    raise RuntimeError("readFrame timeout")
+                if self._waitReadable(left) and self._readAvailable():
+                    frame = self.last_frame
+
+        if not frame.error:
+            # Success
+            return frame.toString()
+        # error
+        raise ValueError(frame.error_message)
+
+    @staticmethod
+    def _escape(bs):
+        # escape ESCAPE_CHAR first so the escapes added for END_CHAR stay put
+        return bs.replace(ESCAPE_BYTE, ESCAPED_ESCAPE).replace(END_BYTE, ESCAPED_END)
+
+    @classmethod
+    def _stuff(cls, bs):
+        # payload plus CRC, escaped, without the surrounding flags
+        return cls._escape(six.binary_type(bs) + calcCRC(bs))
 
     @classmethod
     def _encode(cls, bs):
-        data = bytearray()
-        data.append(0x7E)
-        crc = calcCRC(bs)
-        bs = bs + crc
-        for byte in bs:
-            if byte == 0x7E or byte == 0x7D:
-                data.append(0x7D)
-                data.append(byte ^ 0x20)
-            else:
-                data.append(byte)
-        data.append(0x7E)
-        return bytes(data)
+        return END_BYTE + cls._stuff(bs) + END_BYTE
 
     def _receiveLoop(self):
         while self.running:
-            i = self.serial.in_waiting
-            if i < 1:
-                time.sleep(0.001)
-                continue
-            res = self._readBytes(i)
+            if self._waitReadable(self.POLL_TIMEOUT):
+                self._readAvailable()
 
     def startReader(self, onFrame, onError=None):
         if self.running: